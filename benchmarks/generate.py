@@ -0,0 +1,131 @@
+import os
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SAMPLE_PATH = os.path.join(ROOT, 'vignettes', 'sample_survey.csv')
+KEY_PATH = os.path.join(ROOT, 'omop2survey', 'survey_key.csv')
+
+# The key file is read here rather than through the package, so the generator runs against any commit.
+try:
+    from omop2survey.key_cache import SPECIAL_CASES
+    SPECIAL_ANSWERS = {answer_id: text for answer_id, (_, text) in SPECIAL_CASES.items()}
+except ImportError:
+    # Older commits keep the special answers inside the mapping functions, so the table is copied here for them.
+    SPECIAL_ANSWERS = {
+        903087: "Don't Know", 903096: "Skip", 903072: "Does Not Apply To Me", 903079: "Prefer Not To Answer",
+        903070: "Other", 903092: "Not Sure", 903095: "None", 903103: "Unanswered", 40192432: "I am not religious",
+        40192487: "I do not believe in God (or a higher power)", 40192520: "Does not apply to my neighborhood",
+        903081: "Free Text", 596889: "Text", 596883: "Not Sure", 1332844: "Not Sure", 903598: "Prefer Not To Answer",
+        903596: "Prefer Not To Answer", 903601: "Prefer Not To Answer", 903607: "Prefer Not To Answer",
+        903610: "Prefer Not To Answer", 903604: "Prefer Not To Answer", 43529089: "No Blood Related Daughters",
+        43529086: "No Blood Related Siblings", 43529092: "No Blood Related Sons", 43529090: "No Daughters Related"
+    }
+
+# Skip, Don't Know and Prefer Not To Answer make up most special answers in real extracts.
+COMMON_SPECIAL_IDS = [903096, 903087, 903079]
+
+
+def survey_structure():
+    if not os.path.exists(KEY_PATH):
+        raise FileNotFoundError(f"File path {KEY_PATH} does not exist.")
+    key = pd.read_csv(KEY_PATH)
+    key = key.sort_values('question_concept_id', kind='stable').reset_index(drop=True)
+    questions, starts, counts = np.unique(key['question_concept_id'].to_numpy(), return_index=True,
+                                          return_counts=True)
+
+    if 'select_all' in key.columns:
+        select_all = key.groupby('question_concept_id')['select_all'].max().reindex(questions).to_numpy() == 1
+    else:
+        select_all = np.zeros(len(questions), dtype=bool)
+
+    # Question and survey labels are borrowed from the sample extract where it has them.
+    labels = pd.DataFrame({'question_concept_id': questions})
+    if os.path.exists(SAMPLE_PATH):
+        sample = pd.read_csv(SAMPLE_PATH, encoding='utf-8-sig')
+        sample = sample.drop_duplicates('question_concept_id')[['question_concept_id', 'survey', 'question']]
+        labels = labels.merge(sample, on='question_concept_id', how='left')
+    else:
+        labels['survey'] = np.nan
+        labels['question'] = np.nan
+    labels['survey'] = labels['survey'].fillna('Synthetic Survey')
+    labels['question'] = labels['question'].fillna('Question ' + labels['question_concept_id'].astype(str))
+
+    answer_labels = 'PMI: ' + key['answer_text'].astype(str).str.strip()
+    return {
+        'questions': questions, 'starts': starts, 'counts': counts, 'select_all': select_all,
+        'answer_ids': key['answer_concept_id'].to_numpy(), 'answer_labels': answer_labels.to_numpy(dtype=object),
+        'surveys': labels['survey'].to_numpy(dtype=object), 'question_labels': labels['question'].to_numpy(dtype=object)
+    }
+
+
+def generate_survey(rows, persons=None, seed=0, special_rate=0.05, free_text_rate=0.01, structure=None,
+                    first_person_id=1):
+    if structure is None:
+        structure = survey_structure()
+    rng = np.random.default_rng(seed)
+    num_questions = len(structure['questions'])
+
+    # Select-all questions get one row per chosen option, about two per question on average.
+    rows_per_question = np.where(structure['select_all'], 2, 1)
+    rows_per_person = int(rows_per_question.sum())
+    if persons is None:
+        persons = max(1, -(-rows // rows_per_person))
+
+    # Each person answers every question in a random rotation of the key's order, so there are no repeats.
+    person = np.repeat(np.arange(persons, dtype=np.int64), num_questions)
+    offset = np.repeat(rng.integers(0, num_questions, persons), num_questions)
+    question = (np.tile(np.arange(num_questions), persons) + offset) % num_questions
+    repeats = np.where(structure['select_all'][question], rng.integers(1, 4, len(question)), 1)
+    person = np.repeat(person, repeats)[:rows]
+    question = np.repeat(question, repeats)[:rows]
+    n = len(question)
+
+    answer = structure['starts'][question] + (rng.random(n) * structure['counts'][question]).astype(np.int64)
+    answer_ids = structure['answer_ids'][answer].astype(np.float64)
+    answer_labels = structure['answer_labels'][answer]
+
+    special = rng.random(n) < special_rate
+    special_ids = rng.choice(COMMON_SPECIAL_IDS + list(SPECIAL_ANSWERS), int(special.sum()))
+    answer_ids[special] = special_ids
+    answer_labels[special] = ['PMI: ' + SPECIAL_ANSWERS[int(i)] for i in special_ids]
+
+    # Free-text numeric answers have no answer_concept_id and are mapped from the digits in the answer.
+    free_text = rng.random(n) < free_text_rate
+    answer_ids[free_text] = np.nan
+    answer_labels[free_text] = rng.integers(0, 100, int(free_text.sum())).astype(str).astype(object)
+
+    return pd.DataFrame({
+        'person_id': person + first_person_id,
+        'survey': structure['surveys'][question],
+        'question_concept_id': structure['questions'][question],
+        'question': structure['question_labels'][question],
+        'answer_concept_id': answer_ids,
+        'answer': answer_labels
+    })
+
+
+def write_survey(file_path, rows, chunk_rows=5000000, seed=0, **kwargs):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing synthetic surveys requires the pyarrow package.")
+
+    structure = survey_structure()
+    writer = None
+    first_person_id = 1
+    try:
+        # Chunks cover disjoint person_id ranges, so 100M-row files never need to be held in memory at once.
+        for i, start in enumerate(range(0, rows, chunk_rows)):
+            chunk = generate_survey(min(chunk_rows, rows - start), seed=seed + i, structure=structure,
+                                    first_person_id=first_person_id, **kwargs)
+            first_person_id = int(chunk['person_id'].max()) + 1
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(file_path, table.schema, compression='zstd')
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return file_path
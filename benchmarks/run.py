@@ -0,0 +1,162 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import omop2survey
+from omop2survey import pivot_data
+from benchmarks.generate import generate_survey, write_survey
+
+
+def wide_table(mapped):
+    # pivot_wide() is only public in newer versions; older commits build the same table with pivot_table().
+    if hasattr(pivot_data, 'pivot_wide'):
+        wide = pivot_data.pivot_wide(mapped, 'answer_numeric')
+    else:
+        wide = mapped.pivot_table(index='person_id', columns='question_concept_id', values='answer_numeric',
+                                  aggfunc='first')
+        wide.columns = ['q' + str(col) for col in wide.columns]
+    # person_id is kept as a column, as in a pivot file read back with read_csv(), which every version of scale() takes.
+    return wide.reset_index()
+
+
+def prepare(data):
+    with contextlib.redirect_stdout(io.StringIO()):
+        mapped = omop2survey.map_answers(data.copy())
+        wide = wide_table(mapped)
+    return {'raw': data, 'mapped': mapped, 'wide': wide}
+
+
+def pivot_in_tempdir(mapped):
+    # pivot_local writes into ./workspace, so it runs in a scratch directory that is removed afterwards.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            omop2survey.pivot_local(mapped)
+        finally:
+            os.chdir(cwd)
+
+
+# Each benchmark is a (setup, run) pair; setup builds the input outside the timed and profiled region.
+BENCHMARKS = {
+    'map_answers': (lambda d: d['raw'].copy(), omop2survey.map_answers),
+    'process_answers': (lambda d: d['raw'], omop2survey.process_answers),
+    'recode_missing': (lambda d: d['mapped'], omop2survey.recode_missing),
+    'create_dummies': (lambda d: d['mapped'], omop2survey.create_dummies),
+    'pivot_local': (lambda d: d['mapped'], pivot_in_tempdir),
+    'scale': (lambda d: d['wide'], lambda wide: omop2survey.scale(wide, list(wide.columns[1:6]), 'benchmark_scale')),
+    'create_codebook': (lambda d: d['mapped'], omop2survey.create_codebook)
+}
+
+
+def measure(run, data, profile=False):
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not profile:
+            start = time.perf_counter()
+            run(data)
+            return time.perf_counter() - start
+
+        # tracemalloc slows down code that allocates Python objects, so peak memory is taken in a separate run.
+        tracemalloc.start()
+        try:
+            run(data)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.realpath(__file__)))
+    except OSError:
+        return None
+    return output.stdout.strip() if output.returncode == 0 else None
+
+
+def run_benchmarks(rows, functions=None, repeat=3, seed=0, input_path=None):
+    if functions is None:
+        functions = list(BENCHMARKS)
+    unknown = [name for name in functions if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {unknown}. Choose from {list(BENCHMARKS)}.")
+
+    if input_path is not None:
+        data = pd.read_parquet(input_path)
+    else:
+        data = generate_survey(rows, seed=seed)
+    prepared = prepare(data)
+
+    results = []
+    for name in functions:
+        setup, run = BENCHMARKS[name]
+        timings = [measure(run, setup(prepared)) for _ in range(repeat)]
+        peak = measure(run, setup(prepared), profile=True)
+        results.append({'function': name, 'rows': len(data), 'seconds': timings, 'best_seconds': min(timings),
+                        'peak_bytes': peak, 'rows_per_second': len(data) / max(min(timings), 1e-9)})
+        print(f"{name}: best {min(timings):.3f}s of {repeat}, peak {peak / 1e6:,.1f} MB")
+
+    return {
+        'commit': git_commit(), 'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+        'rows': len(data), 'seed': seed, 'repeat': repeat, 'results': results
+    }
+
+
+def compare(baseline, current):
+    before = {result['function']: result for result in baseline['results']}
+    for result in current['results']:
+        old = before.get(result['function'])
+        if old is None:
+            continue
+        print(f"{result['function']}: {old['best_seconds']:.3f}s -> {result['best_seconds']:.3f}s "
+              f"({old['best_seconds'] / max(result['best_seconds'], 1e-9):.2f}x), "
+              f"peak {old['peak_bytes'] / 1e6:,.1f} MB -> {result['peak_bytes'] / 1e6:,.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile omop2survey on synthetic survey data.")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--functions', help="Comma-separated benchmark names; defaults to all.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--input', help="Benchmark an existing ds_survey-shaped Parquet file instead.")
+    parser.add_argument('--generate', help="Only write a synthetic survey of --rows rows to this Parquet file.")
+    parser.add_argument('--output', help="JSON file for the results; defaults to benchmarks/results/.")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against.")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        write_survey(args.generate, args.rows, seed=args.seed)
+        print(f"Synthetic survey with {args.rows} rows saved to: {args.generate}")
+        return
+
+    functions = args.functions.split(',') if args.functions else None
+    report = run_benchmarks(args.rows, functions, args.repeat, args.seed, args.input)
+
+    output = args.output
+    if output is None:
+        directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'results')
+        os.makedirs(directory, exist_ok=True)
+        output = os.path.join(directory, f"{report['commit'] or 'local'}_{report['rows']}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
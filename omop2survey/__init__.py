@@ -1,6 +1,21 @@
 from omop2survey.response_set import (map_answers_chunk, process_answers, map_items, map_responses, create_dummies,
-                                      create_dummy_variables, create_dummies_R, map_questions, scale, map_answers)
-from omop2survey.codebooks import create_codebook, generate_codebook, print_codebook, codebook, codebook_html
-from omop2survey.pivot_data import pivot, pivot_text, pivot_text_local, pivot_local
+                                      create_dummy_variables, create_dummies_R, map_questions, scale, map_answers,
+                                      score_scales)
+from omop2survey.codebooks import (create_codebook, generate_codebook, print_codebook, codebook, codebook_html,
+                                   CodebookAccumulator, merge_codebooks, create_codebook_file)
+from omop2survey.pivot_data import (pivot, pivot_text, pivot_text_local, pivot_local, pivot_sparse, write_sparse,
+                                    read_sparse, pivot_wide)
 from omop2survey.recode_missing import recode, recode_items, recode_missing
 from omop2survey.subset import show_survey_options, get_survey_map, import_survey_data
+from omop2survey.backends import BigQueryBackend, LocalBackend
+from omop2survey.stream import map_file, pivot_file
+from omop2survey.incremental import update_survey, load_survey_state
+from omop2survey.extract_cache import ExtractCache
+from omop2survey.artifact_cache import ArtifactCache
+from omop2survey.hash_csv import fingerprint
+from omop2survey.upload import GCSUploader, LocalUploader
+from omop2survey.compact import compact
+from omop2survey.instrument import configure_instrumentation, stage_history
+from omop2survey.pipeline import SurveyPipeline
+from omop2survey.batch import import_surveys
+from omop2survey.table_io import read_table
@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from omop2survey.key_cache import SPECIAL_QUESTION
+from omop2survey.table_io import require_pyarrow
+
+ENGINES = ('pandas', 'arrow')
+OUTPUTS = ('pandas', 'arrow')
+
+# Question and answer concept ids are packed into one int64 lookup code; ids outside [0, ID_LIMIT) are never in the key.
+ID_LIMIT = 2 ** 31
+MIN_SLICE_ROWS = 250000
+
+
+def check_engine(engine, output='pandas', compact=False):
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine. Please use 'pandas' or 'arrow'.")
+    if output not in OUTPUTS:
+        raise ValueError("Unsupported output. Please use 'pandas' or 'arrow'.")
+    if compact and output == 'arrow':
+        raise ValueError("compact=True only applies to pandas output.")
+    if engine == 'arrow' or output == 'arrow':
+        require_pyarrow()
+
+
+def is_table(data):
+    return hasattr(data, 'schema') and hasattr(data, 'num_rows')
+
+
+def arrow_workers(workers=None):
+    import pyarrow as pa
+    return pa.cpu_count() if workers is None else workers
+
+
+def run_threads(function, items, workers=None):
+    # Arrow compute kernels release the GIL, so plain threads run them in parallel.
+    items = list(items)
+    workers = arrow_workers(workers)
+    if workers == 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(function, items))
+
+
+def row_slices(length, workers=None):
+    size = max(MIN_SLICE_ROWS, -(-length // arrow_workers(workers)))
+    return [(start, min(size, length - start)) for start in range(0, length, size)] or [(0, 0)]
+
+
+def column(data, name):
+    import pyarrow as pa
+
+    if is_table(data):
+        return data.column(name)
+    return pa.chunked_array([pa.array(data[name], from_pandas=True)])
+
+
+def to_table(data):
+    import pyarrow as pa
+
+    if is_table(data):
+        return data
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+
+def with_columns(table, columns):
+    for name, array in columns.items():
+        if name in table.column_names:
+            table = table.set_column(table.column_names.index(name), name, array)
+        else:
+            table = table.append_column(name, array)
+    return table
+
+
+def object_values(array, na_value):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    # Same values as the pandas engine: Python objects, with na_value wherever the array is null.
+    missing = np.asarray(pc.is_null(array))
+    if pa.types.is_integer(array.type):
+        values = np.asarray(pc.fill_null(array, 0)).astype(object)
+    else:
+        values = array.to_numpy(zero_copy_only=False).astype(object)
+    values[missing] = na_value
+    return values
+
+
+def lookup_arrays(key):
+    import pyarrow as pa
+
+    # The Arrow form of the key is built once per SurveyKey.
+    if getattr(key, 'arrow', None) is None:
+        questions = key.index.get_level_values(0).to_numpy(dtype=np.int64)
+        answers = key.index.get_level_values(1).to_numpy(dtype=np.int64)
+        key.arrow = (pa.array((questions - SPECIAL_QUESTION) * ID_LIMIT + answers),
+                     pa.array(key.answer_numeric, from_pandas=True),
+                     pa.array(key.answer_text, type=pa.string(), from_pandas=True),
+                     pa.array(key.special_ids, type=pa.float64()))
+    return key.arrow
+
+
+def id_codes(ids, offset):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    ids = pc.add(ids, float(offset))
+    valid = pc.and_(pc.and_(pc.greater_equal(ids, 0.0), pc.less(ids, float(ID_LIMIT))), pc.equal(ids, pc.floor(ids)))
+    return pc.cast(pc.if_else(valid, ids, pa.scalar(None, pa.float64())), pa.int64())
+
+
+def lookup_slice(question_ids, answer_ids, answers, arrays, text):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    codes_key, numeric_key, text_key, special_ids = arrays
+    answer_ids = pc.cast(answer_ids, pa.float64())
+    question_ids = pc.if_else(pc.is_in(answer_ids, value_set=special_ids), float(SPECIAL_QUESTION),
+                              pc.cast(question_ids, pa.float64()))
+    codes = pc.add(pc.multiply(id_codes(question_ids, -SPECIAL_QUESTION), ID_LIMIT), id_codes(answer_ids, 0))
+    indices = pc.index_in(codes, value_set=codes_key)
+
+    # Answers without a concept id that are plain digits are taken as the numeric answer itself. The pandas engine
+    # checks str(answer), which is never all digits for a float (str(12.0) is '12.0') while Arrow casts 12.0 to '12',
+    # so only text and integer answers are checked.
+    answer_type = answers.type.value_type if pa.types.is_dictionary(answers.type) else answers.type
+    checked = (pa.types.is_string(answer_type) or pa.types.is_large_string(answer_type) or
+               pa.types.is_integer(answer_type) or pa.types.is_null(answer_type))
+    answers = pc.cast(answers, pa.string())
+    digits = pc.is_null(answer_ids, nan_is_null=True)
+    digits = pc.and_(digits, pc.fill_null(pc.utf8_is_digit(answers), False) if checked else False)
+    digit_values = pc.cast(pc.if_else(digits, answers, '0'), numeric_key.type)
+
+    answer_numeric = pc.if_else(digits, digit_values, pc.take(numeric_key, indices))
+    answer_text = pc.if_else(digits, answers, pc.take(text_key, indices)) if text else None
+    return answer_numeric, answer_text
+
+
+def map_arrow(data, key, na_value=pd.NA, text=True, output='pandas', workers=None):
+    import pyarrow as pa
+
+    arrays = lookup_arrays(key)
+    question_ids, answer_ids, answers = (column(data, name) for name in
+                                         ('question_concept_id', 'answer_concept_id', 'answer'))
+
+    results = run_threads(lambda bounds: lookup_slice(question_ids.slice(*bounds), answer_ids.slice(*bounds),
+                                                      answers.slice(*bounds), arrays, text),
+                          row_slices(len(data), workers), workers)
+    mapped = {'answer_numeric': pa.chunked_array([chunk for numeric, _ in results for chunk in numeric.chunks],
+                                                 type=arrays[1].type)}
+    if text:
+        mapped['answer_text'] = pa.chunked_array([chunk for _, answer_text in results for chunk in answer_text.chunks],
+                                                 type=pa.string())
+
+    if output == 'arrow':
+        return with_columns(to_table(data), mapped)
+    if is_table(data):
+        data = data.drop_columns([name for name in mapped if name in data.column_names]).to_pandas()
+    for name, array in mapped.items():
+        data[name] = object_values(array, na_value)
+    return data
+
+
+def code_matches(array, codes):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    # Compared as float64 so integer columns of any width and fractional codes follow the pandas isin results.
+    return pc.fill_null(pc.is_in(pc.cast(array, pa.float64()), value_set=pa.array(codes, type=pa.float64())), False)
+
+
+def code_mask(values, codes):
+    import pyarrow as pa
+    return np.asarray(code_matches(pa.array(values), codes))
+
+
+def numeric_masks(data, names, codes, workers=None):
+    # Each plain numeric column is compared with the codes on its own thread.
+    return dict(zip(names, run_threads(lambda name: code_mask(data[name].to_numpy(), codes), names, workers)))
+
+
+def coerce_array(array):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)):
+        try:
+            array = pc.cast(array, pa.float64())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # Text that is not a number becomes missing, as with pd.to_numeric(errors='coerce').
+            array = pa.chunked_array([pa.array(pd.to_numeric(array.to_pandas(), errors='coerce'), from_pandas=True)])
+    if pa.types.is_floating(array.type):
+        # Whole-number columns become integers, as with to_numeric_column in the pandas engine.
+        array = pc.if_else(pc.is_nan(array), pa.scalar(None, array.type), array)
+        if pc.all(pc.equal(array, pc.floor(array))).as_py() is not False:
+            array = pc.cast(array, pa.int64())
+    return array
+
+
+def recode_array(array, codes, coerce):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if coerce:
+        array = coerce_array(array)
+    if not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)):
+        return array, coerce
+    mask = code_matches(array, codes)
+    if not pc.any(mask).as_py():
+        return array, coerce
+    return pc.if_else(mask, pa.scalar(None, array.type), array), True
+
+
+def recode_table(table, codes, coerce_columns=(), normalize_na=False, output='pandas', workers=None):
+    import pyarrow as pa
+
+    names = table.column_names
+    results = run_threads(lambda name: recode_array(table.column(name), codes, name in coerce_columns), names,
+                          workers)
+    changed = [name for name, (_, recoded) in zip(names, results) if recoded]
+    if output == 'arrow':
+        return pa.table({name: array for name, (array, _) in zip(names, results)}), changed
+
+    # Converted the way the pandas engine types the same columns: recoded integers become nullable Int64.
+    columns = {}
+    for name, (array, changed) in zip(names, results):
+        original = table.column(name)
+        if changed and pa.types.is_integer(array.type) and (original.null_count == 0 or name in coerce_columns):
+            columns[name] = pd.arrays.IntegerArray(np.asarray(array.fill_null(0)).astype(np.int64),
+                                                   np.asarray(array.is_null()))
+        elif pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            columns[name] = object_values(array, pd.NA if normalize_na else None)
+        else:
+            columns[name] = array.to_pandas()
+    return pd.DataFrame(columns), changed
+
+
+def present(data, name):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    try:
+        array = column(data, name)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return data[name].notna().to_numpy()
+    return np.asarray(pc.invert(pc.is_null(array, nan_is_null=True)))
+
+
+def factorize_sorted(data, name, valid):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    try:
+        array = column(data, name).filter(pa.array(valid))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns Arrow cannot hold, such as the mixed ids create_dummies produces, are factorized by pandas.
+        return pd.factorize(data[name][valid], sort=True)
+    uniques = pc.unique(array)
+    uniques = uniques.take(pc.sort_indices(uniques))
+    return np.asarray(pc.index_in(array, value_set=uniques)), uniques.to_numpy(zero_copy_only=False)
+
+
+def pivot_cells_arrow(data, values, workers=None):
+    import pyarrow as pa
+
+    valid = np.logical_and.reduce(run_threads(lambda name: present(data, name),
+                                              ('person_id', 'question_concept_id', values), workers))
+    (person_codes, persons), (question_codes, questions) = run_threads(
+        lambda name: factorize_sorted(data, name, valid), ('person_id', 'question_concept_id'), workers)
+
+    # Same rule as pivot_table(aggfunc='first'): the first non-missing value per cell wins. Each cell keeps the
+    # smallest row number written to it.
+    cells = person_codes.astype(np.int64) * len(questions) + question_codes
+    slot = np.full(len(persons) * len(questions), len(cells), dtype=np.int64)
+    np.minimum.at(slot, cells, np.arange(len(cells)))
+    first = np.sort(slot[slot < len(cells)])
+
+    if is_table(data):
+        source = column(data, values).filter(pa.array(valid)).take(pa.array(first)).to_pandas()
+    else:
+        source = data[values][valid].iloc[first]
+    return persons, questions, person_codes[first], question_codes[first], source
@@ -0,0 +1,59 @@
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+from omop2survey.extract_cache import ExtractCache
+from omop2survey.key_cache import cache_dir, get_survey_key
+from omop2survey.hash_csv import fingerprint
+
+
+class ArtifactCache(ExtractCache):
+    # Artifacts are pickled so every dtype (nullable integers, categoricals, mixed dummy ids) and attrs come back as is.
+    extension = 'pkl'
+
+    def __init__(self, directory=None, max_bytes=10 * 1024 ** 3):
+        super().__init__(directory if directory is not None else os.path.join(cache_dir(), 'artifacts'), max_bytes)
+
+    def key(self, input_fingerprint, function, params=None, key_digest=None):
+        artifact = {'input': input_fingerprint, 'survey_key': key_digest, 'function': function,
+                    'params': params or {}}
+        return hashlib.sha256(json.dumps(artifact, sort_keys=True, default=str).encode()).hexdigest()
+
+    def read(self, data_path):
+        try:
+            return pd.read_pickle(data_path)
+        except (pickle.UnpicklingError, EOFError) as error:
+            raise ValueError(f"Unreadable cache entry {data_path}") from error
+
+    def write(self, artifact, data_path):
+        pd.to_pickle(artifact, data_path)
+
+
+_default_cache = None
+
+
+def default_artifact_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ArtifactCache()
+    return _default_cache
+
+
+def cached_artifact(cache, function, input_data, params, compute, current):
+    if cache is True:
+        cache = default_artifact_cache()
+    if not cache:
+        return compute()
+
+    input_fingerprint = fingerprint(input_data)
+    key = cache.key(input_fingerprint, function, params, get_survey_key().digest)
+    artifact = cache.get(key)
+    hit = artifact is not None
+    current.set(cache_hits=int(hit), cache_misses=int(not hit))
+    current.note(f"Artifact cache {'hit' if hit else 'miss'} for {function} ({cache.hits} hits, {cache.misses} misses)")
+
+    if not hit:
+        artifact = compute()
+        cache.put(key, artifact, namespace=function, survey=None, fingerprint=input_fingerprint)
+    return artifact
@@ -0,0 +1,166 @@
+import os
+import json
+import sqlite3
+import importlib.util
+import threading
+import pandas as pd
+from omop2survey.instrument import note
+
+SURVEY_COLUMNS = ['person_id', 'survey', 'question_concept_id', 'question', 'answer_concept_id', 'answer']
+
+
+def survey_columns(columns):
+    if columns is None:
+        return SURVEY_COLUMNS
+    # Column names cannot be bound as query parameters, so they are checked against the known ds_survey columns.
+    unknown = [col for col in columns if col not in SURVEY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown ds_survey columns: {unknown}. Choose from {SURVEY_COLUMNS}.")
+    return list(columns)
+
+
+class QueryBackend:
+    def __init__(self):
+        self.survey_names = None
+
+    def list_surveys(self):
+        # The survey list rarely changes, so it is queried once per backend and reused for every import.
+        if self.survey_names is None:
+            self.survey_names = self.query_surveys()
+        return self.survey_names
+
+    def cache_namespace(self):
+        raise NotImplementedError
+
+    def query_surveys(self):
+        raise NotImplementedError
+
+    def fetch_survey(self, survey, columns=None, question_ids=None, person_ids=None):
+        raise NotImplementedError
+
+
+class BigQueryBackend(QueryBackend):
+    def __init__(self, cdr=None):
+        super().__init__()
+        self.cdr = cdr if cdr is not None else os.environ["WORKSPACE_CDR"]
+
+    def read(self, sql, parameters=()):
+        import pandas_gbq
+
+        configuration = None
+        if parameters:
+            configuration = {'query': {'parameterMode': 'NAMED', 'queryParameters': list(parameters)}}
+        return pandas_gbq.read_gbq(sql, dialect="standard", configuration=configuration,
+                                   use_bqstorage_api=("BIGQUERY_STORAGE_API_ENABLED" in os.environ),
+                                   progress_bar_type="tqdm_notebook")
+
+    def cache_namespace(self):
+        # CDR releases are fixed snapshots, so the dataset name alone identifies the extract.
+        return self.cdr
+
+    def query_surveys(self):
+        # No ORDER BY: the numbers shown by show_survey_options follow BigQuery's order, as they always have.
+        survey_map_sql = f"SELECT DISTINCT survey FROM `{self.cdr}.ds_survey`"
+        return self.read(survey_map_sql)['survey'].tolist()
+
+    def fetch_survey(self, survey, columns=None, question_ids=None, person_ids=None):
+        columns = survey_columns(columns)
+        parameters = [{'name': 'survey', 'parameterType': {'type': 'STRING'}, 'parameterValue': {'value': survey}}]
+        filters = ["answer.survey = @survey"]
+
+        for name, ids in (('question_concept_id', question_ids), ('person_id', person_ids)):
+            if ids is not None:
+                filters.append(f"answer.{name} IN UNNEST(@{name}s)")
+                parameters.append({
+                    'name': f"{name}s",
+                    'parameterType': {'type': 'ARRAY', 'arrayType': {'type': 'INT64'}},
+                    'parameterValue': {'arrayValues': [{'value': str(int(i))} for i in ids]}
+                })
+
+        dataset_sql = (f"SELECT DISTINCT {', '.join('answer.' + col for col in columns)} "
+                       f"FROM `{self.cdr}.ds_survey` answer WHERE {' AND '.join(filters)}")
+
+        note("Executing SQL query:")
+        note(dataset_sql)
+        return self.read(dataset_sql, parameters)
+
+
+class LocalBackend(QueryBackend):
+    def __init__(self, path, engine=None):
+        super().__init__()
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File path {path} does not exist.")
+        self.path = path
+
+        if engine is None:
+            engine = 'duckdb' if importlib.util.find_spec('duckdb') is not None else 'sqlite'
+        if engine not in ('duckdb', 'sqlite'):
+            raise ValueError("Unsupported engine. Please use 'duckdb' or 'sqlite'.")
+        self.engine = engine
+        self.connection = self.connect()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.path.endswith(('.db', '.sqlite')):
+            if self.engine == 'duckdb':
+                raise ValueError("SQLite database files require engine='sqlite'.")
+            return sqlite3.connect(self.path, check_same_thread=False)
+
+        if self.engine == 'duckdb':
+            import duckdb
+            connection = duckdb.connect()
+            reader = 'read_parquet' if self.path.endswith('.parquet') else 'read_csv_auto'
+            path = self.path.replace("'", "''")
+            connection.execute(f"CREATE VIEW ds_survey AS SELECT * FROM {reader}('{path}')")
+            return connection
+
+        # Without DuckDB the file is loaded once into an in-memory SQLite table.
+        if self.path.endswith('.parquet'):
+            data = pd.read_parquet(self.path)
+        else:
+            data = pd.read_csv(self.path, encoding='utf-8-sig')
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        data.to_sql('ds_survey', connection, index=False)
+        return connection
+
+    def cache_namespace(self):
+        # Local files can change in place, so their modification time is part of the namespace.
+        return f"{os.path.abspath(self.path)}:{os.stat(self.path).st_mtime_ns}"
+
+    def read(self, sql, parameters=()):
+        if self.engine == 'duckdb':
+            # A cursor is a separate DuckDB connection to the same database, so queries can run from several threads.
+            return self.connection.cursor().execute(sql, list(parameters)).df()
+        with self.lock:
+            return pd.read_sql_query(sql, self.connection, params=list(parameters))
+
+    def query_surveys(self):
+        # DuckDB and SQLite return DISTINCT rows in different orders, so local surveys are numbered alphabetically.
+        return self.read("SELECT DISTINCT survey FROM ds_survey ORDER BY survey")['survey'].tolist()
+
+    def fetch_survey(self, survey, columns=None, question_ids=None, person_ids=None):
+        columns = survey_columns(columns)
+        parameters = [survey]
+        filters = ["survey = ?"]
+
+        for name, ids in (('question_concept_id', question_ids), ('person_id', person_ids)):
+            if ids is not None:
+                # Each id list is bound as a single parameter, however long it is.
+                if self.engine == 'duckdb':
+                    filters.append(f"{name} IN (SELECT UNNEST(?))")
+                    parameters.append([int(i) for i in ids])
+                else:
+                    filters.append(f"{name} IN (SELECT value FROM json_each(?))")
+                    parameters.append(json.dumps([int(i) for i in ids]))
+
+        dataset_sql = f"SELECT DISTINCT {', '.join(columns)} FROM ds_survey WHERE {' AND '.join(filters)}"
+        survey_df = self.read(dataset_sql, parameters)
+
+        # SQLite has no column types to carry NULLs in id columns, so they come back as objects.
+        for col in ('person_id', 'question_concept_id'):
+            if col in survey_df.columns and survey_df[col].dtype == object:
+                survey_df[col] = pd.to_numeric(survey_df[col])
+        # answer_concept_id is float64 from either engine, with or without NULLs, as in a CSV extract.
+        if 'answer_concept_id' in survey_df.columns:
+            survey_df['answer_concept_id'] = pd.to_numeric(survey_df['answer_concept_id']).astype('float64')
+        return survey_df
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from omop2survey.key_cache import get_survey_key
+from omop2survey.subset import default_backend, survey_name
+from omop2survey.pipeline import SurveyPipeline
+from omop2survey.instrument import stage
+
+
+def survey_names(selections, backend):
+    if isinstance(selections, str) and selections == 'all':
+        return list(backend.list_surveys())
+    if isinstance(selections, (str, int)):
+        selections = [selections]
+
+    names = []
+    for selection in selections:
+        name = survey_name(selection, backend)
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def import_surveys(selections='all', backend=None, pipeline=None, workers=4, question_ids=None, person_ids=None,
+                   cache=False):
+    if backend is None:
+        backend = default_backend()
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if pipeline is None:
+        pipeline = SurveyPipeline.from_survey(None).map_answers()
+    if not isinstance(pipeline, SurveyPipeline):
+        raise ValueError("pipeline must be a SurveyPipeline; its steps are run on every survey.")
+
+    with stage('import_surveys') as current:
+        surveys = survey_names(selections, backend)
+        pipelines = {}
+        for survey in surveys:
+            source = SurveyPipeline.from_survey(survey, backend=backend, cache=cache, question_ids=question_ids,
+                                                person_ids=person_ids).source
+            pipelines[survey] = SurveyPipeline(source, pipeline.steps)
+
+        # The key is loaded once up front; every survey's mapping then shares the same in-memory copy.
+        if any(name == 'map_answers' for name, _ in pipeline.steps):
+            get_survey_key()
+
+        def fetch(survey):
+            start = time.perf_counter()
+            return pipelines[survey].fetch(), time.perf_counter() - start
+
+        results = {}
+        timings = {}
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=min(workers, max(len(surveys), 1)))
+        try:
+            futures = {executor.submit(fetch, survey): survey for survey in surveys}
+            # Queries run in the pool; each survey is processed here as soon as its data arrives.
+            for future in as_completed(futures):
+                survey = futures[future]
+                data, query_seconds = future.result()
+                process_start = time.perf_counter()
+                results[survey] = pipelines[survey].collect(data)
+                timings[survey] = {'rows': len(data), 'query_seconds': query_seconds,
+                                   'process_seconds': time.perf_counter() - process_start}
+                current.note(f"Survey '{survey}': {len(data)} rows queried in {query_seconds:.2f}s, "
+                             f"processed in {timings[survey]['process_seconds']:.2f}s")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        elapsed = time.perf_counter() - start
+        current.set(surveys=len(surveys), workers=workers, rows_in=sum(t['rows'] for t in timings.values()),
+                    timings=timings)
+        current.note(f"Imported and processed {len(surveys)} surveys in {elapsed:.2f}s")
+    return {survey: results[survey] for survey in surveys}
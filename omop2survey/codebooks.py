@@ -1,7 +1,12 @@
 import pandas as pd
+import numpy as np
 from IPython.display import display, FileLink, HTML
 import os
 from datetime import datetime
+from omop2survey.table_io import write_table
+from omop2survey.instrument import stage, note
+from omop2survey.artifact_cache import cached_artifact
+from omop2survey.unique_values import map_unique, normalize_text
 
 def load_data(source):
     if isinstance(source, pd.DataFrame):
@@ -19,27 +24,87 @@ def load_data(source):
         raise TypeError("Input source must be a pandas DataFrame or a filepath as a string.")
 
 
-def create_codebook(input_data):
+REQUIRED_COLUMNS = ['question_concept_id', 'question']
+RESPONSE_COLUMNS = ['answer_concept_id', 'answer', 'answer_text', 'answer_numeric']
 
-    required_columns = ['question_concept_id', 'question']
-    response_columns = ['answer_concept_id', 'answer', 'answer_text', 'answer_numeric']
 
-    response_columns = [col for col in response_columns if col in input_data.columns]
+class CodebookAccumulator:
+    def __init__(self):
+        self.columns = None
+        self.distinct = None
+        self.rows_seen = 0
 
-    if not all(col in input_data.columns for col in required_columns):
-        raise ValueError("Dataframe must contain the necessary columns: 'question_concept_id' and 'question'.")
+    def update(self, chunk):
+        if self.columns is None:
+            if not all(col in chunk.columns for col in REQUIRED_COLUMNS):
+                raise ValueError("Dataframe must contain the necessary columns: 'question_concept_id' and 'question'.")
+            self.columns = REQUIRED_COLUMNS + [col for col in RESPONSE_COLUMNS if col in chunk.columns]
 
-    input_data['question_concept_id'] = input_data['question_concept_id'].astype(str)
+        # Only the distinct combinations are kept, so the state grows with the survey's size, not the extract's.
+        self.add_distinct(chunk[self.columns].drop_duplicates())
+        self.rows_seen += len(chunk)
+        return self
 
-    grouped = input_data.groupby(required_columns).apply(
-        lambda x: x[response_columns].drop_duplicates().reset_index(drop=True)
-    )
+    def merge(self, other):
+        if other.distinct is None:
+            return self
+        if self.columns is None:
+            self.columns = other.columns
+        elif other.columns != self.columns:
+            raise ValueError("Cannot merge codebooks built from different columns.")
 
-    codebook_df = grouped.reset_index(drop=False)
+        self.add_distinct(other.distinct)
+        self.rows_seen += other.rows_seen
+        return self
 
-    codebook_df = codebook_df[required_columns + response_columns].drop_duplicates()
+    def add_distinct(self, distinct):
+        if self.distinct is None:
+            self.distinct = distinct.reset_index(drop=True)
+        else:
+            self.distinct = pd.concat([self.distinct, distinct], ignore_index=True).drop_duplicates(ignore_index=True)
+
+    def result(self):
+        if self.distinct is None:
+            return pd.DataFrame(columns=REQUIRED_COLUMNS + RESPONSE_COLUMNS)
+
+        codebook_df = self.distinct.copy()
+        codebook_df['question_concept_id'] = codebook_df['question_concept_id'].astype(str)
+        codebook_df = codebook_df[codebook_df['question'].notna()].drop_duplicates()
+
+        # Sorted by question like the groupby this replaces; answers keep the order they were first seen in.
+        return codebook_df.sort_values(REQUIRED_COLUMNS, kind='stable').reset_index(drop=True)
+
+
+def merge_codebooks(accumulators):
+    with stage('merge_codebooks') as current:
+        merged = CodebookAccumulator()
+        for accumulator in accumulators:
+            merged.merge(accumulator)
+        current.set(rows_in=merged.rows_seen)
+        return merged
+
+
+def create_codebook(input_data, cache=False):
+    with stage('create_codebook', input_data) as current:
+        return current.output(cached_artifact(cache, 'create_codebook', input_data, {},
+                                              lambda: CodebookAccumulator().update(input_data).result(), current))
 
-    return codebook_df
+
+def create_codebook_file(input_path, chunksize=500000, cache=False):
+    from omop2survey.stream import read_chunks
+
+    with stage('create_codebook_file') as current:
+        def compute():
+            accumulator = CodebookAccumulator()
+            for chunk in read_chunks(input_path, chunksize):
+                accumulator.update(chunk)
+            current.set(rows_in=accumulator.rows_seen)
+            return accumulator.result()
+
+        # The file itself is fingerprinted, so an unchanged extract is never re-read.
+        codebook = cached_artifact(cache, 'create_codebook_file', input_path, {}, compute, current)
+        current.set(file_path=input_path)
+        return current.output(codebook)
 
 
 def generate_codebook(source):
@@ -52,9 +117,9 @@ def generate_codebook(source):
 
         return codebook_df
     except ImportError:
-        print("Required module not installed.")
+        note("Required module not installed.")
     except Exception as e:
-        print(f"Error: {e}")
+        note(f"Error: {e}")
 
 
 def print_codebook(source):
@@ -68,109 +133,118 @@ def print_codebook(source):
         from tabulate import tabulate
         print(tabulate(codebook_df, headers='keys', tablefmt='psql', showindex=False))
     except ImportError:
-        print("Tabulate module not installed, using default print.")
+        note("Tabulate module not installed, using default print.")
         print(codebook_df)
     except Exception as e:
-        print(f"Error: {e}")
+        note(f"Error: {e}")
+
+
+HTML_HEADERS = ['question_concept_id', 'question', 'answer_concept_id', 'answer_concept_id recoded as answer_numeric',
+                'answer', 'answer recoded as answer_text']
+
+
+def codebook_layout(input_data):
+    # Work on a new frame so the caller's question/answer columns are left as they were.
+    data = pd.DataFrame({
+        'question_concept_id': input_data['question_concept_id'],
+        'question': map_unique(input_data['question'], normalize_text),
+        'answer_concept_id': input_data['answer_concept_id'],
+        'answer_numeric': input_data['answer_numeric'],
+        'answer': map_unique(input_data['answer'], normalize_text),
+        'answer_text': input_data['answer_text']
+    })
 
+    data = data.drop_duplicates(subset=['question_concept_id', 'question', 'answer_concept_id'])
 
-def codebook(input_data):
+    # Questions in order of first appearance, answers in row order within each question.
+    group_order = data.groupby(['question_concept_id', 'question'], sort=False).ngroup().to_numpy()
+    order = np.argsort(group_order, kind='stable')
+    order = order[group_order[order] >= 0]
+    groups = group_order[order]
 
-    input_data['question'] = input_data['question'].str.strip().str.lower()
-    input_data['answer'] = input_data['answer'].str.strip().str.lower()
+    table = data.iloc[order].reset_index(drop=True)
+    first_in_group = np.r_[True, groups[1:] != groups[:-1]] if len(groups) else np.array([], dtype=bool)
+    return table, first_in_group
 
-    input_data = input_data.drop_duplicates(subset=['question_concept_id', 'question', 'answer_concept_id'])
 
-    grouped = input_data.groupby(['question_concept_id', 'question'], sort=False)
+def write_codebook_table(table, file_path, file_format):
+    # Columnar files keep every cell filled and typed; blanking repeated questions is only for the HTML view.
+    table = table.copy()
+    table['answer_concept_id'] = pd.to_numeric(table['answer_concept_id'], errors='coerce')
+    table['answer_numeric'] = pd.to_numeric(table['answer_numeric'], errors='coerce')
+    if table['question_concept_id'].dtype == object:
+        table['question_concept_id'] = table['question_concept_id'].astype(str)
 
-    formatted_data = []
+    return write_table(table, file_path, file_format, index=False)
 
-    for (question_concept_id, question), group in grouped:
-        is_first = True
 
-        for idx, row in group.iterrows():
-            if is_first:
-                formatted_data.append({
-                    'question_concept_id': question_concept_id,
-                    'question': question,
-                    'answer_concept_id': row['answer_concept_id'],
-                    'answer_concept_id recoded as answer_numeric': row['answer_numeric'],
-                    'answer': row['answer'],
-                    'answer recoded as answer_text': row['answer_text']
-                })
-                is_first = False
-            else:
-                formatted_data.append({
-                    'question_concept_id': '',
-                    'question': '',
-                    'answer_concept_id': row['answer_concept_id'],
-                    'answer_concept_id recoded as answer_numeric': row['answer_numeric'],
-                    'answer': row['answer'],
-                    'answer recoded as answer_text': row['answer_text']
-                })
+def html_cells(column):
+    # Missing cells read the same as in DataFrame.to_html: NaN for float NaN, <NA> for pd.NA and None for None.
+    cells = column.astype(object).astype(str)
+    return cells.mask(column.isna().to_numpy() & (cells == 'nan').to_numpy(), 'NaN')
 
-    formatted_codebook_df = pd.DataFrame(formatted_data)
+
+def html_rows(table, first_in_group):
+    cells = [html_cells(table[col]) for col in table.columns]
+    for i in (0, 1):
+        cells[i] = cells[i].where(first_in_group, '')
+
+    rows = pd.Series('    <tr>\n', index=table.index)
+    for column in cells:
+        rows = rows + '      <td>' + column + '</td>\n'
+    return ''.join(rows + '    </tr>\n')
+
+
+def html_table(table, first_in_group, file=None, chunk_rows=10000):
+    header = ('<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n'
+              + ''.join(f'      <th>{name}</th>\n' for name in HTML_HEADERS)
+              + '    </tr>\n  </thead>\n  <tbody>\n')
+    footer = '  </tbody>\n</table>'
+
+    if file is None:
+        return header + html_rows(table, first_in_group) + footer
+
+    # Rows are rendered and written a block at a time so the full document never sits in memory.
+    file.write(header)
+    for start in range(0, len(table), chunk_rows):
+        file.write(html_rows(table.iloc[start:start + chunk_rows], first_in_group[start:start + chunk_rows]))
+    file.write(footer)
+
+
+def write_codebook(input_data, directory, file_format, show, max_rows):
+    table, first_in_group = codebook_layout(input_data)
 
     current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_path = os.path.join(directory, f'codebook_{current_time}.{file_format}')
+
+    if file_format != 'html':
+        display(FileLink(write_codebook_table(table, file_path, file_format)))
+        return file_path
 
-    file_name = f'codebook_{current_time}.html'
-    file_path = os.path.join(os.getcwd(), file_name)
-    temp = formatted_codebook_df.to_html(index=False, escape=False)
     with open(file_path, 'w') as f:
-        f.write(temp)
+        html_table(table, first_in_group, file=f)
     display(FileLink(file_path))
-    display(HTML(temp))
 
-    return
+    if show:
+        preview = html_table(table.iloc[:max_rows], first_in_group[:max_rows])
+        if len(table) > max_rows:
+            preview += (f'<p>Showing the first {max_rows} of {len(table)} rows; '
+                        f'open the file above for the full codebook.</p>')
+        display(HTML(preview))
+    return file_path
 
 
-def codebook_html(input_data):
-    input_data['question'] = input_data['question'].str.strip().str.lower()
-    input_data['answer'] = input_data['answer'].str.strip().str.lower()
-
-    input_data = input_data.drop_duplicates(subset=['question_concept_id', 'question', 'answer_concept_id'])
-
-    grouped = input_data.groupby(['question_concept_id', 'question'], sort=False)
-
-    formatted_data = []
-
-    for (question_concept_id, question), group in grouped:
-        is_first = True
-
-        for idx, row in group.iterrows():
-            if is_first:
-                formatted_data.append({
-                    'question_concept_id': question_concept_id,
-                    'question': question,
-                    'answer_concept_id': row['answer_concept_id'],
-                    'answer_concept_id recoded as answer_numeric': row['answer_numeric'],
-                    'answer': row['answer'],
-                    'answer recoded as answer_text': row['answer_text']
-                })
-                is_first = False
-            else:
-                formatted_data.append({
-                    'question_concept_id': '',
-                    'question': '',
-                    'answer_concept_id': row['answer_concept_id'],
-                    'answer_concept_id recoded as answer_numeric': row['answer_numeric'],
-                    'answer': row['answer'],
-                    'answer recoded as answer_text': row['answer_text']
-                })
-
-    formatted_codebook_df = pd.DataFrame(formatted_data)
-    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+def codebook(input_data, file_format='html', show=True, max_rows=50):
+    with stage('codebook', input_data) as current:
+        current.set(file_path=write_codebook(input_data, os.getcwd(), file_format, show, max_rows))
 
-    file_name = f'codebook_{current_time}.html'
-    workspace_dir = os.path.join(os.getcwd(), 'workspace')
-    os.makedirs(workspace_dir, exist_ok=True)
-    file_path = os.path.join(workspace_dir, file_name)
+    return
 
-    temp = formatted_codebook_df.to_html(index=False, escape=False)
-    with open(file_path, 'w') as f:
-        f.write(temp)
 
-    display(FileLink(file_path))
-    display(HTML(temp))
+def codebook_html(input_data, file_format='html', show=True, max_rows=50):
+    with stage('codebook_html', input_data) as current:
+        workspace_dir = os.path.join(os.getcwd(), 'workspace')
+        os.makedirs(workspace_dir, exist_ok=True)
+        current.set(file_path=write_codebook(input_data, workspace_dir, file_format, show, max_rows))
 
     return
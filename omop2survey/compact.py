@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from omop2survey.instrument import note
+
+CATEGORY_COLUMNS = ['survey', 'question', 'answer', 'answer_text']
+ID_COLUMNS = ['person_id', 'question_concept_id', 'answer_concept_id']
+
+
+def memory_usage(data):
+    if not isinstance(data, pd.DataFrame):
+        return int(data.nbytes)
+    return int(data.memory_usage(deep=True).sum())
+
+
+def memory_report(before, after):
+    note(f"Memory usage: {before / 1e6:,.1f} MB -> {after / 1e6:,.1f} MB ({(after - before) / max(before, 1):+.0%})",
+         memory_before=before, memory_after=after)
+
+
+def fits(values, dtype):
+    info = np.iinfo(dtype)
+    return len(values) == 0 or (values.min() >= info.min and values.max() <= info.max)
+
+
+def compact_integers(column, dtype):
+    if isinstance(column.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(column):
+        return None
+    try:
+        numeric = pd.to_numeric(column, errors='coerce')
+    except TypeError:
+        return None
+    values = numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+    present = values[~np.isnan(values)]
+
+    # Columns holding text, fractions or values outside the narrower range keep their dtype.
+    if len(present) != column.notna().sum() or not np.array_equal(present, np.round(present)) or \
+            not fits(present, dtype):
+        return None
+    if len(present) == len(values):
+        return numeric.astype(dtype)
+    return numeric.astype(pd.api.types.pandas_dtype(dtype).name.capitalize())
+
+
+def compact_column(name, column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return None
+    if name in ID_COLUMNS:
+        # Id dtypes are kept, so dummy labels built from them and pivot indexes are the same as without compact mode.
+        # Ids mixed with text labels (as create_dummies produces) are repeated on many rows, like the text columns.
+        if column.dtype == object and not pd.api.types.is_numeric_dtype(column.infer_objects()):
+            return column.astype('category')
+        return None
+    if name == 'answer_numeric':
+        return compact_integers(column, np.int16)
+    if name in CATEGORY_COLUMNS and not pd.api.types.is_numeric_dtype(column):
+        return column.astype('category')
+    return None
+
+
+def compact_frame(data, inplace=False):
+    if not inplace:
+        data = data.copy(deep=False)
+    for col in data.columns:
+        compacted = compact_column(col, data[col])
+        if compacted is not None:
+            data[col] = compacted
+    return data
+
+
+def compact(data, inplace=False, report=True):
+    before = memory_usage(data) if report else None
+    data = compact_frame(data, inplace=inplace)
+    if report:
+        memory_report(before, memory_usage(data))
+    return data
+
+
+def compact_report(data, enabled):
+    # The report compares the same frame before and after compacting, not the function's input with its result.
+    if not enabled:
+        return data
+    before = memory_usage(data)
+    data = compact_frame(data, inplace=True)
+    memory_report(before, memory_usage(data))
+    return data
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import threading
+import hashlib
+import pandas as pd
+from omop2survey.key_cache import cache_dir
+
+
+class ExtractCache:
+    extension = 'parquet'
+
+    def __init__(self, directory=None, max_bytes=10 * 1024 ** 3):
+        self.directory = directory if directory is not None else os.path.join(cache_dir(), 'extracts')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Concurrent imports share one cache, so the hit and miss counts and eviction are updated under a lock.
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, namespace, survey, columns=None, question_ids=None, person_ids=None):
+        query = {
+            'namespace': namespace,
+            'survey': survey,
+            'columns': None if columns is None else list(columns),
+            'question_ids': None if question_ids is None else sorted(int(i) for i in question_ids),
+            'person_ids': None if person_ids is None else sorted(int(i) for i in person_ids)
+        }
+        return hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()
+
+    def paths(self, key):
+        return os.path.join(self.directory, f"{key}.{self.extension}"), os.path.join(self.directory, f"{key}.json")
+
+    def read(self, data_path):
+        return pd.read_parquet(data_path)
+
+    def write(self, survey_df, data_path):
+        survey_df.to_parquet(data_path, index=False, compression='zstd')
+
+    def get(self, key):
+        data_path, _ = self.paths(key)
+        try:
+            survey_df = self.read(data_path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # The file's modification time doubles as its last-used time for LRU eviction.
+        os.utime(data_path)
+        with self.lock:
+            self.hits += 1
+        return survey_df
+
+    def put(self, key, survey_df, namespace=None, survey=None, **meta):
+        data_path, meta_path = self.paths(key)
+        temp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.write(survey_df, temp_path)
+        os.replace(temp_path, data_path)
+
+        with open(meta_path, 'w') as f:
+            json.dump({'namespace': namespace, 'survey': survey, **meta, 'rows': len(survey_df),
+                       'bytes': os.path.getsize(data_path), 'created': time.time()}, f)
+        with self.lock:
+            self.evict()
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(f".{self.extension}"):
+                continue
+            key = name[:-len(self.extension) - 1]
+            data_path, meta_path = self.paths(key)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                stat = os.stat(data_path)
+            except (OSError, ValueError):
+                meta, stat = {}, os.stat(data_path)
+            entries.append({'key': key, 'bytes': stat.st_size, 'last_used': stat.st_mtime, **meta})
+        return entries
+
+    def remove(self, key):
+        for path in self.paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda entry: entry['last_used'])
+        total = sum(entry['bytes'] for entry in entries)
+        while entries and total > self.max_bytes:
+            entry = entries.pop(0)
+            self.remove(entry['key'])
+            total -= entry['bytes']
+
+    def invalidate(self, namespace=None, survey=None):
+        removed = 0
+        for entry in self.entries():
+            if (namespace is None or entry.get('namespace') == namespace) and \
+                    (survey is None or entry.get('survey') == survey):
+                self.remove(entry['key'])
+                removed += 1
+        return removed
+
+    def stats(self):
+        entries = self.entries()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries),
+                'bytes': sum(entry['bytes'] for entry in entries), 'max_bytes': self.max_bytes}
+
+
+_default_cache = None
+
+
+def default_extract_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ExtractCache()
+    return _default_cache
@@ -1,23 +1,72 @@
 import hashlib
 import os
+import pandas as pd
 
+BLOCK_SIZE = 1024 * 1024
+FRAME_BLOCK_ROWS = 1000000
 
-def hash_csv(file_path):
+
+def hash_file(file_path, block_size=BLOCK_SIZE):
     hasher = hashlib.sha256()
+    # The file is read in fixed-size blocks, so hashing a large extract never holds it in memory.
     with open(file_path, 'rb') as f:
-        buf = f.read()
-        hasher.update(buf)
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
     return hasher.hexdigest()
 
 
-if __name__ == "__main__":
-    csv_file_path = 'omop2survey/survey_key.csv'
+def hash_csv(file_path):
+    return hash_file(file_path)
+
 
-    file_hash = hash_csv(csv_file_path)
+def hash_frame(df, block_rows=FRAME_BLOCK_ROWS):
+    hasher = hashlib.sha256()
+    hasher.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    hasher.update(repr(df.index.names).encode())
+
+    # Row hashes cover the index and every column's values; they are fed to the digest a block of rows at a time.
+    for start in range(0, len(df), block_rows):
+        block = df.iloc[start:start + block_rows]
+        hasher.update(pd.util.hash_pandas_object(block, index=True, categorize=True).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def hash_table(table, block_rows=FRAME_BLOCK_ROWS):
+    hasher = hashlib.sha256()
+    hasher.update(str(table.schema.remove_metadata()).encode())
 
-    hash_file_path = os.path.splitext(csv_file_path)[0] + '_hash.txt'
+    # Fixed-size slices rather than the table's own batches, so the digest does not depend on how it was chunked.
+    for start in range(0, table.num_rows, block_rows):
+        block = table.slice(start, block_rows).to_pandas()
+        hasher.update(pd.util.hash_pandas_object(block, index=False, categorize=True).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def fingerprint(data):
+    if isinstance(data, pd.DataFrame):
+        return hash_frame(data)
+    if hasattr(data, 'schema') and hasattr(data, 'num_rows'):
+        return hash_table(data)
+    if isinstance(data, str):
+        if not os.path.exists(data):
+            raise FileNotFoundError(f"File path {data} does not exist.")
+        return hash_file(data)
+    raise ValueError("Unsupported data type. Please provide a file path, a pandas DataFrame or a pyarrow Table.")
+
+
+def write_hash(file_path):
+    file_hash = hash_file(file_path)
+
+    hash_file_path = os.path.splitext(file_path)[0] + '_hash.txt'
     with open(hash_file_path, 'w') as f:
         f.write(file_hash)
+    return file_hash, hash_file_path
+
+
+if __name__ == "__main__":
+    csv_file_path = 'omop2survey/survey_key.csv'
+
+    file_hash, hash_file_path = write_hash(csv_file_path)
 
     print(f"The hash of the file {csv_file_path} is: {file_hash}")
     print(f"Hash saved to: {hash_file_path}")
@@ -0,0 +1,145 @@
+import os
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from omop2survey.key_cache import get_survey_key
+from omop2survey.response_set import apply_lookup
+from omop2survey.recode_missing import recode_missing_frame
+from omop2survey.pivot_data import pivot_cells, wide_frame
+from omop2survey.stream import normalize_chunk
+from omop2survey.table_io import require_pyarrow
+from omop2survey.instrument import stage
+
+GROUP_COLUMNS = ['person_id', 'question_concept_id']
+STATE_FILES = {'fingerprints': 'fingerprints.parquet', 'mapped': 'mapped.parquet', 'pivot': 'pivot.parquet'}
+
+
+def group_fingerprints(survey_data):
+    # Rows are hashed on their extract columns; a (person, question) group's fingerprint is the wrapping sum of its
+    # row hashes, so it changes when any answer is added, removed or edited but not when rows are reordered.
+    source = survey_data.drop(columns=[col for col in ('answer_numeric', 'answer_text') if col in survey_data.columns])
+    if 'answer_concept_id' in source.columns:
+        source = source.assign(answer_concept_id=source['answer_concept_id'].astype('float64'))
+    hashes = pd.util.hash_pandas_object(source, index=False).to_numpy()
+
+    groups = survey_data[GROUP_COLUMNS].assign(fingerprint=hashes)
+    return groups.groupby(GROUP_COLUMNS, sort=False, dropna=False)['fingerprint'].sum().reset_index()
+
+
+def group_index(data):
+    return pd.MultiIndex.from_frame(data[GROUP_COLUMNS])
+
+
+def state_paths(state_dir):
+    return {name: os.path.join(state_dir, file_name) for name, file_name in STATE_FILES.items()}
+
+
+def load_survey_state(state_dir):
+    manifest_path = os.path.join(state_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    require_pyarrow()
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    state = {name: pd.read_parquet(path) for name, path in state_paths(state_dir).items() if os.path.exists(path)}
+    if 'pivot' in state:
+        state['pivot'] = state['pivot'].set_index('person_id')
+    state['manifest'] = manifest
+    return state
+
+
+def save_survey_state(state_dir, state):
+    os.makedirs(state_dir, exist_ok=True)
+    # Each file is written next to its final name and then swapped in, so an interrupted update leaves the old state.
+    for name, path in state_paths(state_dir).items():
+        if state.get(name) is None:
+            continue
+        frame = state[name].reset_index() if name == 'pivot' else state[name]
+        frame.to_parquet(path + '.tmp', index=False, compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    manifest_path = os.path.join(state_dir, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(state['manifest'], f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def map_delta(delta, recode):
+    delta = apply_lookup(delta.reset_index(drop=True), get_survey_key())
+    if recode:
+        delta = recode_missing_frame(delta, inplace=True)
+    return normalize_chunk(delta)
+
+
+def merge_pivot(previous, questions, long_data, persons):
+    affected = long_data[long_data['person_id'].isin(persons)]
+    cell_persons, cell_questions, rows, cols, source = pivot_cells(affected, 'answer_numeric')
+    repivoted = wide_frame(cell_persons, cell_questions, rows, cols, source).astype(np.float64)
+
+    # Sorted the same way pivot_wide() sorts the questions of the whole table.
+    questions = pd.factorize(pd.Series(list(questions) + list(cell_questions), dtype=object), sort=True)[1]
+    columns = ['q' + str(question) for question in questions]
+
+    kept = previous[~previous.index.isin(persons)] if previous is not None else None
+    pivot_df = pd.concat([frame for frame in (kept, repivoted) if frame is not None]).reindex(columns=columns)
+    pivot_df = pivot_df.sort_index()
+    pivot_df.index.name = 'person_id'
+
+    # A question whose last answer was withdrawn has no column in a full pivot either.
+    present = pivot_df.notna().any().to_numpy()
+    return pivot_df.loc[:, present], [question for question, keep in zip(questions.tolist(), present) if keep]
+
+
+def update_survey(survey_data, state_dir, release=None, recode=True, pivot=True):
+    with stage('update_survey', survey_data) as current:
+        state = load_survey_state(state_dir)
+        key = get_survey_key()
+        fingerprints = group_fingerprints(survey_data)
+
+        # Stored outputs are only reused if they were mapped with the same survey key and options.
+        settings = {'key_digest': key.digest, 'recode': recode, 'pivot': pivot}
+        if state is not None and any(state['manifest'].get(name) != value for name, value in settings.items()):
+            current.note("Survey key or options changed since the stored output; rebuilding from scratch.")
+            state = None
+
+        previous = state['fingerprints'] if state is not None else fingerprints.iloc[:0]
+        compared = fingerprints.merge(previous, on=GROUP_COLUMNS, how='outer', suffixes=('', '_previous'),
+                                      indicator=True)
+        added = compared['_merge'] == 'left_only'
+        removed = compared['_merge'] == 'right_only'
+        changed = (compared['_merge'] == 'both') & (compared['fingerprint'] != compared['fingerprint_previous'])
+        stale = group_index(compared[added | changed | removed])
+
+        delta = survey_data[group_index(survey_data).isin(stale)]
+        mapped_delta = map_delta(delta, recode)
+        if state is None:
+            mapped = mapped_delta
+        else:
+            kept = state['mapped'][~group_index(state['mapped']).isin(stale)]
+            mapped = pd.concat([kept, mapped_delta], ignore_index=True)
+
+        pivot_df, questions = None, []
+        if pivot:
+            persons = pd.unique(stale.get_level_values('person_id'))
+            previous_pivot = state['pivot'] if state is not None else None
+            previous_questions = state['manifest']['questions'] if state is not None else []
+            pivot_df, questions = merge_pivot(previous_pivot, previous_questions, mapped, persons)
+            current.set(persons_repivoted=len(persons))
+
+        counts = {'added': int(added.sum()), 'changed': int(changed.sum()), 'removed': int(removed.sum()),
+                  'unchanged': int(len(compared) - added.sum() - changed.sum() - removed.sum()),
+                  'rows_processed': len(delta)}
+        manifest = {**settings, 'release': release, 'updated': datetime.now().isoformat(timespec='seconds'),
+                    'rows': len(mapped), 'questions': questions, **counts}
+        # With no delta the stored tables are already current and only the manifest is rewritten.
+        outputs = {'fingerprints': fingerprints, 'mapped': mapped, 'pivot': pivot_df} if len(stale) else {}
+        save_survey_state(state_dir, {**outputs, 'manifest': manifest})
+
+        current.set(**counts)
+        current.note(f"{counts['added']} new, {counts['changed']} changed and {counts['removed']} removed "
+                     f"(person_id, question_concept_id) groups; {counts['unchanged']} unchanged. "
+                     f"Processed {len(delta)} of {len(survey_data)} rows; state saved to: {state_dir}")
+        current.output(mapped)
+    return {'mapped': mapped, 'pivot': pivot_df, **counts}
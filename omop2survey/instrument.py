@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
+
+logger = logging.getLogger('omop2survey')
+
+SINKS = ('print', 'logging')
+
+_settings = {'sink': 'print', 'memory': False}
+_history = deque(maxlen=1000)
+_local = threading.local()
+
+
+def configure_instrumentation(sink='print', memory=False, history=1000):
+    global _history
+
+    if sink is not None and sink not in SINKS and not callable(sink):
+        raise ValueError("Unsupported sink. Please use 'print', 'logging', a callable, or None to switch it off.")
+    _settings['sink'] = sink
+    _settings['memory'] = memory
+    if history != _history.maxlen:
+        _history = deque(_history, maxlen=history)
+
+
+def stage_history(clear=False):
+    records = list(_history)
+    if clear:
+        _history.clear()
+    return records
+
+
+def row_count(data):
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return len(data)
+    return getattr(data, 'num_rows', None)
+
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.enabled = _settings['sink'] is not None
+        self.fields = {'stage': name, 'seconds': None, 'rows_in': rows_in, 'rows_out': None, 'peak_bytes': None}
+        self.messages = []
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def output(self, data):
+        self.fields['rows_out'] = row_count(data)
+        return data
+
+    def note(self, message):
+        self.messages.append(message)
+        emit_message(message)
+
+    def record(self):
+        return {**self.fields, 'messages': list(self.messages)}
+
+
+def stack():
+    if not hasattr(_local, 'stages'):
+        _local.stages = []
+    return _local.stages
+
+
+def emit_message(message):
+    sink = _settings['sink']
+    if sink == 'print':
+        print(message)
+    elif sink == 'logging':
+        logger.info(message)
+
+
+def emit_record(record):
+    _history.append(record)
+    sink = _settings['sink']
+    if sink == 'logging':
+        logger.debug("%s: %.3fs, rows %s -> %s, peak %s bytes", record['stage'], record['seconds'],
+                     record['rows_in'], record['rows_out'], record['peak_bytes'], extra={'omop2survey': record})
+    elif callable(sink):
+        sink(record)
+
+
+def note(message, **fields):
+    stages = stack()
+    if stages:
+        stages[-1].note(message)
+        stages[-1].set(**fields)
+    elif _settings['sink'] is not None:
+        emit_message(message)
+
+
+def enabled():
+    return _settings['sink'] is not None
+
+
+@contextmanager
+def stage(name, data=None):
+    current = Stage(name, row_count(data))
+    stages = stack()
+    # Peak memory is traced by the outermost stage only; tracemalloc has a single peak counter per process.
+    trace = current.enabled and _settings['memory'] and not tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.start()
+
+    stages.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as error:
+        current.set(error=repr(error))
+        raise
+    finally:
+        current.set(seconds=time.perf_counter() - start)
+        stages.pop()
+        if trace:
+            current.set(peak_bytes=tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        if current.enabled:
+            emit_record(current.record())
+
+
+def note_persons(current, data):
+    # Counting distinct people is a full pass over person_id, so it is skipped when instrumentation is off.
+    if not current.enabled:
+        return
+    if isinstance(data, pd.DataFrame) and 'person_id' in data.columns:
+        persons = data['person_id'].nunique()
+    elif not isinstance(data, pd.DataFrame) and 'person_id' in data.column_names:
+        import pyarrow.compute as pc
+        persons = pc.count_distinct(data.column('person_id')).as_py()
+    else:
+        return
+    current.set(persons=persons)
+    current.note(f"The number of unique person_ids in the dataset: {persons}")
@@ -0,0 +1,201 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from omop2survey.hash_csv import hash_csv
+from omop2survey.unique_values import map_unique, strip_text
+
+SPECIAL_CASES = {
+    903087: (-999, "Don't Know"),
+    903096: (-998, "Skip"),
+    903072: (-997, "Does Not Apply To Me"),
+    903079: (-996, "Prefer Not To Answer"),
+    903070: (-995, "Other"),
+    903092: (-994, "Not Sure"),
+    903095: (-993, "None"),
+    903103: (-992, "Unanswered"),
+    40192432: (-991, "I am not religious"),
+    40192487: (-990, "I do not believe in God (or a higher power)"),
+    40192520: (-989, "Does not apply to my neighborhood"),
+    903081: (-988, "Free Text"),
+    596889: (998, "Text"),
+    596883: (-994, "Not Sure"),
+    1332844: (-994, "Not Sure"),
+    903598: (-996, "Prefer Not To Answer"),
+    903596: (-996, "Prefer Not To Answer"),
+    903601: (-996, "Prefer Not To Answer"),
+    903607: (-996, "Prefer Not To Answer"),
+    903610: (-996, "Prefer Not To Answer"),
+    903604: (-996, "Prefer Not To Answer"),
+    43529089: (-997, "No Blood Related Daughters"),
+    43529086: (-997, "No Blood Related Siblings"),
+    43529092: (-997, "No Blood Related Sons"),
+    43529090: (-997, "No Daughters Related")
+}
+
+# Special answers apply to every question, so they are stored in the lookup under this placeholder question id.
+SPECIAL_QUESTION = -1
+
+# Bump when the stored layout of SurveyKey changes so stale compiled keys are rebuilt.
+KEY_FORMAT = 2
+
+_keys = {}
+_lock = threading.Lock()
+
+
+def survey_key_path(filename='survey_key.csv'):
+    current_dir = os.path.dirname(os.path.realpath(__file__))
+
+    file_path = os.path.join(current_dir, filename)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File path {file_path} does not exist.")
+    return file_path
+
+
+def load_survey_data(filename='survey_key.csv'):
+    return pd.read_csv(survey_key_path(filename))
+
+
+def cache_dir():
+    path = os.getenv('OMOP2SURVEY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'omop2survey'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class SurveyKey:
+    def __init__(self, survey_data, special_cases=None, digest=None):
+        if special_cases is None:
+            special_cases = SPECIAL_CASES
+
+        key = pd.DataFrame({
+            'question_concept_id': survey_data['question_concept_id'],
+            'answer_concept_id': survey_data['answer_concept_id'],
+            'answer_numeric': survey_data['answer_numeric'].astype(object),
+            'answer_text': map_unique(survey_data['answer_text'], strip_text)
+        })
+
+        special = pd.DataFrame({
+            'question_concept_id': SPECIAL_QUESTION,
+            'answer_concept_id': list(special_cases.keys()),
+            'answer_numeric': pd.Series([num for num, _ in special_cases.values()], dtype=object),
+            'answer_text': [text for _, text in special_cases.values()]
+        })
+
+        # Later rows win, the same as building the per-question dicts with dict(zip(...)).
+        lookup = pd.concat([key, special], ignore_index=True)
+        lookup = lookup.drop_duplicates(subset=['question_concept_id', 'answer_concept_id'], keep='last')
+
+        self.digest = digest
+        self.index = pd.MultiIndex.from_frame(lookup[['question_concept_id', 'answer_concept_id']])
+        self.answer_numeric = lookup['answer_numeric'].to_numpy(dtype=object)
+        self.answer_text = lookup['answer_text'].to_numpy(dtype=object)
+        self.special_ids = np.array(list(special_cases.keys()))
+
+        if 'select_all' in survey_data.columns:
+            self.select_all_questions = survey_data.loc[survey_data['select_all'] == 1, 'question_concept_id'].unique()
+        else:
+            self.select_all_questions = np.array([], dtype='int64')
+        self.select_all = frozenset(self.select_all_questions.tolist())
+
+    def __len__(self):
+        return len(self.index)
+
+    def to_payload(self):
+        # Plain JSON types only: a compiled key read back from the shared cache directory is data, never code.
+        levels = [self.index.get_level_values(i) for i in range(self.index.nlevels)]
+        return {
+            'format': KEY_FORMAT, 'digest': self.digest,
+            'index': [{'dtype': str(level.dtype), 'values': level.tolist()} for level in levels],
+            'answer_numeric': self.answer_numeric.tolist(), 'answer_text': self.answer_text.tolist(),
+            'special_ids': self.special_ids.tolist(), 'select_all_questions': self.select_all_questions.tolist()
+        }
+
+    @classmethod
+    def from_payload(cls, payload):
+        key = cls.__new__(cls)
+        key.digest = payload['digest']
+        key.index = pd.MultiIndex.from_arrays([np.array(level['values'], dtype=level['dtype'])
+                                               for level in payload['index']])
+        key.answer_numeric = np.array(payload['answer_numeric'], dtype=object)
+        key.answer_text = np.array(payload['answer_text'], dtype=object)
+        key.special_ids = np.array(payload['special_ids'], dtype='int64')
+        key.select_all_questions = np.array(payload['select_all_questions'], dtype='int64')
+        key.select_all = frozenset(key.select_all_questions.tolist())
+        return key
+
+
+def survey_key_from_mappings(special_cases, mapping_numeric, mapping_text):
+    rows = [
+        (question_id, answer_id, numeric, mapping_text.get(question_id, {}).get(answer_id, pd.NA))
+        for question_id, answers in mapping_numeric.items()
+        for answer_id, numeric in answers.items()
+    ]
+    survey_data = pd.DataFrame(rows, columns=['question_concept_id', 'answer_concept_id', 'answer_numeric',
+                                              'answer_text'])
+    survey_data['answer_text'] = survey_data['answer_text'].astype(object)
+    return SurveyKey(survey_data, special_cases)
+
+
+def compiled_key_path(digest):
+    return os.path.join(cache_dir(), f"survey_key_{digest}.json")
+
+
+def read_compiled_key(digest):
+    try:
+        with open(compiled_key_path(digest)) as f:
+            payload = json.load(f)
+        if payload.get('format') != KEY_FORMAT or payload.get('digest') != digest:
+            return None
+        return SurveyKey.from_payload(payload)
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def write_compiled_key(key):
+    try:
+        payload = json.dumps(key.to_payload())
+    except (TypeError, ValueError):
+        # Keys holding values JSON cannot represent are simply rebuilt from the CSV file each session.
+        return
+    try:
+        file_path = compiled_key_path(key.digest)
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(payload)
+        os.replace(temp_path, file_path)
+    except OSError:
+        # The compiled key is only an accelerator; a read-only home directory should not break mapping.
+        pass
+
+
+def get_survey_key(filename='survey_key.csv'):
+    file_path = survey_key_path(filename)
+    stat = os.stat(file_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        cached = _keys.get(file_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        digest = hash_csv(file_path)
+        key = read_compiled_key(digest)
+        if key is None:
+            key = SurveyKey(pd.read_csv(file_path), digest=digest)
+            write_compiled_key(key)
+
+        _keys[file_path] = (signature, key)
+        return key
+
+
+def clear_survey_key_cache(compiled=False):
+    with _lock:
+        _keys.clear()
+
+    if compiled:
+        directory = cache_dir()
+        for name in os.listdir(directory):
+            # .pkl files are compiled keys written by earlier versions.
+            if name.startswith('survey_key_') and name.endswith(('.json', '.pkl')):
+                os.remove(os.path.join(directory, name))
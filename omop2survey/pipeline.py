@@ -0,0 +1,195 @@
+import pandas as pd
+from omop2survey.backends import SURVEY_COLUMNS
+from omop2survey.key_cache import get_survey_key
+from omop2survey.response_set import apply_lookup, create_dummies, create_dummy_variables, scale, score_scales
+from omop2survey.recode_missing import recode_missing_frame
+from omop2survey.pivot_data import pivot_wide
+from omop2survey.subset import import_survey_data
+from omop2survey.table_io import read_table
+from omop2survey.instrument import stage, note_persons
+
+MAPPED_COLUMNS = {'answer_numeric', 'answer_text'}
+LOOKUP_COLUMNS = {'question_concept_id', 'answer_concept_id', 'answer'}
+DUMMY_COLUMNS = {'person_id', 'question_concept_id', 'answer_concept_id'}
+# ds_survey rows are selected DISTINCT, so a pushed-down column list keeps every column that tells rows apart.
+IDENTITY_COLUMNS = {'person_id', 'question_concept_id', 'answer_concept_id', 'answer'}
+WIDE_STEPS = ('scale', 'score_scales', 'select')
+
+
+def widens(name, params):
+    return name == 'pivot' or (name == 'create_dummies' and params.get('one_hot'))
+
+
+def format_params(params):
+    return ', '.join(f"{name}={value!r}" for name, value in params.items())
+
+
+class SurveyPipeline:
+    def __init__(self, source, steps=()):
+        if not isinstance(source, (pd.DataFrame, str, dict)):
+            raise ValueError("Unsupported data type. Please provide a file path or a pandas DataFrame.")
+        self.source = source
+        self.steps = tuple(steps)
+
+    @classmethod
+    def from_survey(cls, selection, backend=None, cache=False, question_ids=None, person_ids=None):
+        return cls({'selection': selection, 'backend': backend, 'cache': cache, 'question_ids': question_ids,
+                    'person_ids': person_ids})
+
+    @classmethod
+    def from_file(cls, file_path):
+        return cls(file_path)
+
+    def then(self, name, **params):
+        wide = any(widens(*step) for step in self.steps)
+        if wide and name not in WIDE_STEPS:
+            raise ValueError(f"{name}() cannot follow a step that returns wide data.")
+        if not wide and name in ('scale', 'score_scales'):
+            raise ValueError(f"{name}() needs wide data. Please add pivot() before it.")
+        if name == 'map_answers' and any(step == 'map_answers' for step, _ in self.steps):
+            raise ValueError("map_answers() is already part of the pipeline.")
+        return SurveyPipeline(self.source, self.steps + ((name, params),))
+
+    def map_answers(self):
+        return self.then('map_answers')
+
+    def recode_missing(self, missing_values=None):
+        return self.then('recode_missing', missing_values=missing_values)
+
+    def create_dummies(self, one_hot=False):
+        return self.then('create_dummies', one_hot=one_hot)
+
+    def create_dummy_variables(self, id_map=None):
+        return self.then('create_dummy_variables', id_map=id_map)
+
+    def pivot(self, values='answer_numeric'):
+        return self.then('pivot', values=values)
+
+    def scale(self, variables, scale_name, na=False, method='sum'):
+        return self.then('scale', variables=list(variables), scale_name=scale_name, na=na, method=method)
+
+    def score_scales(self, scales):
+        return self.then('score_scales', scales=scales)
+
+    def select(self, *columns):
+        return self.then('select', columns=list(columns))
+
+    def plan(self):
+        steps = []
+        for name, params in self.steps:
+            # Recoding straight after mapping runs on the freshly mapped columns in the same step.
+            if name == 'recode_missing' and steps and steps[-1][0] == 'map_answers':
+                steps[-1] = ('map_recode', {**steps[-1][1], **params})
+            else:
+                steps.append((name, dict(params)))
+
+        wide_from = next((i for i, step in enumerate(steps) if widens(*step)), len(steps))
+
+        # Walking backwards, each long step adds the columns it reads; None means every column is needed.
+        needed = None
+        planned = []
+        for i in reversed(range(len(steps))):
+            name, params = steps[i]
+            if i > wide_from:
+                planned.append((name, params, None))
+                continue
+
+            if name == 'select':
+                needed = set(params['columns'])
+            elif name == 'pivot':
+                needed = {'person_id', 'question_concept_id', params['values']}
+            elif name == 'create_dummies' and params['one_hot']:
+                needed = set(DUMMY_COLUMNS)
+            elif name in ('create_dummies', 'create_dummy_variables'):
+                needed = None if needed is None else needed | DUMMY_COLUMNS
+            elif name in ('map_answers', 'map_recode'):
+                params['text'] = needed is None or 'answer_text' in needed
+                needed = None if needed is None else (needed - MAPPED_COLUMNS) | LOOKUP_COLUMNS
+            planned.append((name, params, None if needed is None else sorted(needed)))
+
+        return planned[::-1], needed
+
+    def source_columns(self, needed):
+        if needed is None:
+            return None
+        if isinstance(self.source, pd.DataFrame):
+            return [col for col in self.source.columns if col in needed]
+        return [col for col in SURVEY_COLUMNS if col in needed] + sorted(needed - set(SURVEY_COLUMNS))
+
+    def describe_source(self):
+        if isinstance(self.source, pd.DataFrame):
+            return f"DataFrame ({len(self.source):,} rows)"
+        if isinstance(self.source, str):
+            return f"file {self.source}"
+        return f"survey {self.source['selection']!r}"
+
+    def explain(self):
+        steps, needed = self.plan()
+        columns = self.source_columns(needed)
+        lines = [f"SurveyPipeline: {self.describe_source()}",
+                 f"  read columns: {'all' if columns is None else ', '.join(columns)}"]
+        for i, (name, params, step_columns) in enumerate(steps, 1):
+            line = f"  {i}. {name}({format_params(params)})"
+            if step_columns is not None:
+                line += f" <- {', '.join(step_columns)}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.explain()
+
+    def load(self, needed):
+        columns = self.source_columns(needed)
+
+        if isinstance(self.source, pd.DataFrame):
+            # Only the needed columns are copied. The copy is deep, so the result never shares a column with the
+            # source and writing to it leaves the source as it was.
+            return (self.source if columns is None else self.source[columns]).copy()
+
+        if isinstance(self.source, str):
+            return read_table(self.source, columns=columns)
+
+        if columns is not None:
+            columns = [col for col in SURVEY_COLUMNS if col in needed or col in IDENTITY_COLUMNS]
+            columns = None if columns == SURVEY_COLUMNS else columns
+        return import_survey_data(self.source['selection'], backend=self.source['backend'], columns=columns,
+                                  question_ids=self.source.get('question_ids'),
+                                  person_ids=self.source.get('person_ids'), cache=self.source['cache'])
+
+    def fetch(self):
+        return self.load(self.plan()[1])
+
+    def run_step(self, name, params, data, key):
+        if name in ('map_answers', 'map_recode', 'recode_missing'):
+            with stage(name, data) as current:
+                if name != 'recode_missing':
+                    data = apply_lookup(data, key, text=params['text'])
+                if name == 'map_answers':
+                    return current.output(data)
+                return recode_missing_frame(data, params['missing_values'], inplace=True, current=current)
+        if name == 'create_dummies':
+            return create_dummies(data, one_hot=params['one_hot'])
+        if name == 'create_dummy_variables':
+            return create_dummy_variables(data, id_map=params['id_map'])
+        if name == 'pivot':
+            return pivot_wide(data, params['values'])
+        if name == 'scale':
+            return scale(data, params['variables'], params['scale_name'], na=params['na'], method=params['method'],
+                         inplace=True)
+        if name == 'score_scales':
+            return score_scales(data, params['scales'], inplace=True)
+        return data[params['columns']]
+
+    def collect(self, data=None):
+        steps, needed = self.plan()
+
+        with stage('pipeline') as current:
+            # data is the pipeline's own source as returned by fetch(), when it was loaded ahead of time.
+            data = self.load(needed) if data is None else data
+            current.set(rows_in=len(data), steps=[name for name, _, _ in steps])
+            note_persons(current, data)
+
+            key = get_survey_key() if any(name in ('map_answers', 'map_recode') for name, _, _ in steps) else None
+            for name, params, _ in steps:
+                data = self.run_step(name, params, data, key)
+            return current.output(data)
@@ -1,67 +1,180 @@
 import pandas as pd
+import numpy as np
 import os
-import subprocess
-
-
-def pivot_text(data, file_name='pivot_t.csv'):
-    pivot_df = data.pivot_table(index='person_id',
-                                columns='question_concept_id',
-                                values='answer_text',
-                                aggfunc='first')
-
-    pivot_df.columns = ['q' + str(col) for col in pivot_df.columns]
-    pivot_df.to_csv(file_name)
-    my_bucket = os.getenv('WORKSPACE_BUCKET')
-    args = ["gsutil", "cp", f"./{file_name}", f"{my_bucket}/data/"]
-    output = subprocess.run(args, capture_output=True)
-    if output.returncode == 0:
-        print(f"Pivoted dataset with text values saved and uploaded successfully to: {my_bucket}/data/{file_name}")
+from omop2survey.table_io import write_table, table_format, with_extension
+from omop2survey.upload import GCSUploader
+from omop2survey.instrument import stage
+from omop2survey.arrow_engine import check_engine, pivot_cells_arrow, to_table
+from omop2survey.artifact_cache import cached_artifact
+
+
+def pivot_cells(data, values, questions=None):
+    frame = data[['person_id', 'question_concept_id', values]]
+    frame = frame[frame.notna().all(axis=1)]
+
+    person_codes, persons = pd.factorize(frame['person_id'], sort=True)
+    if questions is None:
+        question_codes, questions = pd.factorize(frame['question_concept_id'], sort=True)
     else:
-        print("Failed to upload the file:", output.stderr.decode())
-
-
-def pivot(data, file_name='pivot_n.csv'):
-    pivot_df = data.pivot_table(index='person_id',
-                                columns='question_concept_id',
-                                values='answer_numeric',
-                                aggfunc='first')
-
-    pivot_df.columns = ['q' + str(col) for col in pivot_df.columns]
-    pivot_df.to_csv(file_name)
-    my_bucket = os.getenv('WORKSPACE_BUCKET')
-    args = ["gsutil", "cp", f"./{file_name}", f"{my_bucket}/data/"]
-    output = subprocess.run(args, capture_output=True)
-    if output.returncode == 0:
-        print(f"Pivoted dataset with numeric values saved and uploaded successfully to: {my_bucket}/data/{file_name}")
+        # A fixed question list keeps the same columns, in the same order, across separately pivoted partitions.
+        question_codes = pd.Index(questions).get_indexer(frame['question_concept_id'])
+
+    # Same rule as pivot_table(aggfunc='first'): the first non-missing value per cell wins.
+    cells = person_codes.astype(np.int64) * len(questions) + question_codes
+    first = ~pd.Series(cells).duplicated(keep='first').to_numpy()
+
+    return persons, questions, person_codes[first], question_codes[first], frame[values].iloc[first]
+
+
+def wide_frame(persons, questions, rows, cols, source):
+    cells = rows.astype(np.int64) * len(questions) + cols
+
+    if pd.api.types.is_numeric_dtype(source):
+        wide = np.full(len(persons) * len(questions), np.nan)
+        wide[cells] = source.to_numpy(dtype=np.float64)
     else:
-        print("Failed to upload the file:", output.stderr.decode())
+        wide = np.full(len(persons) * len(questions), np.nan, dtype=object)
+        wide[cells] = source.to_numpy()
+    wide = wide.reshape(len(persons), len(questions))
+
+    if pd.api.types.is_integer_dtype(source) and len(cells) == wide.size:
+        wide = wide.astype(source.dtype.numpy_dtype if hasattr(source.dtype, 'numpy_dtype') else source.dtype)
+
+    return pd.DataFrame(wide, index=pd.Index(persons, name='person_id'),
+                        columns=['q' + str(col) for col in questions])
+
+
+def pivot_wide(data, values='answer_numeric', engine='pandas', output='pandas', cache=False):
+    check_engine(engine, output)
+    with stage('pivot_wide', data) as current:
+        def compute():
+            cells = pivot_cells_arrow(data, values) if engine == 'arrow' else pivot_cells(data, values)
+            return wide_frame(*cells)
+
+        pivot_df = current.output(cached_artifact(cache, 'pivot_wide', data, {'values': values}, compute, current))
+        current.set(columns=pivot_df.shape[1])
+        return to_table(pivot_df.reset_index()) if output == 'arrow' else pivot_df
+
+
+def require_scipy():
+    try:
+        import scipy.sparse
+    except ImportError:
+        raise ImportError("Sparse pivots require the scipy package.")
+    return scipy.sparse
+
+
+def sparse_result(matrix, persons, columns, output):
+    if output == 'csr':
+        return matrix, np.asarray(persons), np.asarray(columns)
+    if output == 'pandas':
+        # Unanswered cells are missing, not zero, so the frame uses NaN as its fill value.
+        pivot_df = pd.DataFrame.sparse.from_spmatrix(matrix, index=pd.Index(persons, name='person_id'),
+                                                    columns=list(columns))
+        return pivot_df.astype(pd.SparseDtype('float64', np.nan))
+    raise ValueError("Unsupported output. Please use 'pandas' or 'csr'.")
+
+
+def pivot_sparse(data, output='pandas'):
+    sparse = require_scipy()
+    with stage('pivot_sparse', data) as current:
+        persons, questions, rows, cols, source = pivot_cells(data, 'answer_numeric')
+
+        matrix = sparse.csr_matrix((pd.to_numeric(source, errors='coerce').to_numpy(dtype=np.float64), (rows, cols)),
+                                   shape=(len(persons), len(questions)))
+        current.set(rows_out=len(persons), columns=len(questions), stored_cells=matrix.nnz)
+        return sparse_result(matrix, persons, ['q' + str(col) for col in questions], output)
+
+
+def write_sparse(pivot_data, file_path):
+    sparse = require_scipy()
+
+    with stage('write_sparse', pivot_data) as current:
+        if isinstance(pivot_data, pd.DataFrame):
+            rows, cols, vals = [], [], []
+            for j, col in enumerate(pivot_data.columns):
+                array = pivot_data[col].array
+                if isinstance(array, pd.arrays.SparseArray) and pd.isna(array.fill_value):
+                    index, values = array.sp_index.indices, array.sp_values
+                else:
+                    values = pivot_data[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                    index = np.flatnonzero(~np.isnan(values))
+                    values = values[index]
+                rows.append(index)
+                cols.append(np.full(len(index), j))
+                vals.append(values)
+            matrix = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                       shape=pivot_data.shape)
+            persons, columns = pivot_data.index.to_numpy(), pivot_data.columns.to_numpy()
+        else:
+            matrix, persons, columns = pivot_data
+            matrix = sparse.csr_matrix(matrix)
+
+        np.savez_compressed(file_path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                            shape=np.array(matrix.shape), person_id=np.asarray(persons),
+                            columns=np.asarray(columns, dtype=str))
+        current.set(file_path=file_path, stored_cells=matrix.nnz)
+    return file_path
+
+
+def read_sparse(file_path, output='pandas'):
+    sparse = require_scipy()
+
+    with stage('read_sparse') as current, np.load(file_path) as stored:
+        matrix = sparse.csr_matrix((stored['data'], stored['indices'], stored['indptr']),
+                                   shape=tuple(stored['shape']))
+        current.set(file_path=file_path, rows_out=matrix.shape[0])
+        return sparse_result(matrix, stored['person_id'], stored['columns'].tolist(), output)
+
+
+def upload_pivot(current, pivot_df, file_name, file_format, uploader, label):
+    file_format = table_format(file_name, file_format)
+    file_name = with_extension(file_name, file_format)
+    if uploader is None:
+        uploader = GCSUploader()
+
+    # A local copy is still written to the working directory, in the same pass as the upload.
+    result = uploader.write_table(pivot_df, file_name, file_format, local_path=file_name)
+    current.output(pivot_df)
+    current.set(columns=pivot_df.shape[1], destination=result['destination'], bytes=result['bytes'])
+    current.note(f"Pivoted dataset with {label} values saved and uploaded successfully to: {result['destination']}")
+
+
+def pivot_text(data, file_name='pivot_t.csv', file_format=None, uploader=None, engine='pandas', cache=False):
+    with stage('pivot_text', data) as current:
+        pivot_df = pivot_wide(data, 'answer_text', engine=engine, cache=cache)
+        upload_pivot(current, pivot_df, file_name, file_format, uploader, 'text')
 
-def pivot_local(data, file_name='pivot_n.csv'):
-    pivot_df = data.pivot_table(index='person_id',
-                                columns='question_concept_id',
-                                values='answer_numeric',
-                                aggfunc='first')
 
-    pivot_df.columns = ['q' + str(col) for col in pivot_df.columns]
-    workspace_dir = os.path.join(os.getcwd(), 'workspace')
-    os.makedirs(workspace_dir, exist_ok=True)
-    file_path = os.path.join(workspace_dir, file_name)
+def pivot(data, file_name='pivot_n.csv', file_format=None, uploader=None, engine='pandas', cache=False):
+    with stage('pivot', data) as current:
+        pivot_df = pivot_wide(data, 'answer_numeric', engine=engine, cache=cache)
+        upload_pivot(current, pivot_df, file_name, file_format, uploader, 'numeric')
 
-    pivot_df.to_csv(file_path)
+def pivot_local(data, file_name='pivot_n.csv', file_format=None, engine='pandas', cache=False):
+    with stage('pivot_local', data) as current:
+        pivot_df = current.output(pivot_wide(data, 'answer_numeric', engine=engine, cache=cache))
+        file_format = table_format(file_name, file_format)
+        file_name = with_extension(file_name, file_format)
+        workspace_dir = os.path.join(os.getcwd(), 'workspace')
+        os.makedirs(workspace_dir, exist_ok=True)
+        file_path = os.path.join(workspace_dir, file_name)
 
-    print(f"Pivoted dataset with numeric values saved successfully to: {file_path}")
+        write_table(pivot_df, file_path, file_format)
 
+        current.set(columns=pivot_df.shape[1], file_path=file_path)
+        current.note(f"Pivoted dataset with numeric values saved successfully to: {file_path}")
 
-def pivot_text_local(data, file_name='pivot_t.csv'):
-    pivot_df = data.pivot_table(index='person_id',
-                                columns='question_concept_id',
-                                values='answer_text',
-                                aggfunc='first')
 
-    pivot_df.columns = ['q' + str(col) for col in pivot_df.columns]
-    workspace_dir = os.path.join(os.getcwd(), 'workspace')
-    os.makedirs(workspace_dir, exist_ok=True)
-    file_path = os.path.join(workspace_dir, file_name)
-    pivot_df.to_csv(file_path)
+def pivot_text_local(data, file_name='pivot_t.csv', file_format=None, engine='pandas', cache=False):
+    with stage('pivot_text_local', data) as current:
+        pivot_df = current.output(pivot_wide(data, 'answer_text', engine=engine, cache=cache))
+        file_format = table_format(file_name, file_format)
+        file_name = with_extension(file_name, file_format)
+        workspace_dir = os.path.join(os.getcwd(), 'workspace')
+        os.makedirs(workspace_dir, exist_ok=True)
+        file_path = os.path.join(workspace_dir, file_name)
+        write_table(pivot_df, file_path, file_format)
 
-    print(f"Pivoted dataset with text values saved successfully to: {file_path}")
+        current.set(columns=pivot_df.shape[1], file_path=file_path)
+        current.note(f"Pivoted dataset with text values saved successfully to: {file_path}")
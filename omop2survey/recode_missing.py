@@ -1,98 +1,183 @@
+import numpy as np
 import pandas as pd
+from omop2survey.instrument import stage
+from omop2survey.arrow_engine import check_engine, is_table, to_table, numeric_masks, recode_table
 
-def recode_items(input_data):
-    missing_values = [-999, -998, -997, -996, -995, -994, -993, -992, -991, -990,
-                      -989, -988, -987, -986, -985, -984, -983, -982, -981, -980]
+MISSING_VALUES = [-999, -998, -997, -996, -995, -994, -993, -992, -991, -990,
+                  -989, -988, -987, -986, -985, -984, -983, -982, -981, -980]
 
-    if isinstance(input_data, str):
-        if input_data.endswith('.csv') or input_data.endswith('.txt'):
-            return pd.read_csv(input_data, na_values=missing_values)
-        elif input_data.endswith(('.xlsx', '.xls')):
-            return pd.read_excel(input_data, na_values=missing_values)
-        else:
-            raise ValueError("Unsupported file type. Please provide a .csv, .txt, or .xlsx file.")
-    elif isinstance(input_data, pd.DataFrame):
-        input_data.replace(missing_values, pd.NA, inplace=True)
-        return input_data
-    else:
-        raise ValueError("Unsupported data type. Please provide a file path or a pandas DataFrame.")
+NUMERIC_KINDS = ('integer', 'floating', 'mixed-integer-float', 'decimal')
 
 
-def recode(input_data):
-    missing_values = [-999, -998, -997, -996, -995, -994, -993, -992, -991, -990,
-                      -989, -988, -987, -986, -985, -984, -983, -982, -981, -980]
-
+def load_input(input_data, missing_values):
     if isinstance(input_data, str):
         if input_data.endswith('.csv') or input_data.endswith('.txt'):
-            data = pd.read_csv(input_data, na_values=missing_values)
+            return pd.read_csv(input_data, na_values=missing_values), True
         elif input_data.endswith(('.xlsx', '.xls')):
-            data = pd.read_excel(input_data, na_values=missing_values)
+            return pd.read_excel(input_data, na_values=missing_values), True
         else:
             raise ValueError("Unsupported file type. Please provide a .csv, .txt, or .xlsx file.")
-    elif isinstance(input_data, pd.DataFrame):
-        data = input_data.copy()
-        data.replace(missing_values, pd.NA, inplace=True)
+    elif isinstance(input_data, pd.DataFrame) or is_table(input_data):
+        return input_data, False
     else:
         raise ValueError("Unsupported data type. Please provide a file path or a pandas DataFrame.")
 
-    for col in data.columns:
-        data[col] = data[col].apply(lambda x: x[0] if isinstance(x, list) and len(x) == 1 else x)
-
-    return data
-
-def recode_missing(input_data):
-    missing_values = [-999, -998, -997, -996, -995, -994, -993, -992, -991, -990,
-                      -989, -988, -987, -986, -985, -984, -983, -982, -981, -980]
-
-    if isinstance(input_data, str):
-        if input_data.endswith('.csv') or input_data.endswith('.txt'):
-            data = pd.read_csv(input_data, na_values=missing_values)
-        elif input_data.endswith(('.xlsx', '.xls')):
-            data = pd.read_excel(input_data, na_values=missing_values)
-        else:
-            raise ValueError("Unsupported file type. Please provide a .csv, .txt, or .xlsx file.")
-    elif isinstance(input_data, pd.DataFrame):
-        data = input_data.copy()
-        data.replace(missing_values, pd.NA, inplace=True)
-    else:
-        raise ValueError("Unsupported data type. Please provide a file path or a pandas DataFrame.")
 
-    # Ensure no lists in columns by creating a new column and replacing the original
+def unwrap_lists(values, lists):
+    is_list = np.fromiter((isinstance(x, list) for x in values), dtype=bool, count=len(values))
+    if not is_list.any():
+        return values
+
+    values = values.copy()
+    for i in np.flatnonzero(is_list):
+        item = values[i]
+        if lists == 'first':
+            values[i] = item[0] if item else pd.NA
+        elif len(item) == 1:
+            values[i] = item[0]
+    return values
+
+
+def to_numeric_column(values):
+    numeric = pd.to_numeric(pd.Series(values), errors='coerce')
+    # Whole-number columns become nullable integers rather than floats, so codes stay 1, 2, 3 and not 1.0, 2.0, 3.0.
+    if numeric.dtype.kind == 'f':
+        finite = numeric.to_numpy()[~np.isnan(numeric.to_numpy())]
+        if np.array_equal(finite, np.round(finite)):
+            return numeric.astype('Int64').array
+    return numeric.array
+
+
+def recode_column(column, codes, lists=None, coerce=False, normalize_na=False, mask=None):
+    if pd.api.types.is_bool_dtype(column):
+        return None
+
+    changed = False
+    if column.dtype == object:
+        values = column.to_numpy()
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if lists is not None and kind in ('mixed', 'mixed-integer'):
+            unwrapped = unwrap_lists(values, lists)
+            if unwrapped is not values:
+                values, changed = unwrapped, True
+                kind = pd.api.types.infer_dtype(values, skipna=True)
+
+        if kind not in NUMERIC_KINDS and not coerce:
+            # Text columns are never compared against the codes; at most NaN/None is turned into pd.NA.
+            if normalize_na:
+                missing = pd.isna(values)
+                if missing.any():
+                    values = values if changed else values.copy()
+                    values[missing] = pd.NA
+                    changed = True
+            return pd.Series(values, index=column.index) if changed else None
+
+        column = pd.Series(to_numeric_column(values), index=column.index)
+        changed = True
+    elif not pd.api.types.is_numeric_dtype(column):
+        return None
+
+    if mask is None:
+        mask = column.isin(codes).to_numpy()
+    if not mask.any():
+        return column if changed else None
+
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iu':
+        # The masked array reuses the integer buffer, so recoding an integer column does not copy it.
+        return pd.Series(pd.arrays.IntegerArray(column.to_numpy(), mask), index=column.index)
+    return column.mask(mask)
+
+
+def plain_numeric(column):
+    return isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iuf'
+
+
+def recode_frame(data, missing_values=None, inplace=False, lists=None, coerce_columns=(), normalize_na=False,
+                 current=None, engine='pandas', output='pandas'):
+    if missing_values is None:
+        missing_values = MISSING_VALUES
+    codes = list(missing_values)
+
+    if is_table(data):
+        if engine == 'arrow':
+            # Arrow tables are recoded column by column in Arrow; list columns are left as they are.
+            data, changed = recode_table(data, codes, coerce_columns, normalize_na, output)
+            if current is not None:
+                current.set(recoded_columns=changed)
+                current.output(data)
+            return data
+        data, inplace = data.to_pandas(), True
+
+    # With the arrow engine, plain numeric columns are matched against the codes in Arrow on worker threads;
+    # object columns keep the pandas rules so the results are the same.
+    masks = {}
+    if engine == 'arrow':
+        masks = numeric_masks(data, [col for col in data.columns if plain_numeric(data[col])], codes)
+
+    if not inplace:
+        # A deep copy, so writing to the returned frame never reaches the caller's columns; only inplace=True
+        # shares them.
+        data = data.copy()
+
+    changed = []
     for col in data.columns:
-        if data[col].apply(lambda x: isinstance(x, list)).any():
-            new_col = data[col].apply(lambda x: x[0] if isinstance(x, list) else (pd.NA if pd.isna(x) else x))
-            data[col] = new_col
-        else:
-            new_col = data[col].apply(lambda x: pd.NA if pd.isna(x) else x)
-            data[col] = new_col
-
-    # Special handling for answer_numeric column to ensure it's fully numeric
-    if 'answer_numeric' in data.columns:
-        # Convert lists in answer_numeric to their first element, or NA if empty
-        data['answer_numeric'] = data['answer_numeric'].apply(lambda x: x[0] if isinstance(x, list) else x)
-        # Convert to numeric, coercing errors to NaN
-        data['answer_numeric'] = pd.to_numeric(data['answer_numeric'], errors='coerce')
-
+        recoded = recode_column(data[col], codes, lists=lists, coerce=col in coerce_columns,
+                                normalize_na=normalize_na, mask=masks.get(col))
+        if recoded is not None:
+            data[col] = recoded
+            changed.append(col)
+
+    if output == 'arrow':
+        data = to_table(data)
+    if current is not None:
+        current.set(rows_in=len(data), recoded_columns=changed)
+        current.output(data)
     return data
 
-def recode_values(input_data):
-    missing_values = [-999, -998, -997, -996, -995, -994, -993, -992, -991, -990,
-                      -989, -988, -987, -986, -985, -984, -983, -982, -981, -980]
 
-    if isinstance(input_data, str):
-        if input_data.endswith('.csv') or input_data.endswith('.txt'):
-            data = pd.read_csv(input_data, na_values=missing_values)
-        elif input_data.endswith(('.xlsx', '.xls')):
-             data = pd.read_excel(input_data, na_values=missing_values)
-        else:
-            raise ValueError("Unsupported file type. Please provide a .csv, .txt, or .xlsx file.")
-    elif isinstance(input_data, pd.DataFrame):
-        data = input_data.copy()
-        data.replace(missing_values, pd.NA, inplace=True)
-    else:
-        raise ValueError("Unsupported data type. Please provide a file path or a pandas DataFrame.")
-
-    for col in data.columns:
-        data[col] = data[col].apply(lambda x: x[0] if isinstance(x, list) and len(x) == 1 else x)
-
-    return data
+def recode_items(input_data, missing_values=None, engine='pandas', output='pandas'):
+    check_engine(engine, output)
+    if missing_values is None:
+        missing_values = MISSING_VALUES
+
+    with stage('recode_items', input_data) as current:
+        data, from_file = load_input(input_data, missing_values)
+        if from_file:
+            return current.output(to_table(data) if output == 'arrow' else data)
+        return recode_frame(data, missing_values, inplace=True, current=current, engine=engine, output=output)
+
+
+def recode(input_data, missing_values=None, inplace=False, engine='pandas', output='pandas'):
+    check_engine(engine, output)
+    if missing_values is None:
+        missing_values = MISSING_VALUES
+
+    with stage('recode', input_data) as current:
+        data, from_file = load_input(input_data, missing_values)
+        return recode_frame(data, missing_values, inplace=inplace or from_file, lists='single', current=current,
+                            engine=engine, output=output)
+
+def recode_missing_frame(data, missing_values=None, inplace=False, current=None, engine='pandas', output='pandas'):
+    # answer_numeric is always made numeric; text left in it (e.g. from free-text answers) becomes missing.
+    return recode_frame(data, missing_values, inplace=inplace, lists='first', coerce_columns=('answer_numeric',),
+                        normalize_na=True, current=current, engine=engine, output=output)
+
+def recode_missing(input_data, missing_values=None, inplace=False, engine='pandas', output='pandas'):
+    check_engine(engine, output)
+    if missing_values is None:
+        missing_values = MISSING_VALUES
+
+    with stage('recode_missing', input_data) as current:
+        data, from_file = load_input(input_data, missing_values)
+        return recode_missing_frame(data, missing_values, inplace=inplace or from_file, current=current,
+                                    engine=engine, output=output)
+
+def recode_values(input_data, missing_values=None, inplace=False, engine='pandas', output='pandas'):
+    check_engine(engine, output)
+    if missing_values is None:
+        missing_values = MISSING_VALUES
+
+    with stage('recode_values', input_data) as current:
+        data, from_file = load_input(input_data, missing_values)
+        return recode_frame(data, missing_values, inplace=inplace or from_file, lists='single', current=current,
+                            engine=engine, output=output)
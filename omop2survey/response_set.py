@@ -1,464 +1,378 @@
 import pandas as pd
-import os
 from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import multiprocessing
 import warnings
+import atexit
+import numbers
+import time
+from omop2survey.key_cache import (SPECIAL_QUESTION, SPECIAL_CASES, load_survey_data, get_survey_key,
+                                   survey_key_from_mappings)
+from omop2survey.compact import compact_report
+from omop2survey.instrument import stage, note_persons
+from omop2survey.arrow_engine import check_engine, map_arrow, to_table
+from omop2survey.artifact_cache import cached_artifact
+from omop2survey.unique_values import unique_mask, map_unique
 
 warnings.filterwarnings('ignore')
 
-def load_survey_data(filename='survey_key.csv'):
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-
-    file_path = os.path.join(current_dir, filename)
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File path {file_path} does not exist.")
-    return pd.read_csv(file_path)
-
-
-def map_responses(input_data):
-    special_cases = {
-        903087: (-999, "Don't Know"),
-        903096: (-998, "Skip"),
-        903072: (-997, "Does Not Apply To Me"),
-        903079: (-996, "Prefer Not To Answer"),
-        903070: (-995, "Other"),
-        903092: (-994, "Not Sure"),
-        903095: (-993, "None"),
-        903103: (-992, "Unanswered"),
-        40192432: (-991, "I am not religious"),
-        40192487: (-990, "I do not believe in God (or a higher power)"),
-        40192520: (-989, "Does not apply to my neighborhood"),
-        903081: (-988, "Free Text"),
-        596889: (998, "Text"),
-        596883: (-994, "Not Sure"),
-        1332844: (-994, "Not Sure"),
-        903598: (-996, "Prefer Not To Answer"),
-        903596: (-996, "Prefer Not To Answer"),
-        903601: (-996, "Prefer Not To Answer"),
-        903607: (-996, "Prefer Not To Answer"),
-        903610: (-996, "Prefer Not To Answer"),
-        903604: (-996, "Prefer Not To Answer"),
-        43529089: (-997, "No Blood Related Daughters"),
-        43529086: (-997, "No Blood Related Siblings"),
-        43529092: (-997, "No Blood Related Sons"),
-        43529090: (-997, "No Daughters Related")
-    }
-    survey_data = load_survey_data()
-
-    mapping_numeric = survey_data.groupby('question_concept_id').apply(
-        lambda x: dict(zip(x['answer_concept_id'], x['answer_numeric']))).to_dict()
-
-    mapping_text = survey_data.groupby('question_concept_id').apply(
-        lambda x: dict(zip(x['answer_concept_id'], x['answer_text'].str.strip()))).to_dict()
-
-    input_data['answer_numeric'] = None
-    input_data['answer_text'] = None
-
-    for idx, row in input_data.iterrows():
-        question_id = row['question_concept_id']
-        answer_id = row['answer_concept_id']
-        if answer_id in special_cases:
-            input_data.at[idx, 'answer_numeric'], input_data.at[idx, 'answer_text'] = special_cases[answer_id]
-        else:
-            input_data.at[idx, 'answer_numeric'] = mapping_numeric.get(question_id, {}).get(answer_id, None)
-            input_data.at[idx, 'answer_text'] = mapping_text.get(question_id, {}).get(answer_id, None)
+# Below this many rows process_answers maps serially; starting workers costs more than it saves.
+PARALLEL_MIN_ROWS = 200000
+MIN_CHUNK_ROWS = 50000
 
-        if pd.isna(answer_id) and pd.notna(row['answer']) and str(row['answer']).isdigit():
-            input_data.at[idx, 'answer_numeric'] = int(row['answer'])
-            input_data.at[idx, 'answer_text'] = str(row['answer'])
+_pool = None
+_pool_workers = None
 
-        if isinstance(input_data.at[idx, 'answer_text'], (int, float)):
-            input_data.at[idx, 'answer_text'] = str(input_data.at[idx, 'answer_text'])
+def lookup_indexer(input_data, key):
+    answer_ids = input_data['answer_concept_id']
 
-    print(f"The number of unique person_ids in the dataset: {input_data['person_id'].nunique()}")
-    return input_data
+    question_ids = np.where(answer_ids.isin(key.special_ids), SPECIAL_QUESTION, input_data['question_concept_id'])
+    indexer = key.index.get_indexer(pd.MultiIndex.from_arrays([question_ids, answer_ids.to_numpy()]))
+
+    # Answers without a concept id that are plain digits are taken as the numeric answer itself.
+    digits = unique_mask(input_data['answer'], lambda answer: str(answer).isdigit())
+    numeric_mask = answer_ids.isna().to_numpy() & digits
+    return indexer, numeric_mask
+
+
+def apply_lookup(input_data, key, na_value=pd.NA, text=True):
+    indexer, numeric_mask = lookup_indexer(input_data, key)
+    answers = input_data['answer']
 
-def map_questions(input_data):
-    special_cases = {
-        903087: (-999, "Don't Know"),
-        903096: (-998, "Skip"),
-        903072: (-997, "Does Not Apply To Me"),
-        903079: (-996, "Prefer Not To Answer"),
-        903070: (-995, "Other"),
-        903092: (-994, "Not Sure"),
-        903095: (-993, "None"),
-        903103: (-992, "Unanswered"),
-        40192432: (-991, "I am not religious"),
-        40192487: (-990, "I do not believe in God (or a higher power)"),
-        40192520: (-989, "Does not apply to my neighborhood"),
-        903081: (-988, "Free Text"),
-        596889: (998, "Text"),
-        596883: (-994, "Not Sure"),
-        1332844: (-994, "Not Sure"),
-        903598: (-996, "Prefer Not To Answer"),
-        903596: (-996, "Prefer Not To Answer"),
-        903601: (-996, "Prefer Not To Answer"),
-        903607: (-996, "Prefer Not To Answer"),
-        903610: (-996, "Prefer Not To Answer"),
-        903604: (-996, "Prefer Not To Answer"),
-        43529089: (-997, "No Blood Related Daughters"),
-        43529086: (-997, "No Blood Related Siblings"),
-        43529092: (-997, "No Blood Related Sons"),
-        43529090: (-997, "No Daughters Related")
-    }
-
-    survey_data = load_survey_data()
-
-    mapping_numeric = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_numeric'].to_dict()
-    ).to_dict()
-
-    mapping_text = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_text'].str.strip().to_dict()
-    ).to_dict()
-
-    input_data['answer_numeric'] = pd.NA
-    input_data['answer_text'] = pd.NA
-
-    for answer_id, (num, text) in special_cases.items():
-        mask = input_data['answer_concept_id'] == answer_id
-        input_data.loc[mask, 'answer_numeric'] = num
-        input_data.loc[mask, 'answer_text'] = text
-
-    def apply_mappings(row):
-        if pd.notna(row['answer_numeric']) and pd.notna(row['answer_text']):
-            return row
-
-        question_id = row['question_concept_id']
-        answer_id = row['answer_concept_id']
-        numeric = mapping_numeric.get(question_id, {}).get(answer_id, pd.NA)
-        text = mapping_text.get(question_id, {}).get(answer_id, pd.NA)
-        row['answer_numeric'] = numeric
-        row['answer_text'] = text
-        return row
-
-    input_data = input_data.apply(apply_mappings, axis=1)
-
-    numeric_mask = pd.isna(input_data['answer_concept_id']) & input_data['answer'].apply(lambda x: str(x).isdigit())
-    input_data.loc[numeric_mask, 'answer_numeric'] = input_data.loc[numeric_mask, 'answer'].astype(int)
-    input_data.loc[numeric_mask, 'answer_text'] = input_data.loc[numeric_mask, 'answer'].astype(str)
-
-    print(f"The number of unique person_ids in the dataset: {input_data['person_id'].nunique()}")
+    # A trailing NA slot lets unmatched rows (indexer == -1) pick up the missing value in the same take.
+    answer_numeric = np.append(key.answer_numeric, na_value)[indexer]
+    answer_numeric[numeric_mask] = map_unique(answers[numeric_mask], lambda answer: int(str(answer))).to_numpy()
+    input_data['answer_numeric'] = answer_numeric
+
+    if text:
+        answer_text = np.append(key.answer_text, na_value)[indexer]
+        answer_text[numeric_mask] = map_unique(answers[numeric_mask], str).to_numpy()
+        input_data['answer_text'] = answer_text
     return input_data
 
 
-def create_dummies(user_data):
-    question_key = load_survey_data()
+def map_with(input_data, key, na_value, engine, output):
+    if engine == 'arrow':
+        return map_arrow(input_data, key, na_value, output=output)
+    input_data = apply_lookup(input_data, key, na_value=na_value)
+    return to_table(input_data) if output == 'arrow' else input_data
 
-    select_all_questions = question_key[question_key['select_all'] == 1]['question_concept_id'].unique()
 
-    new_rows = []
+def map_responses(input_data, compact=False, engine='pandas', output='pandas'):
+    check_engine(engine, output, compact)
+    with stage('map_responses', input_data) as current:
+        input_data = compact_report(map_with(input_data, get_survey_key(), None, engine, output), compact)
 
-    for question_id in select_all_questions:
-        select_all_data = user_data[user_data['question_concept_id'] == question_id]
-        for index, row in select_all_data.iterrows():
-            new_row = row.copy()
-            new_row[
-                'question_concept_id'] = f"{question_id}_{row['answer_concept_id']}"
-            new_rows.append(new_row)
+        note_persons(current, input_data)
+        return current.output(input_data)
 
-    new_rows_df = pd.DataFrame(new_rows)
-    filtered_data = user_data[~user_data['question_concept_id'].isin(select_all_questions)]
-    result_data = pd.concat([filtered_data, new_rows_df], ignore_index=True)
+def map_questions(input_data, compact=False, engine='pandas', output='pandas'):
+    check_engine(engine, output, compact)
+    with stage('map_questions', input_data) as current:
+        input_data = compact_report(map_with(input_data, get_survey_key(), pd.NA, engine, output), compact)
 
-    return result_data
+        note_persons(current, input_data)
+        return current.output(input_data)
 
-def create_dummy_variables(user_data):
-    question_key = load_survey_data()
 
-    select_all_questions = question_key[question_key['select_all'] == 1]['question_concept_id'].unique()
+def expand_select_all(user_data, select_all_questions):
+    mask = user_data['question_concept_id'].isin(select_all_questions).to_numpy()
+    selected = user_data[mask]
 
-    id_map = {}
-    new_id_start = user_data['question_concept_id'].max() + 1
-    new_rows = []
+    # Keep the survey key's question order, then row order within each question.
+    question_pos = pd.Index(select_all_questions).get_indexer(selected['question_concept_id'])
+    order = np.argsort(question_pos, kind='stable')
+    selected = selected.iloc[order]
+    question_pos = question_pos[order]
 
-    for question_id in select_all_questions:
-        select_all_data = user_data[user_data['question_concept_id'] == question_id]
-        for index, row in select_all_data.iterrows():
-            combined_key = f"{question_id}_{row['answer_concept_id']}"
-            if combined_key not in id_map:
-                id_map[combined_key] = new_id_start
-                new_id_start += 1
-            new_row = row.copy()
-            new_row['question_concept_id'] = id_map[combined_key]
-            new_rows.append(new_row)
-
-    new_rows_df = pd.DataFrame(new_rows)
-    filtered_data = user_data[~user_data['question_concept_id'].isin(select_all_questions)]
-
-    result_data = pd.concat([filtered_data, new_rows_df], ignore_index=True)
-
-    return result_data
-
-
-def scale(data, variables, scale_name, na=False, method='sum'):
-    df = data[['person_id'] + variables]
-
-    if na:
-        df['valid_count'] = df[variables].apply(lambda x: x[x >= 0].count(), axis=1)
-        min_valid_count = len(variables) * 0.8
-        df = df[df['valid_count'] >= min_valid_count]
-    else:
-        df = df.dropna(subset=variables)
-        df = df[(df[variables] >= 0).all(axis=1)]
-
-    if method == 'mean':
-        df[scale_name] = df[variables].mean(axis=1)
-    elif method == 'sum':
-        df[scale_name] = df[variables].sum(axis=1)
-
-    data = pd.merge(data, df[['person_id', scale_name]], on='person_id', how='left')
-
-    print('Minimum score calculated:', df[scale_name].min())
-    print('Maximum score calculated:', df[scale_name].max())
-    print('Number of person_ids with NaN assigned:', data[scale_name].isna().sum())
-    print('Number of person_ids with score calculated:', data[scale_name].notna().sum())
-
-    return data
-
-def map_answers(input_data):
-    special_cases = {
-        903087: (-999, "Don't Know"),
-        903096: (-998, "Skip"),
-        903072: (-997, "Does Not Apply To Me"),
-        903079: (-996, "Prefer Not To Answer"),
-        903070: (-995, "Other"),
-        903092: (-994, "Not Sure"),
-        903095: (-993, "None"),
-        903103: (-992, "Unanswered"),
-        40192432: (-991, "I am not religious"),
-        40192487: (-990, "I do not believe in God (or a higher power)"),
-        40192520: (-989, "Does not apply to my neighborhood"),
-        903081: (-988, "Free Text"),
-        596889: (998, "Text"),
-        596883: (-994, "Not Sure"),
-        1332844: (-994, "Not Sure"),
-        903598: (-996, "Prefer Not To Answer"),
-        903596: (-996, "Prefer Not To Answer"),
-        903601: (-996, "Prefer Not To Answer"),
-        903607: (-996, "Prefer Not To Answer"),
-        903610: (-996, "Prefer Not To Answer"),
-        903604: (-996, "Prefer Not To Answer"),
-        43529089: (-997, "No Blood Related Daughters"),
-        43529086: (-997, "No Blood Related Siblings"),
-        43529092: (-997, "No Blood Related Sons"),
-        43529090: (-997, "No Daughters Related")
-    }
-
-    survey_data = load_survey_data()
-
-    mapping_numeric = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_numeric'].to_dict()
-    ).to_dict()
-
-    mapping_text = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_text'].str.strip().to_dict()
-    ).to_dict()
-
-    input_data['answer_numeric'] = pd.NA
-    input_data['answer_text'] = pd.NA
-
-    for answer_id, (num, text) in special_cases.items():
-        mask = input_data['answer_concept_id'] == answer_id
-        input_data.loc[mask, 'answer_numeric'] = num
-        input_data.loc[mask, 'answer_text'] = text
-
-    def apply_mappings(row):
-        if pd.notna(row['answer_numeric']) and pd.notna(row['answer_text']):
-            return row['answer_numeric'], row['answer_text']
-
-        question_id = row['question_concept_id']
-        answer_id = row['answer_concept_id']
-        numeric = mapping_numeric.get(question_id, {}).get(answer_id, pd.NA)
-        text = mapping_text.get(question_id, {}).get(answer_id, pd.NA)
-        return numeric, text
-
-    result = input_data.apply(apply_mappings, axis=1, result_type='expand')
-    input_data[['answer_numeric', 'answer_text']] = result
-
-    numeric_mask = pd.isna(input_data['answer_concept_id']) & input_data['answer'].apply(lambda x: str(x).isdigit())
-    input_data.loc[numeric_mask, 'answer_numeric'] = input_data.loc[numeric_mask, 'answer'].astype(int)
-    input_data.loc[numeric_mask, 'answer_text'] = input_data.loc[numeric_mask, 'answer'].astype(str)
-
-    print(f"The number of unique person_ids in the dataset: {input_data['person_id'].nunique()}")
-    return input_data
+    answer_codes, answers = pd.factorize(selected['answer_concept_id'], use_na_sentinel=False)
+    num_answers = max(len(answers), 1)
+    pair_codes, pairs = pd.factorize(question_pos.astype(np.int64) * num_answers + answer_codes)
 
-def map_items(input_data):
-    special_cases = {
-        903087: (-999, "Don't Know"),
-        903096: (-998, "Skip"),
-        903072: (-997, "Does Not Apply To Me"),
-        903079: (-996, "Prefer Not To Answer"),
-        903070: (-995, "Other"),
-        903092: (-994, "Not Sure"),
-        903095: (-993, "None"),
-        903103: (-992, "Unanswered"),
-        40192432: (-991, "I am not religious"),
-        40192487: (-990, "I do not believe in God (or a higher power)"),
-        40192520: (-989, "Does not apply to my neighborhood"),
-        903081: (-988, "Free Text"),
-        596889: (998, "Text"),
-        596883: (-994, "Not Sure"),
-        1332844: (-994, "Not Sure"),
-        903598: (-996, "Prefer Not To Answer"),
-        903596: (-996, "Prefer Not To Answer"),
-        903601: (-996, "Prefer Not To Answer"),
-        903607: (-996, "Prefer Not To Answer"),
-        903610: (-996, "Prefer Not To Answer"),
-        903604: (-996, "Prefer Not To Answer"),
-        43529089: (-997, "No Blood Related Daughters"),
-        43529086: (-997, "No Blood Related Siblings"),
-        43529092: (-997, "No Blood Related Sons"),
-        43529090: (-997, "No Daughters Related")
-    }
-
-    survey_data = load_survey_data()
-
-    mapping_numeric = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_numeric'].to_dict()
-    ).to_dict()
-
-    mapping_text = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_text'].str.strip().to_dict()
-    ).to_dict()
-
-    input_data['answer_numeric'] = pd.NA
-    input_data['answer_text'] = pd.NA
-
-    for answer_id, (num, text) in special_cases.items():
-        mask = input_data['answer_concept_id'] == answer_id
-        input_data.loc[mask, 'answer_numeric'] = num
-        input_data.loc[mask, 'answer_text'] = text
-
-    def apply_mappings(row):
-        if pd.notna(row['answer_numeric']) and pd.notna(row['answer_text']):
-            return row['answer_numeric'], row['answer_text']
-
-        question_id = row['question_concept_id']
-        answer_id = row['answer_concept_id']
-        numeric = mapping_numeric.get(question_id, {}).get(answer_id, pd.NA)
-        text = mapping_text.get(question_id, {}).get(answer_id, pd.NA)
-        return numeric, text
-
-    input_data[['answer_numeric', 'answer_text']] = input_data.apply(
-        lambda row: pd.Series(apply_mappings(row)), axis=1
-    )
-
-    numeric_mask = pd.isna(input_data['answer_concept_id']) & input_data['answer'].apply(lambda x: str(x).isdigit())
-    input_data.loc[numeric_mask, 'answer_numeric'] = input_data.loc[numeric_mask, 'answer'].astype(int)
-    input_data.loc[numeric_mask, 'answer_text'] = input_data.loc[numeric_mask, 'answer'].astype(str)
-
-    print(f"The number of unique person_ids in the dataset: {input_data['person_id'].nunique()}")
-    return input_data
+    # Labels are only formatted once per distinct (question, answer) pair.
+    pair_keys = [f"{select_all_questions[pair // num_answers]}_{answers[pair % num_answers]}" for pair in pairs]
 
-def map_answers_chunk(chunk, special_cases, mapping_numeric, mapping_text):
-    chunk['answer_numeric'] = pd.NA
-    chunk['answer_text'] = pd.NA
-
-    for answer_id, (num, text) in special_cases.items():
-        mask = chunk['answer_concept_id'] == answer_id
-        chunk.loc[mask, 'answer_numeric'] = num
-        chunk.loc[mask, 'answer_text'] = text
-
-    def apply_mappings(row):
-        if pd.notna(row['answer_numeric']) and pd.notna(row['answer_text']):
-            return row['answer_numeric'], row['answer_text']
-
-        question_id = row['question_concept_id']
-        answer_id = row['answer_concept_id']
-        numeric = mapping_numeric.get(question_id, {}).get(answer_id, pd.NA)
-        text = mapping_text.get(question_id, {}).get(answer_id, pd.NA)
-        return numeric, text
-
-    result = chunk.apply(apply_mappings, axis=1, result_type='expand')
-    chunk[['answer_numeric', 'answer_text']] = result
-
-    numeric_mask = pd.isna(chunk['answer_concept_id']) & chunk['answer'].apply(lambda x: str(x).isdigit())
-    chunk.loc[numeric_mask, 'answer_numeric'] = chunk.loc[numeric_mask, 'answer'].astype(int)
-    chunk.loc[numeric_mask, 'answer_text'] = chunk.loc[numeric_mask, 'answer'].astype(str)
-
-    return chunk
-
-def process_answers(input_data):
-    special_cases = {
-        903087: (-999, "Don't Know"),
-        903096: (-998, "Skip"),
-        903072: (-997, "Does Not Apply To Me"),
-        903079: (-996, "Prefer Not To Answer"),
-        903070: (-995, "Other"),
-        903092: (-994, "Not Sure"),
-        903095: (-993, "None"),
-        903103: (-992, "Unanswered"),
-        40192432: (-991, "I am not religious"),
-        40192487: (-990, "I do not believe in God (or a higher power)"),
-        40192520: (-989, "Does not apply to my neighborhood"),
-        903081: (-988, "Free Text"),
-        596889: (998, "Text"),
-        596883: (-994, "Not Sure"),
-        1332844: (-994, "Not Sure"),
-        903598: (-996, "Prefer Not To Answer"),
-        903596: (-996, "Prefer Not To Answer"),
-        903601: (-996, "Prefer Not To Answer"),
-        903607: (-996, "Prefer Not To Answer"),
-        903610: (-996, "Prefer Not To Answer"),
-        903604: (-996, "Prefer Not To Answer"),
-        43529089: (-997, "No Blood Related Daughters"),
-        43529086: (-997, "No Blood Related Siblings"),
-        43529092: (-997, "No Blood Related Sons"),
-        43529090: (-997, "No Daughters Related")
-    }
-
-    survey_data = load_survey_data()
-
-    mapping_numeric = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_numeric'].to_dict()
-    ).to_dict()
-
-    mapping_text = survey_data.groupby('question_concept_id').apply(
-        lambda g: g.set_index('answer_concept_id')['answer_text'].str.strip().to_dict()
-    ).to_dict()
-
-    num_cores = multiprocessing.cpu_count()
-    print(f"Number of CPU cores available: {num_cores}")
-
-    num_chunks = num_cores
-    chunks = np.array_split(input_data, num_chunks)
-
-    with ProcessPoolExecutor() as executor:
-        futures = [
-            executor.submit(map_answers_chunk, chunk, special_cases, mapping_numeric, mapping_text) for chunk in chunks
-        ]
-        results = [future.result() for future in futures]
+    return mask, selected, question_pos, pair_codes, pairs // num_answers, pair_keys
+
+
+def select_all_one_hot(selected, question_pos, pair_codes, pair_questions, pair_keys, num_questions):
+    person_codes, persons = pd.factorize(selected['person_id'], sort=True)
+
+    answered = np.zeros((len(persons), num_questions), dtype=bool)
+    answered[person_codes, question_pos] = True
+
+    # 1 = option selected, 0 = question answered without this option, NaN = question not answered.
+    wide = np.where(answered[:, pair_questions], 0.0, np.nan)
+    wide[person_codes, pair_codes] = 1.0
+
+    return pd.DataFrame(wide, index=pd.Index(persons, name='person_id'), columns=['q' + key for key in pair_keys])
 
-    result_df = pd.concat(results, ignore_index=True)
 
-    return result_df
-def create_dummies_R(user_data):
-    question_key = load_survey_data()
+def append_dummy_rows(filtered_data, new_rows_df):
+    # With no select-all rows there is nothing to append, and concatenating the empty frame would turn
+    # question_concept_id into an object column.
+    if new_rows_df.empty:
+        return filtered_data.reset_index(drop=True)
+    return pd.concat([filtered_data, new_rows_df], ignore_index=True)
 
-    select_all_questions = question_key[question_key['select_all'] == 1]['question_concept_id'].unique()
 
-    id_map = {}
-    new_id_start = user_data['question_concept_id'].max() + 1
-    new_rows = []
+def create_dummies(user_data, one_hot=False, compact=False):
+    with stage('create_dummies', user_data) as current:
+        select_all_questions = get_survey_key().select_all_questions
 
-    for question_id in select_all_questions:
-        select_all_data = user_data[user_data['question_concept_id'] == question_id]
-        for index, row in select_all_data.iterrows():
-            combined_key = f"{question_id}_{row['answer_concept_id']}"
+        mask, selected, question_pos, pair_codes, pair_questions, pair_keys = expand_select_all(user_data,
+                                                                                                select_all_questions)
+        current.set(select_all_rows=int(mask.sum()), dummy_columns=len(pair_keys))
+
+        if one_hot:
+            return current.output(select_all_one_hot(selected, question_pos, pair_codes, pair_questions, pair_keys,
+                                                     len(select_all_questions)))
+
+        new_rows_df = selected.assign(question_concept_id=np.array(pair_keys, dtype=object)[pair_codes])
+        result_data = append_dummy_rows(user_data[~mask], new_rows_df)
+
+        return current.output(compact_report(result_data, compact))
+
+def create_dummy_variables(user_data, id_map=None, compact=False):
+    with stage('create_dummy_variables', user_data) as current:
+        select_all_questions = get_survey_key().select_all_questions
+
+        if id_map is None:
+            id_map = {}
+        new_id_start = user_data['question_concept_id'].max() + 1
+        if id_map:
+            new_id_start = max(new_id_start, max(id_map.values()) + 1)
+
+        mask, selected, question_pos, pair_codes, pair_questions, pair_keys = expand_select_all(user_data,
+                                                                                                select_all_questions)
+        current.set(select_all_rows=int(mask.sum()), dummy_columns=len(pair_keys))
+
+        # A caller-supplied id_map is updated in place, so later calls reuse the same numeric ids.
+        pair_ids = np.empty(len(pair_keys), dtype=np.int64)
+        for i, combined_key in enumerate(pair_keys):
             if combined_key not in id_map:
                 id_map[combined_key] = new_id_start
                 new_id_start += 1
-            new_row = row.copy()
-            new_row['question_concept_id'] = id_map[combined_key]  # Assign new numeric ID
-            new_rows.append(new_row)
+            pair_ids[i] = id_map[combined_key]
+
+        new_rows_df = selected.assign(question_concept_id=pair_ids[pair_codes])
+        result_data = append_dummy_rows(user_data[~mask], new_rows_df)
+        result_data = compact_report(result_data, compact)
+        result_data.attrs['id_map'] = id_map
+
+        return current.output(result_data)
 
-    new_rows_df = pd.DataFrame(new_rows)
-    filtered_data = user_data[~user_data['question_concept_id'].isin(select_all_questions)]
 
-    result_data = pd.concat([filtered_data, new_rows_df], ignore_index=True)
+def score_values(values, present, method):
+    if method not in ('sum', 'mean'):
+        raise ValueError("Unsupported method. Please use 'sum' or 'mean'.")
 
-    return result_data
+    total = np.where(present, values, 0.0).sum(axis=1)
+    if method == 'sum':
+        return total
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / present.sum(axis=1)
+
+
+def scale(data, variables, scale_name, na=False, method='sum', inplace=False):
+    with stage('scale', data) as current:
+        values = data[variables].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = values >= 0
+
+        if na:
+            keep = valid.sum(axis=1) >= len(variables) * 0.8
+            present = ~np.isnan(values)
+        else:
+            keep = valid.all(axis=1)
+            present = valid
+
+        score = score_values(values, present, method)
+        score[~keep] = np.nan
+
+        if not inplace:
+            data = data.copy()
+        data[scale_name] = score
+
+        minimum = np.nanmin(score) if keep.any() else np.nan
+        maximum = np.nanmax(score) if keep.any() else np.nan
+        scored = int(data[scale_name].notna().sum())
+        current.set(scale=scale_name, minimum=minimum, maximum=maximum, scored=scored, missing=len(data) - scored)
+        current.note(f"Minimum score calculated: {minimum}")
+        current.note(f"Maximum score calculated: {maximum}")
+        current.note(f"Number of person_ids with NaN assigned: {len(data) - scored}")
+        current.note(f"Number of person_ids with score calculated: {scored}")
+
+        return current.output(data)
+
+def scale_spec(name, spec):
+    if isinstance(spec, (list, tuple)):
+        spec = {'items': list(spec)}
+
+    spec = {'method': 'sum', 'min_valid': None, 'min_fraction': None, 'reverse': [], 'range': None, **spec}
+    min_valid, min_fraction = spec['min_valid'], spec['min_fraction']
+    if min_valid is not None and min_fraction is not None:
+        raise ValueError(f"Scale '{name}' sets both 'min_valid' and 'min_fraction'; use one of them.")
+    if min_valid is not None and (isinstance(min_valid, bool) or not isinstance(min_valid, numbers.Integral)):
+        raise ValueError(f"'min_valid' of scale '{name}' must be a whole number of items; "
+                         f"use 'min_fraction' for a share of the items.")
+    if min_fraction is not None and not 0 <= min_fraction <= 1:
+        raise ValueError(f"'min_fraction' of scale '{name}' must be between 0 and 1.")
+    if spec['reverse'] and spec['range'] is None:
+        raise ValueError(f"Scale '{name}' has reverse-coded items but no 'range' to reverse them within.")
+    if not set(spec['reverse']) <= set(spec['items']):
+        raise ValueError(f"Reverse-coded items of scale '{name}' must also be listed in its items.")
+    return spec
+
+
+def score_scales(data, scales, inplace=False):
+    with stage('score_scales', data) as current:
+        specs = {name: scale_spec(name, spec) for name, spec in scales.items()}
+
+        items = list(dict.fromkeys(item for spec in specs.values() for item in spec['items']))
+        missing = [item for item in items if item not in data.columns]
+        if missing:
+            raise ValueError(f"Columns not found in the data: {missing}")
+
+        # Every item is converted once; each scale then works on a column slice of the same matrix.
+        values = data[items].to_numpy(dtype=np.float64, na_value=np.nan)
+        position = {item: i for i, item in enumerate(items)}
+
+        scores = {}
+        for name, spec in specs.items():
+            block = values[:, [position[item] for item in spec['items']]]
+            valid = block >= 0
+
+            if spec['reverse']:
+                low, high = spec['range']
+                reverse = np.isin(spec['items'], spec['reverse'])
+                block[:, reverse] = low + high - block[:, reverse]
+
+            min_valid = spec['min_valid']
+            if spec['min_fraction'] is not None:
+                min_valid = spec['min_fraction'] * len(spec['items'])
+            elif min_valid is None:
+                min_valid = len(spec['items'])
+
+            score = score_values(block, valid, spec['method'])
+            score[valid.sum(axis=1) < min_valid] = np.nan
+            scores[name] = score
+
+            scored = ~np.isnan(score)
+            current.note(f"{name}: {scored.sum()} person_ids scored, {(~scored).sum()} assigned NaN, "
+                         f"range {np.nanmin(score) if scored.any() else np.nan} to "
+                         f"{np.nanmax(score) if scored.any() else np.nan}")
+
+        scores = pd.DataFrame(scores, index=data.index)
+        current.set(scales=list(scores.columns))
+        if inplace:
+            data[list(scores.columns)] = scores
+            return current.output(data)
+        return current.output(pd.concat([data.drop(columns=[col for col in scores.columns if col in data.columns]),
+                                         scores], axis=1))
+
+def map_answers(input_data, compact=False, engine='pandas', output='pandas', cache=False):
+    check_engine(engine, output, compact)
+    with stage('map_answers', input_data) as current:
+        def compute():
+            return compact_report(map_with(input_data, get_survey_key(), pd.NA, engine, output), compact)
+
+        mapped = cached_artifact(cache, 'map_answers', input_data,
+                                 {'compact': compact, 'engine': engine, 'output': output}, compute, current)
+        # A miss maps input_data in place, so a hit writes the cached columns back into it the same way.
+        if mapped is not input_data and isinstance(input_data, pd.DataFrame) and output == 'pandas':
+            for col in mapped.columns:
+                input_data[col] = mapped[col].array
+            mapped = input_data
+
+        note_persons(current, mapped)
+        return current.output(mapped)
+
+def map_items(input_data, compact=False, engine='pandas', output='pandas'):
+    check_engine(engine, output, compact)
+    with stage('map_items', input_data) as current:
+        input_data = compact_report(map_with(input_data, get_survey_key(), pd.NA, engine, output), compact)
+
+        note_persons(current, input_data)
+        return current.output(input_data)
+
+def map_answers_chunk(chunk, special_cases, mapping_numeric, mapping_text):
+    with stage('map_answers_chunk', chunk) as current:
+        key = survey_key_from_mappings(special_cases, mapping_numeric, mapping_text)
+        return current.output(apply_lookup(chunk, key))
+
+def init_worker():
+    # Load the survey key once per worker process; tasks then only carry their chunk.
+    get_survey_key()
+
+def map_chunk_timed(chunk):
+    start = time.perf_counter()
+    chunk = apply_lookup(chunk, get_survey_key())
+    return chunk, time.perf_counter() - start
+
+def get_pool(workers):
+    global _pool, _pool_workers
+
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        _pool_workers = workers
+    return _pool
+
+def shutdown_pool():
+    global _pool, _pool_workers
+
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+    _pool = None
+    _pool_workers = None
+
+atexit.register(shutdown_pool)
+
+def process_answers(input_data, workers=None, chunk_size=None, min_rows=PARALLEL_MIN_ROWS, compact=False):
+    with stage('process_answers', input_data) as current:
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+
+        num_rows = len(input_data)
+        data = input_data.reset_index(drop=True)
+
+        if workers == 1 or num_rows < min_rows:
+            chunks = [data.copy(deep=False)]
+            result, elapsed = map_chunk_timed(chunks[0])
+            results, timings = [result], [elapsed]
+            current.set(workers=1)
+            current.note(f"Mapped {num_rows} rows serially in {elapsed:.2f}s")
+        else:
+            if chunk_size is None:
+                # A few chunks per worker keeps the pool busy without paying per-task overhead on tiny slices.
+                chunk_size = max(MIN_CHUNK_ROWS, -(-num_rows // (workers * 4)))
+            chunks = [data.iloc[start:start + chunk_size] for start in range(0, num_rows, chunk_size)]
+
+            executor = get_pool(workers)
+            try:
+                futures = [executor.submit(map_chunk_timed, chunk) for chunk in chunks]
+                results, timings = zip(*[future.result() for future in futures])
+            except BrokenProcessPool:
+                shutdown_pool()
+                raise
+
+            current.set(workers=workers)
+            current.note(f"Mapped {num_rows} rows in {len(chunks)} chunks using {workers} workers; "
+                         f"per-chunk time min {min(timings):.2f}s, mean {sum(timings) / len(timings):.2f}s, "
+                         f"max {max(timings):.2f}s")
+
+        # Chunks are compacted after they are combined so every text column shares one set of categories.
+        result_df = compact_report(pd.concat(results, ignore_index=True), compact)
+        result_df.attrs['chunk_timings'] = [
+            {'chunk': i, 'rows': len(chunk), 'seconds': elapsed}
+            for i, (chunk, elapsed) in enumerate(zip(chunks, timings))
+        ]
+        current.set(chunk_timings=result_df.attrs['chunk_timings'])
 
+        return current.output(result_df)
 
+def create_dummies_R(user_data, id_map=None, compact=False):
+    return create_dummy_variables(user_data, id_map, compact)
@@ -0,0 +1,207 @@
+import os
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from omop2survey.key_cache import get_survey_key
+from omop2survey.response_set import apply_lookup
+from omop2survey.recode_missing import recode_missing, NUMERIC_KINDS
+from omop2survey.pivot_data import pivot_cells, wide_frame
+from omop2survey.table_io import write_table, table_format
+from omop2survey.instrument import stage
+
+TEXT_COLUMNS = ['survey', 'question', 'answer', 'answer_text']
+NUMERIC_COLUMNS = ['answer_concept_id', 'answer_numeric']
+
+
+def read_chunks(input_path, chunksize):
+    if input_path.endswith('.csv') or input_path.endswith('.txt'):
+        delimiter = '\t' if input_path.endswith('.txt') else ','
+        # Read text columns as strings so every chunk parses the same way regardless of its contents.
+        yield from pd.read_csv(input_path, sep=delimiter, chunksize=chunksize, encoding='utf-8-sig',
+                               dtype={col: str for col in TEXT_COLUMNS})
+    elif input_path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files requires the pyarrow package.")
+        for batch in pq.ParquetFile(input_path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        raise ValueError("Unsupported file type. Please provide a .csv, .txt, or .parquet file.")
+
+
+def normalize_chunk(chunk):
+    # recode_missing leaves object columns behind; pin them so every chunk writes with the same schema.
+    for col in NUMERIC_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+    return chunk
+
+
+class ChunkWriter:
+    def __init__(self, output_path):
+        if not (output_path.endswith('.csv') or output_path.endswith('.parquet')):
+            raise ValueError("Unsupported output type. Please provide a .csv or .parquet file.")
+        self.output_path = output_path
+        self.writer = None
+        self.schema = None
+        self.started = False
+
+    def write(self, chunk):
+        if self.output_path.endswith('.csv'):
+            chunk.to_csv(self.output_path, mode='a' if self.started else 'w', header=not self.started, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self.writer is None:
+                self.schema = pa.schema([
+                    (col, pa.from_numpy_dtype(chunk[col].dtype) if pd.api.types.is_numeric_dtype(chunk[col])
+                     else pa.string())
+                    for col in chunk.columns
+                ])
+                self.writer = pq.ParquetWriter(self.output_path, self.schema, compression='zstd')
+            self.writer.write_table(pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+        self.started = True
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def map_file(input_path, output_path, chunksize=500000, recode=True, codebook=None):
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"File path {input_path} does not exist.")
+
+    key = get_survey_key()
+    writer = ChunkWriter(output_path)
+    total_rows = 0
+
+    with stage('map_file') as current:
+        start = time.perf_counter()
+        try:
+            for chunk in read_chunks(input_path, chunksize):
+                chunk = apply_lookup(chunk, key)
+                if recode:
+                    chunk = recode_missing(chunk, inplace=True)
+                writer.write(normalize_chunk(chunk))
+                if codebook is not None:
+                    codebook.update(chunk)
+
+                total_rows += len(chunk)
+                elapsed = time.perf_counter() - start
+                current.note(f"Processed {total_rows} rows ({total_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        finally:
+            writer.close()
+
+        elapsed = time.perf_counter() - start
+        current.set(rows_in=total_rows, rows_out=total_rows, file_path=output_path)
+        current.note(f"Mapped dataset saved successfully to: {output_path}")
+    return {'rows': total_rows, 'seconds': elapsed, 'rows_per_second': total_rows / max(elapsed, 1e-9)}
+
+
+def frame_chunks(input_data, chunksize):
+    if isinstance(input_data, pd.DataFrame):
+        for start in range(0, len(input_data), chunksize):
+            yield input_data.iloc[start:start + chunksize]
+    else:
+        if not os.path.exists(input_data):
+            raise FileNotFoundError(f"File path {input_data} does not exist.")
+        yield from read_chunks(input_data, chunksize)
+
+
+def spill_partitions(chunks, values, spill_dir, partitions):
+    questions = []
+    numeric = True
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        chunk = chunk[['person_id', 'question_concept_id', values]]
+        chunk = chunk[chunk.notna().all(axis=1)]
+        if chunk.empty:
+            continue
+        rows += len(chunk)
+        numeric = numeric and (pd.api.types.is_numeric_dtype(chunk[values]) or
+                               pd.api.types.infer_dtype(chunk[values], skipna=True) in NUMERIC_KINDS)
+        questions.append(pd.unique(chunk['question_concept_id']))
+
+        # Hashing person_id sends all of a person's answers to one partition, in their original order.
+        parts = pd.util.hash_array(chunk['person_id'].to_numpy()) % partitions
+        for part, part_rows in chunk.groupby(parts, sort=False):
+            part_rows.to_pickle(os.path.join(spill_dir, f"{part:05d}-{i:06d}.pkl"))
+
+    # Sorted the same way pivot_wide() sorts the questions of the whole table.
+    questions = pd.factorize(pd.Series(np.concatenate(questions) if questions else []), sort=True)[1]
+    return questions, numeric, rows
+
+
+def write_partition(pivot_df, file_path, file_format, numeric):
+    if file_format == 'csv':
+        return write_table(pivot_df, file_path, 'csv')
+
+    import pyarrow as pa
+    # Every partition is written with the same schema, even where a column holds no answers at all.
+    value_type = pa.float64() if numeric else pa.string()
+    schema = pa.schema([('person_id', pa.from_numpy_dtype(pivot_df.index.dtype))] +
+                       [(col, value_type) for col in pivot_df.columns])
+    table = pa.Table.from_pandas(pivot_df.reset_index(), schema=schema, preserve_index=False)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, file_path, compression='zstd')
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, file_path, compression='zstd')
+    return file_path
+
+
+def pivot_partition(spill_paths, values, questions, numeric, file_path, file_format):
+    if spill_paths:
+        data = pd.concat([pd.read_pickle(path) for path in spill_paths], ignore_index=True)
+    else:
+        data = pd.DataFrame({'person_id': pd.Series(dtype='int64'), 'question_concept_id': questions[:0],
+                             values: pd.Series(dtype='float64')})
+    pivot_df = wide_frame(*pivot_cells(data, values, questions))
+    if numeric:
+        pivot_df = pivot_df.astype(np.float64)
+    write_partition(pivot_df, file_path, file_format, numeric)
+    return file_path, len(pivot_df)
+
+
+def pivot_file(input_data, output_dir, values='answer_numeric', partitions=16, chunksize=500000, workers=None,
+               file_format='parquet'):
+    file_format = table_format('', file_format)
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1.")
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+
+    with stage('pivot_file') as current:
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(dir=output_dir) as spill_dir:
+            questions, numeric, rows = spill_partitions(frame_chunks(input_data, chunksize), values, spill_dir,
+                                                        partitions)
+            current.note(f"Split {rows} rows into {partitions} partitions in {time.perf_counter() - start:.2f}s")
+
+            spilled = sorted(os.listdir(spill_dir))
+            tasks = [([os.path.join(spill_dir, name) for name in spilled if name.startswith(f"{part:05d}-")],
+                      values, questions, numeric, os.path.join(output_dir, f"part-{part:05d}.{file_format}"),
+                      file_format)
+                     for part in range(partitions)]
+
+            # Each partition is read, pivoted and written by one worker, so peak memory follows the partition size.
+            if workers == 1:
+                results = [pivot_partition(*task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, partitions)) as executor:
+                    results = list(executor.map(pivot_partition, *zip(*tasks)))
+
+        elapsed = time.perf_counter() - start
+        persons = sum(count for _, count in results)
+        current.set(rows_in=rows, rows_out=persons, partitions=partitions, columns=len(questions), workers=workers)
+        current.note(f"Pivoted {rows} rows for {persons} person_ids into {partitions} partitions with "
+                     f"{len(questions)} columns in {elapsed:.2f}s, saved to: {output_dir}")
+    return {'partitions': [path for path, _ in results], 'columns': ['q' + str(col) for col in questions],
+            'persons': persons, 'rows': rows, 'seconds': elapsed}
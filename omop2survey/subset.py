@@ -1,18 +1,34 @@
 import os
-import pandas_gbq
+from omop2survey.backends import BigQueryBackend
+from omop2survey.extract_cache import default_extract_cache
+from omop2survey.compact import compact_report
+from omop2survey.instrument import stage, note_persons
 
+_backends = {}
 
-def get_survey_map():
-    survey_map_sql = """ SELECT DISTINCT survey FROM `""" + os.environ["WORKSPACE_CDR"] + """.ds_survey` """
-    survey_map_df = pandas_gbq.read_gbq(survey_map_sql, dialect="standard",
-                                        use_bqstorage_api=("BIGQUERY_STORAGE_API_ENABLED" in os.environ),
-                                        progress_bar_type="tqdm_notebook")
-    survey_map = {i + 1: survey for i, survey in enumerate(survey_map_df['survey'].tolist())}
+
+def default_backend():
+    # One BigQuery backend per CDR, so its cached survey list is shared by every call in the session.
+    cdr = os.environ["WORKSPACE_CDR"]
+    if cdr not in _backends:
+        _backends[cdr] = BigQueryBackend(cdr)
+    return _backends[cdr]
+
+
+def get_survey_map(backend=None):
+    if backend is None:
+        backend = default_backend()
+    with stage('get_survey_map') as current:
+        # The survey list is fetched once per backend; later calls are served from it.
+        current.set(cache_hits=int(backend.survey_names is not None), cache_misses=int(backend.survey_names is None))
+        survey_map = {i + 1: survey for i, survey in enumerate(backend.list_surveys())}
+        current.set(rows_out=len(survey_map))
     return survey_map
 
 
-def show_survey_options():
-    survey_map = get_survey_map()
+def show_survey_options(backend=None):
+    # The numbered list and usage examples are the function's output, so they are always printed.
+    survey_map = get_survey_map(backend)
     for key, value in survey_map.items():
         print(f"{key}: {value}")
     print("\nExample usage in Python: selecting 'Social Determinants of Health' (assuming it is the 7th option)")
@@ -24,37 +40,44 @@ def show_survey_options():
     print("# head(selected_survey_df)")
 
 
-def import_survey_data(selection):
-    survey_map = get_survey_map()
+def survey_name(selection, backend):
+    if isinstance(selection, str):
+        return selection
 
-    survey_name = survey_map.get(selection)
+    survey_map = get_survey_map(backend)
+    name = survey_map.get(selection)
 
-    if survey_name is None:
+    if name is None:
         raise ValueError(f"Invalid selection. Please choose a number between 1 and {len(survey_map)}.")
+    return name
+
+
+def import_survey_data(selection, backend=None, columns=None, question_ids=None, person_ids=None, cache=False,
+                       compact=False):
+    if backend is None:
+        backend = default_backend()
+    if cache is True:
+        cache = default_extract_cache()
+
+    with stage('import_survey_data') as current:
+        survey = survey_name(selection, backend)
+        current.set(survey=survey)
+        survey_df = None
+        if cache:
+            namespace = backend.cache_namespace()
+            key = cache.key(namespace, survey, columns, question_ids, person_ids)
+            survey_df = cache.get(key)
+            current.set(cache_hits=int(survey_df is not None), cache_misses=int(survey_df is None))
+            current.note(f"Extract cache {'hit' if survey_df is not None else 'miss'} for '{survey}' "
+                         f"({cache.hits} hits, {cache.misses} misses)")
+
+        if survey_df is None:
+            survey_df = backend.fetch_survey(survey, columns=columns, question_ids=question_ids, person_ids=person_ids)
+            if cache:
+                cache.put(key, survey_df, namespace=namespace, survey=survey)
+
+        if compact:
+            survey_df = compact_report(survey_df, True)
 
-    dataset_sql = f"""
-        SELECT DISTINCT
-            answer.person_id,
-            answer.survey,
-            answer.question_concept_id,
-            answer.question,
-            answer.answer_concept_id,
-            answer.answer
-        FROM
-            `{os.environ["WORKSPACE_CDR"]}.ds_survey` answer
-        WHERE
-            answer.survey = '{survey_name}'
-    """
-
-    print("Executing SQL query:")
-    print(dataset_sql)
-
-    survey_df = pandas_gbq.read_gbq(
-        dataset_sql,
-        dialect="standard",
-        use_bqstorage_api=("BIGQUERY_STORAGE_API_ENABLED" in os.environ),
-        progress_bar_type="tqdm_notebook"
-    )
-
-    print(f"The number of unique person_ids in the dataset: {survey_df['person_id'].nunique()}")
-    return survey_df
+        note_persons(current, survey_df)
+        return current.output(survey_df)
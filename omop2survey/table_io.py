@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+
+FILE_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.feather': 'feather'}
+
+
+def table_format(file_path, file_format=None):
+    if file_format is None:
+        file_format = FILE_FORMATS.get(os.path.splitext(file_path)[1].lower(), 'csv')
+    if file_format not in ('csv', 'parquet', 'feather'):
+        raise ValueError("Unsupported file format. Please use 'csv', 'parquet', or 'feather'.")
+    return file_format
+
+
+def with_extension(file_name, file_format):
+    root, ext = os.path.splitext(file_name)
+    if ext.lower() in FILE_FORMATS and FILE_FORMATS[ext.lower()] != file_format:
+        return f"{root}.{file_format}"
+    return file_name
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Feather output require the pyarrow package.")
+    return pyarrow
+
+
+def write_table(df, file_path, file_format=None, index=True, compression='zstd'):
+    file_format = table_format(file_path, file_format)
+
+    if file_format == 'csv':
+        df.to_csv(file_path, index=index)
+        return file_path
+
+    require_pyarrow()
+    if index:
+        df = df.reset_index()
+    # Object columns holding only numbers (e.g. a pivot of answer_numeric) are stored as real numeric columns.
+    df = df.infer_objects()
+    if file_format == 'parquet':
+        df.to_parquet(file_path, index=False, compression=compression)
+    else:
+        df.to_feather(file_path, compression=compression)
+    return file_path
+
+
+def read_table(file_path, columns=None, file_format=None):
+    file_format = table_format(file_path, file_format)
+
+    if file_format == 'csv':
+        if columns is None:
+            return pd.read_csv(file_path)
+        header = pd.read_csv(file_path, nrows=0).columns
+    else:
+        require_pyarrow()
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            header = pq.read_schema(file_path).names
+        else:
+            import pyarrow.ipc
+            with pyarrow.ipc.open_file(file_path) as reader:
+                header = reader.schema.names
+        if columns is None:
+            columns = list(header)
+
+    # person_id is kept with any column subset so the rows can still be joined back.
+    if 'person_id' in header and 'person_id' not in columns:
+        columns = ['person_id'] + list(columns)
+
+    if file_format == 'csv':
+        return pd.read_csv(file_path, usecols=columns)[columns]
+    if file_format == 'parquet':
+        return pd.read_parquet(file_path, columns=columns)
+    return pd.read_feather(file_path, columns=columns)
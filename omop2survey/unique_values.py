@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+
+def unique_results(values, function, dtype=object):
+    # Survey text columns repeat a few distinct values across many rows, so the function runs once per value and
+    # the results are broadcast back through the factorized codes. Missing values get code -1.
+    codes, uniques = pd.factorize(values)
+    results = np.empty(len(uniques), dtype=dtype)
+    results[:] = [function(value) for value in uniques]
+    return codes, results
+
+
+def unique_mask(values, predicate):
+    codes, results = unique_results(values, predicate, dtype=bool)
+    # Missing values never satisfy the predicate.
+    return np.append(results, False)[codes]
+
+
+def map_unique(values, function):
+    codes, results = unique_results(values, function)
+    mapped = np.append(results, None)[codes]
+    # Missing values are kept as they were, the same as the pandas .str methods leave them.
+    missing = codes == -1
+    mapped[missing] = np.asarray(values, dtype=object)[missing]
+
+    mapped = pd.Series(mapped, index=values.index, name=values.name, dtype=object)
+    if isinstance(values.dtype, pd.StringDtype):
+        mapped = mapped.astype(values.dtype)
+    return mapped
+
+
+def strip_text(value):
+    return value.strip() if isinstance(value, str) else np.nan
+
+
+def normalize_text(value):
+    return value.strip().lower() if isinstance(value, str) else np.nan
@@ -0,0 +1,139 @@
+import io
+import os
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from omop2survey.table_io import write_table, table_format
+from omop2survey.instrument import note
+
+
+class TeeWriter(io.RawIOBase):
+    def __init__(self, *streams):
+        self.streams = [stream for stream in streams if stream is not None]
+        self.bytes_written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        for stream in self.streams:
+            stream.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+
+def report(name, destination, size, seconds):
+    note(f"Uploaded {name} ({size:,} bytes) to {destination} in {seconds:.2f}s "
+         f"({size / max(seconds, 1e-9) / 1e6:.1f} MB/s)")
+    return {'name': name, 'destination': destination, 'bytes': size, 'seconds': seconds}
+
+
+class Uploader:
+    def __init__(self, workers=4, retries=3):
+        self.workers = workers
+        self.retries = retries
+
+    def destination(self, name):
+        raise NotImplementedError
+
+    def open(self, name):
+        raise NotImplementedError
+
+    def copy_file(self, local_path, name):
+        raise NotImplementedError
+
+    def upload_file(self, local_path, name=None):
+        if not os.path.exists(local_path):
+            raise FileNotFoundError(f"File path {local_path} does not exist.")
+        name = name if name is not None else os.path.basename(local_path)
+
+        start = time.perf_counter()
+        for attempt in range(self.retries):
+            try:
+                self.copy_file(local_path, name)
+                break
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        return report(name, self.destination(name), os.path.getsize(local_path), time.perf_counter() - start)
+
+    def upload_files(self, local_paths):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.upload_file, path) for path in local_paths]
+        # Every upload is allowed to finish before the first failure is raised.
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise errors[0]
+        return [future.result() for future in futures]
+
+    def write_table(self, df, name, file_format=None, local_path=None, index=True):
+        file_format = table_format(name, file_format)
+        start = time.perf_counter()
+
+        # The table is serialized once and streamed to the destination while the optional local copy is written.
+        local = open(local_path, 'wb') if local_path is not None else None
+        try:
+            with self.open(name) as remote:
+                tee = TeeWriter(remote, local)
+                write_table(df, tee, file_format, index=index)
+        finally:
+            if local is not None:
+                local.close()
+        return report(name, self.destination(name), tee.bytes_written, time.perf_counter() - start)
+
+
+class LocalUploader(Uploader):
+    def __init__(self, directory, workers=4, retries=3):
+        super().__init__(workers, retries)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def destination(self, name):
+        return os.path.join(self.directory, name)
+
+    def open(self, name):
+        return open(self.destination(name), 'wb')
+
+    def copy_file(self, local_path, name):
+        shutil.copyfile(local_path, self.destination(name))
+
+
+class GCSUploader(Uploader):
+    def __init__(self, destination=None, workers=4, retries=3, chunk_size=16 * 1024 * 1024):
+        super().__init__(workers, retries)
+        if destination is None:
+            bucket = os.getenv('WORKSPACE_BUCKET')
+            if not bucket:
+                raise ValueError("WORKSPACE_BUCKET is not set. Please pass a gs:// destination.")
+            destination = f"{bucket}/data/"
+        if not destination.startswith('gs://'):
+            raise ValueError("The destination must be a gs:// path.")
+
+        self.bucket_name, _, prefix = destination[len('gs://'):].partition('/')
+        self.prefix = prefix.rstrip('/') + '/' if prefix.strip('/') else ''
+        self.chunk_size = chunk_size
+        self.local = threading.local()
+
+    def bucket(self):
+        # Storage clients are not shared between threads, so each upload thread gets its own.
+        if not hasattr(self.local, 'bucket'):
+            try:
+                from google.cloud import storage
+            except ImportError:
+                raise ImportError("Uploading to a bucket requires the google-cloud-storage package.")
+            self.local.bucket = storage.Client().bucket(self.bucket_name)
+        return self.local.bucket
+
+    def destination(self, name):
+        return f"gs://{self.bucket_name}/{self.prefix}{name}"
+
+    def open(self, name):
+        from google.cloud.storage.retry import DEFAULT_RETRY
+
+        blob = self.bucket().blob(self.prefix + name, chunk_size=self.chunk_size)
+        return blob.open('wb', retry=DEFAULT_RETRY)
+
+    def copy_file(self, local_path, name):
+        self.bucket().blob(self.prefix + name).upload_from_filename(local_path)
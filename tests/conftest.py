@@ -0,0 +1,36 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from omop2survey import key_cache
+from omop2survey.instrument import configure_instrumentation
+
+TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
+SAMPLE_PATH = os.path.join(os.path.dirname(TESTS_DIR), 'vignettes', 'sample_survey.csv')
+# A small key covering the questions in the sample survey; the package's own survey_key.csv is not in the repository.
+KEY_PATH = os.path.join(TESTS_DIR, 'data', 'survey_key.csv')
+
+
+@pytest.fixture(autouse=True, scope='session')
+def fixture_key(tmp_path_factory):
+    # Compiled keys and cached artifacts go to a scratch directory instead of ~/.cache.
+    os.environ['OMOP2SURVEY_CACHE_DIR'] = str(tmp_path_factory.mktemp('cache'))
+    survey_key_path = key_cache.survey_key_path
+    key_cache.survey_key_path = lambda filename='survey_key.csv': KEY_PATH
+    key_cache.clear_survey_key_cache()
+    configure_instrumentation(sink=None)
+    yield
+    configure_instrumentation()
+    key_cache.survey_key_path = survey_key_path
+    key_cache.clear_survey_key_cache()
+
+
+@pytest.fixture
+def survey():
+    # The sample extract plus rows for unknown answers and digit-only free text without an answer_concept_id.
+    sample = pd.read_csv(SAMPLE_PATH, encoding='utf-8-sig')
+    extra = pd.DataFrame({
+        'person_id': [900, 901, 902, 903], 'survey': 'X', 'question_concept_id': [1, 43528660, 43528660, 5],
+        'question': 'q', 'answer_concept_id': [123.0, 999999.0, np.nan, np.nan], 'answer': ['a', '12', '12a', np.nan]
+    })
+    return pd.concat([sample, extra], ignore_index=True)
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+from omop2survey.key_cache import SPECIAL_CASES, load_survey_data
+
+MISSING_VALUES = [-999, -998, -997, -996, -995, -994, -993, -992, -991, -990,
+                  -989, -988, -987, -986, -985, -984, -983, -982, -981, -980]
+
+# Row-by-row versions of the original implementations; the vectorized functions must give the same results.
+
+
+def map_answers(input_data, na_value=pd.NA):
+    survey_data = load_survey_data()
+    groups = survey_data.groupby('question_concept_id')
+    mapping_numeric = {q: dict(zip(g['answer_concept_id'], g['answer_numeric'])) for q, g in groups}
+    mapping_text = {q: dict(zip(g['answer_concept_id'], g['answer_text'].str.strip())) for q, g in groups}
+
+    input_data['answer_numeric'] = na_value
+    input_data['answer_text'] = na_value
+    for answer_id, (num, text) in SPECIAL_CASES.items():
+        mask = input_data['answer_concept_id'] == answer_id
+        input_data.loc[mask, 'answer_numeric'] = num
+        input_data.loc[mask, 'answer_text'] = text
+
+    def apply_mappings(row):
+        if pd.notna(row['answer_numeric']) and pd.notna(row['answer_text']):
+            return row['answer_numeric'], row['answer_text']
+        numeric = mapping_numeric.get(row['question_concept_id'], {}).get(row['answer_concept_id'], na_value)
+        text = mapping_text.get(row['question_concept_id'], {}).get(row['answer_concept_id'], na_value)
+        return numeric, text
+
+    input_data[['answer_numeric', 'answer_text']] = input_data.apply(apply_mappings, axis=1, result_type='expand')
+
+    numeric_mask = pd.isna(input_data['answer_concept_id']) & input_data['answer'].apply(lambda x: str(x).isdigit())
+    input_data.loc[numeric_mask, 'answer_numeric'] = input_data.loc[numeric_mask, 'answer'].astype(int)
+    input_data.loc[numeric_mask, 'answer_text'] = input_data.loc[numeric_mask, 'answer'].astype(str)
+    return input_data
+
+
+def create_dummies(user_data):
+    question_key = load_survey_data()
+    select_all_questions = question_key[question_key['select_all'] == 1]['question_concept_id'].unique()
+
+    new_rows = []
+    for question_id in select_all_questions:
+        for _, row in user_data[user_data['question_concept_id'] == question_id].iterrows():
+            new_row = row.copy()
+            new_row['question_concept_id'] = f"{question_id}_{row['answer_concept_id']}"
+            new_rows.append(new_row)
+
+    filtered_data = user_data[~user_data['question_concept_id'].isin(select_all_questions)]
+    return pd.concat([filtered_data, pd.DataFrame(new_rows)], ignore_index=True)
+
+
+def recode_missing(input_data):
+    data = input_data.copy()
+    data.replace(MISSING_VALUES, pd.NA, inplace=True)
+    for col in data.columns:
+        if data[col].apply(lambda x: isinstance(x, list)).any():
+            data[col] = data[col].apply(lambda x: x[0] if isinstance(x, list) else (pd.NA if pd.isna(x) else x))
+        else:
+            data[col] = data[col].apply(lambda x: pd.NA if pd.isna(x) else x)
+
+    if 'answer_numeric' in data.columns:
+        data['answer_numeric'] = pd.to_numeric(data['answer_numeric'], errors='coerce')
+    return data
+
+
+def pivot(data, values):
+    pivot_df = data.pivot_table(index='person_id', columns='question_concept_id', values=values, aggfunc='first')
+    pivot_df.columns = ['q' + str(col) for col in pivot_df.columns]
+    return pivot_df
+
+
+def create_codebook(input_data):
+    input_data = input_data.copy()
+    required_columns = ['question_concept_id', 'question']
+    response_columns = [col for col in ['answer_concept_id', 'answer', 'answer_text', 'answer_numeric']
+                        if col in input_data.columns]
+    input_data['question_concept_id'] = input_data['question_concept_id'].astype(str)
+    grouped = input_data.groupby(required_columns)[response_columns].apply(
+        lambda x: x.drop_duplicates().reset_index(drop=True)
+    )
+    return grouped.reset_index(drop=False)[required_columns + response_columns].drop_duplicates()
+
+
+def codebook_html(input_data):
+    input_data = input_data.copy()
+    input_data['question'] = input_data['question'].str.strip().str.lower()
+    input_data['answer'] = input_data['answer'].str.strip().str.lower()
+    input_data = input_data.drop_duplicates(subset=['question_concept_id', 'question', 'answer_concept_id'])
+
+    formatted_data = []
+    for (question_concept_id, question), group in input_data.groupby(['question_concept_id', 'question'], sort=False):
+        is_first = True
+        for _, row in group.iterrows():
+            formatted_data.append({
+                'question_concept_id': question_concept_id if is_first else '',
+                'question': question if is_first else '',
+                'answer_concept_id': row['answer_concept_id'],
+                'answer_concept_id recoded as answer_numeric': row['answer_numeric'],
+                'answer': row['answer'],
+                'answer recoded as answer_text': row['answer_text']
+            })
+            is_first = False
+    return pd.DataFrame(formatted_data).to_html(index=False, escape=False)
+
+
+def assert_same_values(left, right):
+    # Recoding keeps integer columns as nullable Int64 where the original gave objects, so only values are compared.
+    def normalize(df):
+        df = df.astype(object).where(df.notna(), None)
+        return df.map(lambda x: float(x) if isinstance(x, (int, float, np.number)) and not isinstance(x, bool) else x)
+    pd.testing.assert_frame_equal(normalize(left), normalize(right), check_dtype=False)
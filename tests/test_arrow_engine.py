@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+
+pa = pytest.importorskip('pyarrow')
+
+
+def test_map_answers_matches_pandas(survey):
+    expected = omop2survey.map_answers(survey.copy())
+    pd.testing.assert_frame_equal(omop2survey.map_answers(survey.copy(), engine='arrow'), expected)
+
+    # Columns read from a Table come back with None for missing text, so the reference starts from the same frame.
+    table = pa.Table.from_pandas(survey, preserve_index=False)
+    expected = omop2survey.map_answers(table.to_pandas())
+    pd.testing.assert_frame_equal(omop2survey.map_answers(table, engine='arrow'), expected)
+
+
+@pytest.mark.parametrize('answers', [[12, 7, 3, 40], [12.0, 7.5, np.nan, 40.0], ['12', '7.5', None, 'x']])
+def test_typed_answers_match_pandas(answers):
+    data = pd.DataFrame({'person_id': [1, 2, 3, 4], 'question_concept_id': [1585940] * 4,
+                         'answer_concept_id': [np.nan, np.nan, np.nan, 903096.0], 'answer': answers})
+    expected = omop2survey.map_answers(data.copy())
+    pd.testing.assert_frame_equal(omop2survey.map_answers(data.copy(), engine='arrow'), expected)
+
+
+def test_recode_missing_matches_pandas(survey):
+    mapped = omop2survey.map_answers(survey)
+    expected = omop2survey.recode_missing(mapped)
+    pd.testing.assert_frame_equal(omop2survey.recode_missing(mapped, engine='arrow'), expected)
+
+
+@pytest.mark.parametrize('values', ['answer_numeric', 'answer_text'])
+def test_pivot_wide_matches_pandas(survey, values):
+    mapped = omop2survey.recode_missing(omop2survey.map_answers(survey))
+    expected = omop2survey.pivot_wide(mapped, values)
+    pd.testing.assert_frame_equal(omop2survey.pivot_wide(mapped, values, engine='arrow'), expected)
+
+
+def test_pivot_keeps_first_answer_per_cell():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({'person_id': rng.integers(0, 20, 2000), 'question_concept_id': rng.integers(0, 10, 2000),
+                         'answer_numeric': rng.permutation(2000).astype(float)})
+    data.loc[::7, 'answer_numeric'] = np.nan
+    expected = reference.pivot(data, 'answer_numeric')
+    pd.testing.assert_frame_equal(omop2survey.pivot_wide(data, engine='arrow'), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(omop2survey.pivot_wide(pa.Table.from_pandas(data), engine='arrow'), expected,
+                                  check_dtype=False)
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+import omop2survey
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return omop2survey.ArtifactCache(str(tmp_path))
+
+
+def test_map_answers_cache_hit_matches(survey, cache):
+    expected = omop2survey.map_answers(survey.copy())
+    for _ in range(2):
+        pd.testing.assert_frame_equal(omop2survey.map_answers(survey.copy(), cache=cache), expected)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_cache_hit_maps_input_in_place(survey, cache, compact):
+    expected = omop2survey.map_answers(survey.copy(), compact=compact)
+    for _ in range(2):
+        data = survey.copy()
+        result = omop2survey.map_answers(data, compact=compact, cache=cache)
+        assert result is data
+        pd.testing.assert_frame_equal(data, expected)
+    assert cache.hits == 1
+
+
+def test_options_are_part_of_the_key(survey, cache):
+    omop2survey.map_answers(survey.copy(), cache=cache)
+    omop2survey.map_answers(survey.copy(), engine='arrow', cache=cache)
+    omop2survey.map_answers(survey.copy(), compact=True, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 3)
+
+
+def test_cached_table_input(survey, cache):
+    pa = pytest.importorskip('pyarrow')
+    table = pa.Table.from_pandas(survey, preserve_index=False)
+    expected = omop2survey.map_answers(table, engine='arrow', output='arrow')
+    for _ in range(2):
+        assert omop2survey.map_answers(table, engine='arrow', output='arrow', cache=cache).equals(expected)
+    assert cache.hits == 1
+
+
+def test_pivot_and_codebook_cache(survey, cache):
+    mapped = omop2survey.recode_missing(omop2survey.map_answers(survey))
+    for _ in range(2):
+        pd.testing.assert_frame_equal(omop2survey.pivot_wide(mapped, cache=cache), omop2survey.pivot_wide(mapped))
+        pd.testing.assert_frame_equal(omop2survey.create_codebook(mapped, cache=cache),
+                                      omop2survey.create_codebook(mapped))
+    assert (cache.hits, cache.misses) == (2, 2)
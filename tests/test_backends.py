@@ -0,0 +1,93 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+import omop2survey
+from omop2survey.backends import LocalBackend
+
+ENGINES = [('survey.csv', 'duckdb'), ('survey.parquet', 'duckdb'), ('survey.csv', 'sqlite'),
+           ('survey.parquet', 'sqlite'), ('survey.db', 'sqlite')]
+
+
+@pytest.fixture
+def extract(survey, tmp_path):
+    survey.to_csv(tmp_path / 'survey.csv', index=False)
+    survey.to_parquet(tmp_path / 'survey.parquet', index=False)
+    with sqlite3.connect(tmp_path / 'survey.db') as connection:
+        survey.to_sql('ds_survey', connection, index=False)
+    return survey
+
+
+def backend(tmp_path, file_name, engine):
+    return LocalBackend(str(tmp_path / file_name), engine=engine)
+
+
+def sorted_rows(data):
+    return data.sort_values(list(data.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('file_name, engine', ENGINES)
+def test_fetch_survey(extract, tmp_path, file_name, engine):
+    local = backend(tmp_path, file_name, engine)
+    assert local.list_surveys() == sorted(extract['survey'].unique())
+
+    survey = local.list_surveys()[0]
+    result = local.fetch_survey(survey)
+    assert result['answer_concept_id'].dtype == np.float64
+    expected = extract[extract['survey'] == survey].drop_duplicates()
+    pd.testing.assert_frame_equal(sorted_rows(result), sorted_rows(expected), check_dtype=False)
+
+
+@pytest.mark.parametrize('file_name, engine', ENGINES)
+def test_engines_agree(extract, tmp_path, file_name, engine):
+    expected = backend(tmp_path, 'survey.csv', 'duckdb')
+    local = backend(tmp_path, file_name, engine)
+    for survey in expected.list_surveys():
+        pd.testing.assert_frame_equal(sorted_rows(local.fetch_survey(survey)),
+                                      sorted_rows(expected.fetch_survey(survey)))
+
+
+@pytest.mark.parametrize('engine', ['duckdb', 'sqlite'])
+def test_filters_and_columns(extract, tmp_path, engine):
+    local = backend(tmp_path, 'survey.csv', engine)
+    survey = local.list_surveys()[0]
+    rows = extract[extract['survey'] == survey]
+    question_ids = rows['question_concept_id'].unique()[:3].tolist()
+    person_ids = rows['person_id'].unique()[:10].tolist()
+
+    result = local.fetch_survey(survey, columns=['person_id', 'question_concept_id', 'answer_concept_id'],
+                                question_ids=question_ids, person_ids=person_ids)
+    expected = rows[rows['question_concept_id'].isin(question_ids) & rows['person_id'].isin(person_ids)]
+    expected = expected[['person_id', 'question_concept_id', 'answer_concept_id']].drop_duplicates()
+    pd.testing.assert_frame_equal(sorted_rows(result), sorted_rows(expected), check_dtype=False)
+
+
+def test_invalid_arguments(extract, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LocalBackend(str(tmp_path / 'missing.csv'))
+    with pytest.raises(ValueError):
+        LocalBackend(str(tmp_path / 'survey.csv'), engine='bigquery')
+    with pytest.raises(ValueError):
+        LocalBackend(str(tmp_path / 'survey.db'), engine='duckdb')
+    with pytest.raises(ValueError):
+        backend(tmp_path, 'survey.csv', 'duckdb').fetch_survey('X', columns=['person_id; DROP TABLE ds_survey'])
+
+
+def test_import_survey_data_by_number(extract, tmp_path):
+    local = backend(tmp_path, 'survey.csv', 'duckdb')
+    survey_map = omop2survey.get_survey_map(local)
+    assert list(survey_map.values()) == local.list_surveys()
+    pd.testing.assert_frame_equal(omop2survey.import_survey_data(1, backend=local),
+                                  local.fetch_survey(survey_map[1]))
+    with pytest.raises(ValueError):
+        omop2survey.import_survey_data(len(survey_map) + 1, backend=local)
+
+
+@pytest.mark.parametrize('file_name, engine', [('ids.csv', 'duckdb'), ('ids.csv', 'sqlite'), ('ids.db', 'sqlite')])
+def test_integer_answer_ids_are_float(tmp_path, file_name, engine):
+    data = pd.DataFrame({'person_id': [1, 2], 'survey': 'X', 'question_concept_id': [10, 10], 'question': 'q',
+                         'answer_concept_id': [100, 200], 'answer': ['a', 'b']})
+    data.to_csv(tmp_path / 'ids.csv', index=False)
+    with sqlite3.connect(tmp_path / 'ids.db') as connection:
+        data.to_sql('ds_survey', connection, index=False)
+    assert backend(tmp_path, file_name, engine).fetch_survey('X')['answer_concept_id'].dtype == np.float64
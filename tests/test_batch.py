@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+import omop2survey
+from omop2survey.backends import LocalBackend
+from omop2survey.pipeline import SurveyPipeline
+
+
+@pytest.fixture
+def backend(survey, tmp_path):
+    survey.to_csv(tmp_path / 'survey.csv', index=False)
+    return LocalBackend(str(tmp_path / 'survey.csv'))
+
+
+def sorted_rows(data):
+    return data.sort_values(['person_id', 'question_concept_id', 'answer']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_import_surveys_matches_one_at_a_time(backend, workers):
+    results = omop2survey.import_surveys(backend=backend, workers=workers)
+    assert list(results) == backend.list_surveys()
+    for survey, result in results.items():
+        expected = omop2survey.map_answers(omop2survey.import_survey_data(survey, backend=backend))
+        pd.testing.assert_frame_equal(sorted_rows(result), sorted_rows(expected))
+
+
+def test_selection_order_and_pipeline(backend):
+    surveys = backend.list_surveys()
+    pipeline = SurveyPipeline.from_survey(None).map_answers().recode_missing().pivot()
+    results = omop2survey.import_surveys([2, surveys[0], 2], backend=backend, pipeline=pipeline)
+    assert list(results) == [surveys[1], surveys[0]]
+
+    for survey, result in results.items():
+        source = omop2survey.import_survey_data(survey, backend=backend)
+        expected = omop2survey.pivot_wide(omop2survey.recode_missing(omop2survey.map_answers(source)))
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_filters_are_passed_to_every_survey(backend, survey):
+    person_ids = survey['person_id'].unique()[:5].tolist()
+    results = omop2survey.import_surveys(backend=backend, person_ids=person_ids)
+    assert all(set(result['person_id']) <= set(person_ids) for result in results.values())
+
+
+def test_invalid_arguments(backend):
+    with pytest.raises(ValueError):
+        omop2survey.import_surveys(backend=backend, workers=0)
+    with pytest.raises(ValueError):
+        omop2survey.import_surveys(backend=backend, pipeline=[('map_answers', {})])
+    with pytest.raises(ValueError):
+        omop2survey.import_surveys([99], backend=backend)
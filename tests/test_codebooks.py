@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+from omop2survey.codebooks import CodebookAccumulator, codebook_layout, html_table, merge_codebooks
+
+
+@pytest.fixture
+def mapped(survey):
+    return omop2survey.map_answers(survey)
+
+
+def test_html_matches_reference(mapped):
+    assert html_table(*codebook_layout(mapped)) == reference.codebook_html(mapped)
+
+
+def test_html_written_in_blocks(mapped, tmp_path):
+    table, first_in_group = codebook_layout(mapped)
+    with open(tmp_path / 'codebook.html', 'w') as f:
+        html_table(table, first_in_group, file=f, chunk_rows=7)
+    assert (tmp_path / 'codebook.html').read_text() == html_table(table, first_in_group)
+
+
+def test_layout_leaves_input_unchanged(mapped):
+    before = mapped.copy()
+    codebook_layout(mapped)
+    pd.testing.assert_frame_equal(mapped, before)
+
+
+@pytest.mark.parametrize('function, directory', [(omop2survey.codebook, '.'),
+                                                 (omop2survey.codebook_html, 'workspace')])
+def test_codebook_writes_html(mapped, tmp_path, monkeypatch, function, directory):
+    monkeypatch.chdir(tmp_path)
+    function(mapped, show=False)
+    [file_path] = (tmp_path / directory).glob('codebook_*.html')
+    assert file_path.read_text() == reference.codebook_html(mapped)
+
+
+def test_create_codebook_matches_reference(mapped):
+    expected = reference.create_codebook(mapped).reset_index(drop=True)
+    reference.assert_same_values(omop2survey.create_codebook(mapped), expected)
+
+
+def test_merged_chunks_match_create_codebook(mapped):
+    accumulators = [CodebookAccumulator().update(mapped.iloc[start:start + 500])
+                    for start in range(0, len(mapped), 500)]
+    merged = merge_codebooks(accumulators)
+    assert merged.rows_seen == len(mapped)
+    pd.testing.assert_frame_equal(merged.result(), omop2survey.create_codebook(mapped))
+
+
+def test_merge_empty_and_mismatched(mapped):
+    accumulator = CodebookAccumulator().update(mapped)
+    expected = accumulator.result()
+    pd.testing.assert_frame_equal(accumulator.merge(CodebookAccumulator()).result(), expected)
+    pd.testing.assert_frame_equal(CodebookAccumulator().merge(accumulator).result(), expected)
+    with pytest.raises(ValueError):
+        accumulator.merge(CodebookAccumulator().update(mapped[['question_concept_id', 'question', 'answer']]))
+
+
+def test_create_codebook_file(mapped, tmp_path):
+    mapped.to_csv(tmp_path / 'mapped.csv', index=False)
+    result = omop2survey.create_codebook_file(str(tmp_path / 'mapped.csv'), chunksize=700)
+    expected = omop2survey.create_codebook(pd.read_csv(tmp_path / 'mapped.csv'))
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+from omop2survey.compact import memory_usage
+from omop2survey.instrument import configure_instrumentation
+
+
+@pytest.fixture
+def records():
+    records = []
+    configure_instrumentation(sink=records.append)
+    yield records
+    configure_instrumentation(sink=None)
+
+
+def test_compact_mapping_matches(survey):
+    mapped = omop2survey.map_answers(survey.copy())
+    compacted = omop2survey.map_answers(survey.copy(), compact=True)
+    assert isinstance(compacted['question'].dtype, pd.CategoricalDtype)
+    for col in ('person_id', 'question_concept_id', 'answer_concept_id'):
+        assert compacted[col].dtype == mapped[col].dtype
+    reference.assert_same_values(compacted, mapped)
+
+
+def test_compact_keeps_dummy_labels_and_pivot_index(survey):
+    mapped = omop2survey.map_answers(survey.copy())
+    compacted = omop2survey.map_answers(survey.copy(), compact=True)
+
+    dummies = omop2survey.create_dummies(mapped)
+    compact_dummies = omop2survey.create_dummies(compacted, compact=True)
+    assert isinstance(compact_dummies['question_concept_id'].dtype, pd.CategoricalDtype)
+    reference.assert_same_values(compact_dummies, dummies)
+
+    expected = omop2survey.pivot_wide(dummies)
+    result = omop2survey.pivot_wide(compact_dummies)
+    assert result.index.dtype == expected.index.dtype
+    assert list(result.columns) == list(expected.columns)
+    reference.assert_same_values(result, expected)
+
+
+def test_compact_ids(survey):
+    ids = omop2survey.create_dummy_variables(omop2survey.map_answers(survey.copy()))
+    compact_ids = omop2survey.create_dummy_variables(omop2survey.map_answers(survey.copy()), compact=True)
+    assert compact_ids['question_concept_id'].dtype == ids['question_concept_id'].dtype
+    assert compact_ids.attrs['id_map'] == ids.attrs['id_map']
+    reference.assert_same_values(compact_ids, ids)
+
+
+def test_compact_report_measures_result(survey, records):
+    mapped = omop2survey.map_answers(survey.copy())
+    compacted = omop2survey.map_answers(survey.copy(), compact=True)
+    [record] = [record for record in records if record['stage'] == 'map_answers' and 'memory_before' in record]
+    assert record['memory_before'] == memory_usage(mapped)
+    assert record['memory_after'] == memory_usage(compacted)
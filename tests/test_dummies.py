@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+from omop2survey.key_cache import get_survey_key
+
+
+@pytest.fixture
+def mapped(survey):
+    return omop2survey.map_answers(survey)
+
+
+def test_create_dummies_matches_reference(mapped):
+    expected = reference.create_dummies(mapped.copy())
+    pd.testing.assert_frame_equal(omop2survey.create_dummies(mapped.copy()), expected)
+
+
+def test_no_select_all_rows_keeps_dtypes(mapped):
+    other = mapped[~mapped['question_concept_id'].isin(get_survey_key().select_all_questions)]
+    result = omop2survey.create_dummies(other)
+    assert result['question_concept_id'].dtype == np.int64
+    pd.testing.assert_frame_equal(result, other.reset_index(drop=True))
+    assert omop2survey.create_dummy_variables(other)['question_concept_id'].dtype == np.int64
+
+
+def test_one_hot(mapped):
+    wide = omop2survey.create_dummies(mapped, one_hot=True)
+    dummies = reference.create_dummies(mapped.copy())
+    dummies = dummies[dummies['question_concept_id'].map(lambda value: isinstance(value, str))]
+
+    assert sorted(wide.columns) == sorted('q' + key for key in dummies['question_concept_id'].unique())
+    for person_id, column in zip(dummies['person_id'], 'q' + dummies['question_concept_id']):
+        assert wide.loc[person_id, column] == 1.0
+
+    answered = dummies.assign(question=dummies['question_concept_id'].str.split('_').str[0])
+    for column in wide.columns:
+        question = column[1:].split('_')[0]
+        persons = set(answered.loc[answered['question'] == question, 'person_id'])
+        assert set(wide.index[wide[column].notna()]) == persons
+    assert wide.sum().sum() == len(dummies[['person_id', 'question_concept_id']].drop_duplicates())
+
+
+def test_create_dummy_variables_id_map(mapped):
+    first = omop2survey.create_dummy_variables(mapped)
+    id_map = dict(first.attrs['id_map'])
+    assert min(id_map.values()) == mapped['question_concept_id'].max() + 1
+    assert len(set(id_map.values())) == len(id_map)
+
+    second = omop2survey.create_dummy_variables(mapped.iloc[::-1], id_map=dict(id_map))
+    assert second.attrs['id_map'] == id_map
+    pd.testing.assert_frame_equal(second.sort_values(['person_id', 'question_concept_id', 'answer_concept_id'])
+                                  .reset_index(drop=True),
+                                  first.sort_values(['person_id', 'question_concept_id', 'answer_concept_id'])
+                                  .reset_index(drop=True))
+
+
+def test_id_map_continues_after_existing_ids(mapped):
+    id_map = {'1_2': 10 ** 9}
+    result = omop2survey.create_dummy_variables(mapped, id_map=id_map)
+    assert result.attrs['id_map'] is id_map
+    assert min(value for key, value in id_map.items() if key != '1_2') == 10 ** 9 + 1
@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+import omop2survey
+from omop2survey.backends import LocalBackend
+from omop2survey.extract_cache import ExtractCache
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'person_id': range(1000), 'answer': ['a'] * 1000})
+
+
+def age(cache, key, seconds):
+    data_path, _ = cache.paths(key)
+    os.utime(data_path, (seconds, seconds))
+
+
+def test_round_trip_and_counts(frame, tmp_path):
+    cache = ExtractCache(str(tmp_path))
+    assert cache.get('missing') is None
+    cache.put('k', frame, namespace='n', survey='s')
+    pd.testing.assert_frame_equal(cache.get('k'), frame)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_key_ignores_id_order(tmp_path):
+    cache = ExtractCache(str(tmp_path))
+    assert cache.key('n', 's', question_ids=[3, 1, 2]) == cache.key('n', 's', question_ids=[1, 2, 3])
+    assert cache.key('n', 's', columns=['a']) != cache.key('n', 's')
+
+
+def test_least_recently_used_is_evicted(frame, tmp_path):
+    cache = ExtractCache(str(tmp_path))
+    cache.put('old', frame)
+    cache.put('used', frame)
+    entry_bytes = cache.stats()['bytes'] // 2
+    age(cache, 'old', 1000)
+    age(cache, 'used', 2000)
+    cache.get('old')
+
+    cache.max_bytes = 2 * entry_bytes + entry_bytes // 2
+    cache.put('new', frame)
+    assert sorted(entry['key'] for entry in cache.entries()) == ['new', 'old']
+
+
+def test_concurrent_counts(frame, tmp_path):
+    cache = ExtractCache(str(tmp_path))
+    cache.put('k', frame)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: cache.get('k' if i % 2 else 'missing'), range(200)))
+    assert (cache.hits, cache.misses) == (100, 100)
+
+
+def test_invalidate(frame, tmp_path):
+    cache = ExtractCache(str(tmp_path))
+    cache.put('a', frame, namespace='n1', survey='s1')
+    cache.put('b', frame, namespace='n1', survey='s2')
+    cache.put('c', frame, namespace='n2', survey='s1')
+    assert cache.invalidate(survey='s1') == 2
+    assert [entry['key'] for entry in cache.entries()] == ['b']
+
+
+def test_import_survey_data_cache(survey, tmp_path):
+    survey.to_csv(tmp_path / 'survey.csv', index=False)
+    local = LocalBackend(str(tmp_path / 'survey.csv'))
+    cache = ExtractCache(str(tmp_path / 'cache'))
+    first = omop2survey.import_survey_data(1, backend=local, cache=cache)
+    second = omop2survey.import_survey_data(1, backend=local, cache=cache)
+    pd.testing.assert_frame_equal(second, first)
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+import omop2survey
+
+pytest.importorskip('pyarrow')
+
+
+def releases(survey):
+    first = survey.copy()
+    # The next release drops some people, edits answers and adds new people.
+    second = first[~first['person_id'].isin([3, 10, 11])].copy()
+    edited = second.sample(200, random_state=2).index
+    second.loc[edited, 'answer_concept_id'] = first['answer_concept_id'].sample(200, random_state=3).to_numpy()
+    added = first[first['person_id'] <= 20].assign(person_id=lambda df: df['person_id'] + 100000)
+    return first, pd.concat([second, added], ignore_index=True)
+
+
+def sorted_rows(df):
+    df = df.astype(object).where(df.notna(), None)
+    return df.sort_values(['person_id', 'question_concept_id', 'answer']).reset_index(drop=True)
+
+
+def test_update_matches_full_run(survey, tmp_path):
+    first, second = releases(survey)
+    omop2survey.update_survey(first, str(tmp_path / 'incremental'), release='v1')
+    updated = omop2survey.update_survey(second, str(tmp_path / 'incremental'), release='v2')
+    full = omop2survey.update_survey(second, str(tmp_path / 'full'), release='v2')
+
+    assert 0 < updated['rows_processed'] < len(second)
+    pd.testing.assert_frame_equal(updated['pivot'], full['pivot'])
+    pd.testing.assert_frame_equal(sorted_rows(updated['mapped']), sorted_rows(full['mapped']))
+
+    expected = omop2survey.pivot_wide(omop2survey.recode_missing(omop2survey.map_answers(second.copy())))
+    pd.testing.assert_frame_equal(full['pivot'], expected.astype(np.float64))
+
+
+def test_unchanged_release_processes_nothing(survey, tmp_path):
+    omop2survey.update_survey(survey, str(tmp_path))
+    result = omop2survey.update_survey(survey, str(tmp_path))
+    assert result['rows_processed'] == 0
+    state = omop2survey.load_survey_state(str(tmp_path))
+    pd.testing.assert_frame_equal(state['pivot'], result['pivot'], check_names=False)
+
+
+def test_changed_options_rebuild(survey, tmp_path):
+    omop2survey.update_survey(survey, str(tmp_path))
+    result = omop2survey.update_survey(survey, str(tmp_path), recode=False)
+    assert result['rows_processed'] == len(survey)
+    expected = omop2survey.pivot_wide(omop2survey.map_answers(survey.copy()))
+    pd.testing.assert_frame_equal(result['pivot'], expected, check_dtype=False)
@@ -0,0 +1,80 @@
+import logging
+import pytest
+import omop2survey
+from omop2survey.instrument import configure_instrumentation, stage, stage_history
+
+
+@pytest.fixture
+def records():
+    records = []
+    configure_instrumentation(sink=records.append)
+    stage_history(clear=True)
+    yield records
+    configure_instrumentation(sink=None)
+
+
+def test_callable_sink_gets_stage_records(survey, records):
+    mapped = omop2survey.map_answers(survey)
+    wide = omop2survey.pivot_wide(mapped)
+
+    assert [record['stage'] for record in records] == ['map_answers', 'pivot_wide']
+    mapping, pivot = records
+    assert mapping['rows_in'] == mapping['rows_out'] == len(survey)
+    assert mapping['persons'] == survey['person_id'].nunique()
+    assert (pivot['rows_in'], pivot['rows_out']) == (len(mapped), len(wide))
+    assert all(record['seconds'] >= 0 and record['peak_bytes'] is None for record in records)
+    assert stage_history() == records
+
+
+def test_nested_stages_and_errors(records):
+    with pytest.raises(KeyError):
+        with stage('outer') as outer:
+            outer.set(rows_in=3)
+            with stage('inner') as inner:
+                inner.note("inner message")
+            raise KeyError('x')
+
+    inner, outer = records
+    assert (inner['stage'], inner['messages']) == ('inner', ['inner message'])
+    assert outer['stage'] == 'outer' and outer['rows_in'] == 3 and outer['error'] == repr(KeyError('x'))
+
+
+def test_history_clear_and_limit(records):
+    configure_instrumentation(sink=records.append, history=2)
+    for name in ('a', 'b', 'c'):
+        with stage(name):
+            pass
+    assert [record['stage'] for record in stage_history(clear=True)] == ['b', 'c']
+    assert stage_history() == []
+    configure_instrumentation(sink=records.append)
+
+
+def test_memory_tracing(survey, records):
+    configure_instrumentation(sink=records.append, memory=True)
+    omop2survey.map_answers(survey)
+    assert records[-1]['peak_bytes'] > 0
+
+
+def test_print_and_logging_sinks(survey, capsys, caplog):
+    try:
+        configure_instrumentation(sink='print')
+        omop2survey.map_answers(survey.copy())
+        assert 'The number of unique person_ids in the dataset' in capsys.readouterr().out
+
+        configure_instrumentation(sink='logging')
+        with caplog.at_level(logging.DEBUG, logger='omop2survey'):
+            omop2survey.map_answers(survey.copy())
+        assert capsys.readouterr().out == ''
+        assert any(record.levelno == logging.INFO for record in caplog.records)
+        assert [record.omop2survey['stage'] for record in caplog.records if hasattr(record, 'omop2survey')] == \
+            ['map_answers']
+    finally:
+        configure_instrumentation(sink=None)
+
+
+def test_disabled(survey, capsys):
+    stage_history(clear=True)
+    omop2survey.map_answers(survey)
+    assert capsys.readouterr().out == '' and stage_history() == []
+    with pytest.raises(ValueError):
+        configure_instrumentation(sink='email')
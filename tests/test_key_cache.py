@@ -0,0 +1,53 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from omop2survey import key_cache
+from omop2survey.key_cache import SurveyKey, get_survey_key, clear_survey_key_cache, compiled_key_path
+
+
+def assert_same_key(left, right):
+    assert left.index.equals(right.index)
+    assert left.index.levels[1].dtype == right.index.levels[1].dtype
+    assert [type(v) for v in left.answer_numeric] == [type(v) for v in right.answer_numeric]
+    np.testing.assert_array_equal(left.answer_numeric, right.answer_numeric)
+    np.testing.assert_array_equal(left.answer_text, right.answer_text)
+    np.testing.assert_array_equal(left.special_ids, right.special_ids)
+    assert left.select_all == right.select_all
+
+
+def test_key_is_memoized():
+    assert get_survey_key() is get_survey_key()
+
+
+def test_compiled_key_matches_fresh_build():
+    key = get_survey_key()
+    clear_survey_key_cache()
+    assert os.path.exists(compiled_key_path(key.digest))
+    assert_same_key(get_survey_key(), SurveyKey(key_cache.load_survey_data(), digest=key.digest))
+
+
+def test_changed_key_file_is_reloaded(tmp_path, monkeypatch):
+    path = tmp_path / 'survey_key.csv'
+    shutil.copy(key_cache.survey_key_path(), path)
+    monkeypatch.setattr(key_cache, 'survey_key_path', lambda filename='survey_key.csv': str(path))
+    clear_survey_key_cache()
+    before = get_survey_key()
+
+    data = pd.read_csv(path)
+    data.loc[0, 'answer_numeric'] = 42
+    data.to_csv(path, index=False)
+    os.utime(path, ns=(0, 0))
+    after = get_survey_key()
+
+    assert after.digest != before.digest
+    assert 42 in after.answer_numeric.tolist()
+    clear_survey_key_cache()
+
+
+def test_unreadable_compiled_key_is_rebuilt():
+    digest = get_survey_key().digest
+    clear_survey_key_cache()
+    with open(compiled_key_path(digest), 'w') as f:
+        f.write('not json')
+    assert get_survey_key().digest == digest
@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+import omop2survey
+from omop2survey.backends import LocalBackend
+from omop2survey.pipeline import SurveyPipeline
+
+
+@pytest.fixture
+def recoded(survey):
+    return omop2survey.recode_missing(omop2survey.map_answers(survey.copy()))
+
+
+def test_map_and_recode(survey, recoded):
+    result = SurveyPipeline(survey).map_answers().recode_missing().collect()
+    pd.testing.assert_frame_equal(result, recoded)
+    pd.testing.assert_frame_equal(SurveyPipeline(survey).map_answers().collect(),
+                                  omop2survey.map_answers(survey.copy()))
+
+
+@pytest.mark.parametrize('values', ['answer_numeric', 'answer_text'])
+def test_dummies_and_pivot(survey, recoded, values):
+    result = SurveyPipeline(survey).map_answers().recode_missing().create_dummies().pivot(values).collect()
+    pd.testing.assert_frame_equal(result, omop2survey.pivot_wide(omop2survey.create_dummies(recoded), values))
+
+
+def test_dummy_variables_and_one_hot(survey, recoded):
+    result = SurveyPipeline(survey).map_answers().create_dummy_variables().collect()
+    expected = omop2survey.create_dummy_variables(omop2survey.map_answers(survey.copy()))
+    pd.testing.assert_frame_equal(result, expected)
+
+    result = SurveyPipeline(survey).map_answers().recode_missing().create_dummies(one_hot=True).collect()
+    pd.testing.assert_frame_equal(result, omop2survey.create_dummies(recoded, one_hot=True))
+
+
+def test_scales_and_select(survey, recoded):
+    wide = omop2survey.pivot_wide(recoded)
+    items = list(wide.columns[:3])
+    scales = {'total': items, 'mean': {'items': items, 'method': 'mean', 'min_valid': 1}}
+
+    pipeline = SurveyPipeline(survey).map_answers().recode_missing().pivot()
+    result = pipeline.scale(items, 'first', na=True).score_scales(scales).select('first', 'total', 'mean').collect()
+    expected = omop2survey.score_scales(omop2survey.scale(wide, items, 'first', na=True), scales)
+    pd.testing.assert_frame_equal(result, expected[['first', 'total', 'mean']])
+
+
+def test_file_and_survey_sources(survey, recoded, tmp_path):
+    survey.to_csv(tmp_path / 'survey.csv', index=False)
+    result = SurveyPipeline.from_file(str(tmp_path / 'survey.csv')).map_answers().recode_missing().pivot().collect()
+    pd.testing.assert_frame_equal(result, omop2survey.pivot_wide(recoded), check_dtype=False)
+
+    backend = LocalBackend(str(tmp_path / 'survey.csv'))
+    pipeline = SurveyPipeline.from_survey(1, backend=backend).map_answers().recode_missing().pivot()
+    source = omop2survey.import_survey_data(1, backend=backend)
+    expected = omop2survey.pivot_wide(omop2survey.recode_missing(omop2survey.map_answers(source)))
+    pd.testing.assert_frame_equal(pipeline.collect(), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(pipeline.collect(pipeline.fetch()), pipeline.collect())
+
+
+def test_plan_reads_only_needed_columns(survey):
+    pipeline = SurveyPipeline(survey).map_answers().recode_missing().pivot()
+    steps, needed = pipeline.plan()
+    assert [name for name, _, _ in steps] == ['map_recode', 'pivot']
+    assert needed == {'person_id', 'question_concept_id', 'answer_concept_id', 'answer'}
+    assert steps[0][1]['text'] is False
+    assert list(pipeline.fetch().columns) == ['person_id', 'question_concept_id', 'answer_concept_id', 'answer']
+    assert 'read columns: person_id, question_concept_id, answer_concept_id, answer' in pipeline.explain()
+
+
+def test_source_is_not_modified(survey):
+    before = survey.copy()
+    result = SurveyPipeline(survey).map_answers().recode_missing().collect()
+    result.iloc[:5, :] = None
+    pd.testing.assert_frame_equal(survey, before)
+
+
+def test_invalid_steps(survey):
+    with pytest.raises(ValueError):
+        SurveyPipeline(survey).map_answers().score_scales({'total': ['q1']})
+    with pytest.raises(ValueError):
+        SurveyPipeline(survey).map_answers().pivot().recode_missing()
+    with pytest.raises(ValueError):
+        SurveyPipeline(survey).map_answers().map_answers()
+    with pytest.raises(ValueError):
+        SurveyPipeline([1, 2, 3])
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+
+
+@pytest.fixture
+def mapped(survey):
+    return omop2survey.recode_missing(omop2survey.map_answers(survey))
+
+
+@pytest.mark.parametrize('values', ['answer_numeric', 'answer_text'])
+def test_pivot_wide_matches_pivot_table(mapped, values):
+    expected = reference.pivot(mapped, values)
+    pd.testing.assert_frame_equal(omop2survey.pivot_wide(mapped, values), expected, check_dtype=False)
+
+
+def test_pivot_local_writes_pivot_wide(mapped, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    omop2survey.pivot_local(mapped)
+    written = pd.read_csv(tmp_path / 'workspace' / 'pivot_n.csv', index_col='person_id')
+    pd.testing.assert_frame_equal(written, omop2survey.pivot_wide(mapped), check_dtype=False)
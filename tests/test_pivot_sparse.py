@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+import omop2survey
+
+
+@pytest.fixture
+def mapped(survey):
+    return omop2survey.recode_missing(omop2survey.map_answers(survey))
+
+
+def dense(mapped):
+    return omop2survey.pivot_wide(mapped).apply(pd.to_numeric, errors='coerce').astype(np.float64)
+
+
+def test_pivot_sparse_matches_dense(mapped):
+    sparse_df = omop2survey.pivot_sparse(mapped)
+    assert all(isinstance(dtype, pd.SparseDtype) for dtype in sparse_df.dtypes)
+    pd.testing.assert_frame_equal(sparse_df.sparse.to_dense(), dense(mapped), check_names=False)
+
+
+def test_csr_output(mapped):
+    matrix, persons, columns = omop2survey.pivot_sparse(mapped, output='csr')
+    expected = dense(mapped)
+    np.testing.assert_array_equal(persons, expected.index)
+    assert list(columns) == list(expected.columns)
+    assert matrix.nnz == expected.notna().to_numpy().sum()
+
+
+@pytest.mark.parametrize('output', ['pandas', 'csr'])
+def test_sparse_round_trip(mapped, tmp_path, output):
+    file_path = str(tmp_path / 'pivot.npz')
+    omop2survey.write_sparse(omop2survey.pivot_sparse(mapped, output=output), file_path)
+    pd.testing.assert_frame_equal(omop2survey.read_sparse(file_path).sparse.to_dense(), dense(mapped),
+                                  check_names=False)
+
+
+def test_write_sparse_dense_frame(mapped, tmp_path):
+    file_path = str(tmp_path / 'pivot.npz')
+    omop2survey.write_sparse(dense(mapped), file_path)
+    pd.testing.assert_frame_equal(omop2survey.read_sparse(file_path).sparse.to_dense(), dense(mapped),
+                                  check_names=False)
@@ -0,0 +1,23 @@
+import pandas as pd
+import omop2survey
+from omop2survey import response_set
+
+
+def test_matches_map_answers(survey):
+    expected = omop2survey.map_answers(survey.copy())
+    result = omop2survey.process_answers(survey.copy(), workers=2, chunk_size=1000, min_rows=0)
+    pd.testing.assert_frame_equal(result, expected)
+    assert sum(chunk['rows'] for chunk in result.attrs['chunk_timings']) == len(survey)
+
+
+def test_pool_is_reused(survey):
+    omop2survey.process_answers(survey.copy(), workers=2, chunk_size=1000, min_rows=0)
+    pool = response_set._pool
+    omop2survey.process_answers(survey.copy(), workers=2, chunk_size=1000, min_rows=0)
+    assert response_set._pool is pool
+
+
+def test_small_input_is_mapped_serially(survey):
+    result = omop2survey.process_answers(survey.copy(), workers=2)
+    assert len(result.attrs['chunk_timings']) == 1
+    pd.testing.assert_frame_equal(result, omop2survey.map_answers(survey.copy()))
@@ -0,0 +1,33 @@
+import pandas as pd
+import omop2survey
+import reference
+
+
+def test_recode_missing_matches_reference(survey):
+    mapped = omop2survey.map_answers(survey.copy())
+    expected = reference.recode_missing(mapped)
+    reference.assert_same_values(omop2survey.recode_missing(mapped), expected)
+
+
+def test_recode_missing_leaves_input_unchanged(survey):
+    mapped = omop2survey.map_answers(survey.copy())
+    before = mapped.copy()
+    omop2survey.recode_missing(mapped)
+    pd.testing.assert_frame_equal(mapped, before)
+
+
+def test_writing_to_result_leaves_input_unchanged(survey):
+    mapped = omop2survey.map_answers(survey.copy())
+    before = mapped.copy()
+    result = omop2survey.recode_missing(mapped)
+    for col in result.columns:
+        result.loc[result.index[0], col] = None
+    result.iloc[1:3, :] = None
+    pd.testing.assert_frame_equal(mapped, before)
+
+
+def test_inplace_recodes_input(survey):
+    mapped = omop2survey.map_answers(survey.copy())
+    expected = omop2survey.recode(mapped)
+    omop2survey.recode(mapped, inplace=True)
+    pd.testing.assert_frame_equal(mapped, expected)
@@ -0,0 +1,16 @@
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+
+
+def test_map_answers_matches_reference(survey):
+    expected = reference.map_answers(survey.copy())
+    pd.testing.assert_frame_equal(omop2survey.map_answers(survey.copy()), expected)
+
+
+@pytest.mark.parametrize('mapper, na_value', [('map_items', pd.NA), ('map_questions', pd.NA), ('map_responses', None)])
+def test_mappers_match_reference(survey, mapper, na_value):
+    # map_responses() built its columns row by row, so only the values of the reference are comparable.
+    expected = reference.map_answers(survey.copy(), na_value)
+    reference.assert_same_values(getattr(omop2survey, mapper)(survey.copy()), expected)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+import omop2survey
+
+
+@pytest.fixture
+def items():
+    # -999 stands for a skipped or refused item, the same as in a recoded pivot.
+    return pd.DataFrame({'a': [1, 2, 3, -999, np.nan],
+                         'b': [2, 2, -999, -999, 1],
+                         'c': [3, 1, 1, 2, 4],
+                         'd': [4, 4, 4, 4, np.nan]}, index=pd.Index([1, 2, 3, 4, 5], name='person_id'))
+
+
+def test_score_scales_matches_scale(items):
+    scored = omop2survey.score_scales(items, {'total': ['a', 'b', 'c', 'd']})
+    expected = omop2survey.scale(items, ['a', 'b', 'c', 'd'], 'total')
+    np.testing.assert_array_equal(scored['total'], expected['total'])
+    np.testing.assert_array_equal(scored['total'], [10, 9, np.nan, np.nan, np.nan])
+
+
+def test_min_valid_and_min_fraction(items):
+    scales = {'count': {'items': ['a', 'b', 'c', 'd'], 'min_valid': 2, 'method': 'mean'},
+              'fraction': {'items': ['a', 'b', 'c', 'd'], 'min_fraction': 0.75, 'method': 'mean'},
+              'one': {'items': ['a', 'b', 'c', 'd'], 'min_valid': 1}}
+    scored = omop2survey.score_scales(items, scales)
+    np.testing.assert_array_equal(scored['count'], [2.5, 2.25, 8 / 3, 3, 2.5])
+    np.testing.assert_array_equal(scored['fraction'], [2.5, 2.25, 8 / 3, np.nan, np.nan])
+    np.testing.assert_array_equal(scored['one'], [10, 9, 8, 6, 5])
+
+
+def test_reverse_items(items):
+    scored = omop2survey.score_scales(items, {'reversed': {'items': ['a', 'c'], 'reverse': ['c'], 'range': (1, 4)}})
+    np.testing.assert_array_equal(scored['reversed'], [3, 6, 7, np.nan, np.nan])
+
+
+@pytest.mark.parametrize('spec', [{'min_valid': 1.0}, {'min_valid': 0.8}, {'min_fraction': 1.5},
+                                  {'min_valid': 2, 'min_fraction': 0.5}, {'reverse': ['a']},
+                                  {'reverse': ['x'], 'range': (1, 4)}])
+def test_invalid_specs(items, spec):
+    with pytest.raises(ValueError):
+        omop2survey.score_scales(items, {'total': {'items': ['a', 'b'], **spec}})
+
+
+def test_missing_columns(items):
+    with pytest.raises(ValueError):
+        omop2survey.score_scales(items, {'total': ['a', 'e']})
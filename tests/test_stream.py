@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+import omop2survey
+import reference
+
+
+@pytest.mark.parametrize('output_name', ['mapped.csv', 'mapped.parquet'])
+def test_map_file_matches_in_memory(survey, tmp_path, output_name):
+    if output_name.endswith('.parquet'):
+        pytest.importorskip('pyarrow')
+    input_path = str(tmp_path / 'survey.csv')
+    survey.to_csv(input_path, index=False)
+    output_path = str(tmp_path / output_name)
+
+    result = omop2survey.map_file(input_path, output_path, chunksize=700)
+    assert result['rows'] == len(survey)
+
+    mapped = pd.read_csv(output_path) if output_name.endswith('.csv') else pd.read_parquet(output_path)
+    expected = omop2survey.recode_missing(omop2survey.map_answers(pd.read_csv(input_path)))
+    reference.assert_same_values(mapped, expected)
+
+
+@pytest.mark.parametrize('file_format, workers', [('parquet', 1), ('parquet', 2), ('csv', 1)])
+def test_pivot_file_matches_pivot_wide(survey, tmp_path, file_format, workers):
+    if file_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    mapped = omop2survey.recode_missing(omop2survey.map_answers(survey))
+    expected = omop2survey.pivot_wide(mapped).astype('float64')
+    result = omop2survey.pivot_file(mapped, str(tmp_path / 'pivot'), partitions=3, chunksize=1000, workers=workers,
+                                    file_format=file_format)
+
+    assert result['columns'] == list(expected.columns) and result['persons'] == len(expected)
+    assert sorted(path.name for path in (tmp_path / 'pivot').iterdir()) == \
+        [f'part-{part:05d}.{file_format}' for part in range(3)]
+    parts = pd.concat([omop2survey.read_table(path) for path in result['partitions']]).set_index('person_id')
+    assert list(parts.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(parts.sort_index(), expected, check_names=False, check_dtype=False)
+
+
+def test_pivot_file_text_values(survey, tmp_path):
+    pytest.importorskip('pyarrow')
+    mapped = omop2survey.recode_missing(omop2survey.map_answers(survey))
+    expected = omop2survey.pivot_wide(mapped, 'answer_text')
+    result = omop2survey.pivot_file(mapped, str(tmp_path), values='answer_text', partitions=2, chunksize=1000,
+                                    workers=1)
+    parts = pd.concat([pd.read_parquet(path) for path in result['partitions']]).set_index('person_id')
+    reference.assert_same_values(parts.sort_index(), expected)
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+import omop2survey
+from omop2survey.table_io import write_table
+
+
+@pytest.fixture
+def mapped(survey):
+    return omop2survey.recode_missing(omop2survey.map_answers(survey))
+
+
+@pytest.mark.parametrize('file_name', ['pivot_n.csv', 'pivot_n.parquet', 'pivot_n.feather'])
+def test_pivot_local_round_trip(mapped, tmp_path, monkeypatch, file_name):
+    monkeypatch.chdir(tmp_path)
+    omop2survey.pivot_local(mapped, file_name=file_name)
+    written = omop2survey.read_table(str(tmp_path / 'workspace' / file_name)).set_index('person_id')
+    pd.testing.assert_frame_equal(written, omop2survey.pivot_wide(mapped), check_dtype=False)
+
+
+def test_file_format_overrides_extension(mapped, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    omop2survey.pivot_local(mapped, file_name='pivot_n.csv', file_format='parquet')
+    assert (tmp_path / 'workspace' / 'pivot_n.parquet').exists()
+    assert not (tmp_path / 'workspace' / 'pivot_n.csv').exists()
+
+
+@pytest.mark.parametrize('file_name', ['table.csv', 'table.parquet', 'table.feather'])
+def test_read_table_keeps_person_id(mapped, tmp_path, file_name):
+    pivot_df = omop2survey.pivot_wide(mapped)
+    file_path = write_table(pivot_df, str(tmp_path / file_name))
+    columns = list(pivot_df.columns[:2])
+    subset = omop2survey.read_table(file_path, columns=columns)
+    assert list(subset.columns) == ['person_id'] + columns
+    pd.testing.assert_frame_equal(subset.set_index('person_id'), pivot_df[columns], check_dtype=False)
+
+
+def test_unsupported_format(mapped, tmp_path):
+    with pytest.raises(ValueError):
+        write_table(mapped, str(tmp_path / 'table.xlsx'), file_format='xlsx')
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'parquet', 'feather'])
+def test_codebook_file_formats(mapped, tmp_path, monkeypatch, file_format):
+    monkeypatch.chdir(tmp_path)
+    omop2survey.codebook(mapped, file_format=file_format, show=False)
+    [file_path] = tmp_path.glob(f'codebook_*.{file_format}')
+    table = omop2survey.read_table(str(file_path))
+    assert list(table.columns) == ['question_concept_id', 'question', 'answer_concept_id', 'answer_numeric',
+                                   'answer', 'answer_text']
+    assert len(table) == len(mapped.drop_duplicates(['question_concept_id', 'question', 'answer_concept_id']))
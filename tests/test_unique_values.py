@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+from omop2survey.unique_values import map_unique, normalize_text, strip_text, unique_mask
+
+VALUES = [' Yes ', 'no', None, ' Yes ', np.nan, '12', 'NO ', pd.NA, 12]
+
+
+@pytest.mark.parametrize('dtype', [object, 'string'])
+def test_map_unique_matches_str_methods(dtype):
+    values = pd.Series([value for value in VALUES if not isinstance(value, int)], index=range(10, 18), name='answer',
+                       dtype=dtype)
+    pd.testing.assert_series_equal(map_unique(values, strip_text), values.str.strip())
+    pd.testing.assert_series_equal(map_unique(values, normalize_text), values.str.strip().str.lower())
+
+
+def test_map_unique_calls_function_once_per_value():
+    calls = []
+    values = pd.Series(VALUES * 100)
+    result = map_unique(values, lambda value: calls.append(value) or str(value))
+    assert len(calls) == len(set(pd.Series(VALUES).dropna()))
+    assert result.tolist() == [value if pd.isna(value) else str(value) for value in VALUES] * 100
+
+
+def test_unique_mask():
+    values = pd.Series(VALUES)
+    expected = [pd.notna(value) and str(value).isdigit() for value in VALUES]
+    np.testing.assert_array_equal(unique_mask(values, lambda value: str(value).isdigit()), expected)
+    assert unique_mask(pd.Series([], dtype=object), bool).dtype == bool
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+import omop2survey
+from omop2survey import upload
+from omop2survey.upload import GCSUploader, LocalUploader
+
+
+@pytest.fixture
+def mapped(survey):
+    return omop2survey.recode_missing(omop2survey.map_answers(survey))
+
+
+@pytest.mark.parametrize('file_name', ['pivot_n.csv', 'pivot_n.parquet'])
+def test_pivot_uploads_and_keeps_local_copy(mapped, tmp_path, monkeypatch, file_name):
+    monkeypatch.chdir(tmp_path)
+    omop2survey.pivot(mapped, file_name=file_name, uploader=LocalUploader(str(tmp_path / 'bucket')))
+
+    uploaded = tmp_path / 'bucket' / file_name
+    assert uploaded.read_bytes() == (tmp_path / file_name).read_bytes()
+    written = omop2survey.read_table(str(uploaded)).set_index('person_id')
+    pd.testing.assert_frame_equal(written, omop2survey.pivot_wide(mapped), check_dtype=False)
+
+
+def test_upload_file_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload.time, 'sleep', lambda seconds: None)
+    (tmp_path / 'data.csv').write_text('a\n1\n')
+    uploader = LocalUploader(str(tmp_path / 'bucket'))
+    copy_file, attempts = uploader.copy_file, []
+
+    def flaky(local_path, name):
+        attempts.append(name)
+        if len(attempts) < 3:
+            raise OSError("temporary failure")
+        copy_file(local_path, name)
+
+    uploader.copy_file = flaky
+    result = uploader.upload_file(str(tmp_path / 'data.csv'))
+    assert len(attempts) == 3
+    assert result['bytes'] == 4 and (tmp_path / 'bucket' / 'data.csv').read_text() == 'a\n1\n'
+
+    uploader.retries = 2
+    attempts.clear()
+    with pytest.raises(OSError):
+        uploader.upload_file(str(tmp_path / 'data.csv'))
+
+
+def test_upload_files(tmp_path):
+    paths = []
+    for i in range(5):
+        (tmp_path / f'part_{i}.csv').write_text(f'a\n{i}\n')
+        paths.append(str(tmp_path / f'part_{i}.csv'))
+    results = LocalUploader(str(tmp_path / 'bucket')).upload_files(paths)
+    assert [result['name'] for result in results] == [f'part_{i}.csv' for i in range(5)]
+    assert sorted(path.name for path in (tmp_path / 'bucket').iterdir()) == [f'part_{i}.csv' for i in range(5)]
+
+    with pytest.raises(FileNotFoundError):
+        LocalUploader(str(tmp_path / 'other')).upload_files(paths + [str(tmp_path / 'missing.csv')])
+    assert len(list((tmp_path / 'other').iterdir())) == 5
+
+
+def test_gcs_destination(monkeypatch):
+    assert GCSUploader('gs://bucket/data/').destination('x.csv') == 'gs://bucket/data/x.csv'
+    assert GCSUploader('gs://bucket').destination('x.csv') == 'gs://bucket/x.csv'
+    monkeypatch.setenv('WORKSPACE_BUCKET', 'gs://workspace')
+    assert GCSUploader().destination('x.csv') == 'gs://workspace/data/x.csv'
+
+    with pytest.raises(ValueError):
+        GCSUploader('/local/path')
+    monkeypatch.delenv('WORKSPACE_BUCKET')
+    with pytest.raises(ValueError):
+        GCSUploader()
@@ -32,6 +32,10 @@ print(sample_dummy_df.head(5))
 
 omop2.pivot_local(sample_df_copy)
 
+# Pivots can also be written as Parquet or Feather, which keeps column types and allows reading a subset of columns.
+# omop2.pivot_local(sample_df_copy, file_format='parquet')
+# omop2.read_table('workspace/pivot_n.parquet', columns=['q43528662', 'q43528663', 'q43528664'])
+
 # Convert data from long format to wide format using text values.
 # The pivot_text function can be used in the cloud environment.
 # Use pivot_text_local to save files locally.